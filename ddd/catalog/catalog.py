@@ -29,6 +29,18 @@ class PrefabCatalog():
     - (??) Inheritance: a catalog can extend or be based on another one
     """
 
+    _shared = None
+
+    @staticmethod
+    def shared():
+        """
+        Returns a catalog shared by all builds in this process, so prefabs are only generated or
+        loaded once (eg. when building several tiles in a batch).
+        """
+        if PrefabCatalog._shared is None:
+            PrefabCatalog._shared = PrefabCatalog()
+        return PrefabCatalog._shared
+
     def __init__(self):
         self._cache = {}
         self.path = settings.DDD_WORKDIR + "/_catalog"
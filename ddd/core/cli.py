@@ -35,8 +35,10 @@ class D1D2D3Bootstrap():
         "texture-pack": ("ddd.materials.commands.texturepack.TexturePackCommand", "Pack textures into texture atlases"),
         #"osm-build": ("ddd.osm.commands.build.OSMBuildCommand", "Build a scene or tile using the OSM Builder"),
         #"osm-datainfo": ("ddd.osm.commands.areainfo.OSMDataInfoCommand", "Dump information about generated tiles"),
+        "osm-batch": ("ddd.osm.commands.batch.OSMBatchBuildCommand", "Build a list or range of XYZ tiles with a pool of workers."),
         "geo-raster-collect": ("ddd.geo.commands.georastercollect.GeoRasterCollectCommand", "Collect georaster files and generate config."),
         "geo-raster-coverage": ("ddd.geo.commands.georastercoverage.GeoRasterCoverageCommand", "Generate a georaster coverage map."),
+        "geo-raster-memmap": ("ddd.geo.commands.georastermemmap.GeoRasterMemmapCommand", "Convert DEM tiles to memory-mapped format."),
         "geo-population": ("ddd.geo.commands.geopopulation.GeoPopulationCommand", "Query the population model."),
         "serve": ("ddd.server.commands.serve.ServerServeCommand", "Start the DDD Tool API for a pipeline."),
         "run": ("ddd.core.commands.run.RunCommand", "Runs a given pipeline or script (default)."),  # default
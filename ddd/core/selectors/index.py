@@ -0,0 +1,263 @@
+# ddd - DDD123
+# Library for simple scene modelling.
+# Jose Juan Montes and Contributors 2019-2021
+
+import logging
+
+from ddd.core.selectors.selector import ANY_VALUE, selector_items
+
+
+# Get instance of logger for this module
+logger = logging.getLogger(__name__)
+
+
+class DDDAttributeIndex(object):
+    """
+    Secondary index of node metadata for a node tree, mapping (key, value) pairs (from `extra` and
+    material) to the nodes that define them. It is used by `DDDObject.select()` on the root node to
+    resolve selectors with equality or key definition conditions without walking the whole tree.
+
+    The index is maintained incrementally by `set()`, `append()`, `remove()` and `replace()`.
+    Changes made by modifying `extra` or `children` directly are not tracked: nodes that are no longer
+    in the tree are discarded when selecting, but nodes added or modified that way will not be found.
+    Use `DDDObject.attr_index_create()` again to rebuild the index after such changes.
+
+    Indexes are not persisted (a pickled or copied index becomes None).
+    """
+
+    # Selections with more candidates than this ratio of indexed nodes use tree traversal instead
+    max_candidates_ratio = 0.1
+
+    def __init__(self, root):
+        self.root = root
+
+        self._nodes = {}  # id -> node
+        self._parents = {}  # id -> parent node
+        self._node_terms = {}  # id -> (keys, value terms, unhashable keys) of each node
+        self._keys = {}  # key -> set of ids
+        self._values = {}  # (key, value) -> set of ids
+        self._unhashable = {}  # key -> set of ids with unhashable values
+
+        self.add_tree(root, None)
+
+    def __repr__(self):
+        return "%s(root=%s, nodes=%d)" % (self.__class__.__name__, self.root, len(self._nodes))
+
+    def __reduce__(self):
+        # Indexes refer to nodes by id() and cannot be persisted
+        return (type(None), ())
+
+    def clear(self):
+        for node in self._nodes.values():
+            if node._attr_index is self:
+                node._attr_index = None
+        self._nodes = {}
+        self._parents = {}
+        self._node_terms = {}
+        self._keys = {}
+        self._values = {}
+        self._unhashable = {}
+
+    def add_tree(self, obj, parent):
+        """
+        Adds a node and its descendants to the index.
+        """
+        pending = [(obj, parent)]
+        while pending:
+            node, node_parent = pending.pop()
+            self._parents[id(node)] = node_parent
+            self._nodes[id(node)] = node
+            node._attr_index = self
+            self.update(node)
+            pending.extend((c, node) for c in node.children)
+
+    def remove_tree(self, obj):
+        """
+        Removes a node and its descendants from the index.
+        """
+        pending = [obj]
+        while pending:
+            node = pending.pop()
+            if self._nodes.get(id(node)) is not node:
+                continue
+            self._remove_terms(node)
+            del self._nodes[id(node)]
+            del self._parents[id(node)]
+            if node._attr_index is self:
+                node._attr_index = None
+            pending.extend(node.children)
+
+    def replace(self, obj, old_children):
+        """
+        Updates the index after a node has been replaced in place (see `DDDObject.replace()`).
+        """
+        parent = self._parents.get(id(obj))
+        for c in old_children:
+            self.remove_tree(c)
+        self.add_tree(obj, parent)
+
+    def update(self, obj):
+        """
+        Updates the index terms of a node (not its children), eg. after its metadata changes.
+        """
+        if self._nodes.get(id(obj)) is not obj:
+            return
+        self._remove_terms(obj)
+
+        keys = set(obj.extra.keys())
+        values = []
+        unhashable = []
+        for key, value in selector_items(obj).items():
+            keys.add(key)
+            try:
+                self._values.setdefault((key, value), set()).add(id(obj))
+                values.append((key, value))
+            except TypeError:
+                self._unhashable.setdefault(key, set()).add(id(obj))
+                unhashable.append(key)
+        for key in keys:
+            self._keys.setdefault(key, set()).add(id(obj))
+
+        self._node_terms[id(obj)] = (keys, values, unhashable)
+
+    def _remove_terms(self, obj):
+        terms = self._node_terms.pop(id(obj), None)
+        if terms is None:
+            return
+        keys, values, unhashable = terms
+        for key in keys:
+            self._discard(self._keys, key, id(obj))
+        for term in values:
+            self._discard(self._values, term, id(obj))
+        for key in unhashable:
+            self._discard(self._unhashable, key, id(obj))
+
+    def _discard(self, index, term, node_id):
+        ids = index.get(term)
+        if ids is not None:
+            ids.discard(node_id)
+            if not ids:
+                del index[term]
+
+    def candidates(self, terms):
+        """
+        Returns the set of ids of nodes that may match all the given (key, value) terms.
+        """
+        result = None
+        for key, value in terms:
+            if value is ANY_VALUE:
+                ids = self._keys.get(key, set())
+            else:
+                try:
+                    ids = self._values.get((key, value), set())
+                except TypeError:
+                    ids = self._keys.get(key, set())
+                ids = ids | self._unhashable.get(key, set())
+            result = set(ids) if result is None else (result & ids)
+            if not result:
+                break
+        return result
+
+    def select(self, selector, path=None, func=None, recurse=True, apply_func=None):
+        """
+        Resolves a `DDDObject.select()` call on the index root using the index.
+
+        Returns the list of selected nodes in tree order, or None if the selection is not resolved
+        through the index (the selector has no indexable terms or is not selective enough, or apply_func
+        is used with recurse=True, as applied nodes could add new descendants to be visited).
+        """
+
+        if selector is None or not selector.index_terms:
+            return None
+        if apply_func and recurse:
+            return None
+
+        path = path.replace("*", "") if path else None  # Temporary hack to allow * (see DDDObject.select)
+
+        candidates = self.candidates(selector.index_terms)
+        if len(candidates) > len(self._nodes) * self.max_candidates_ratio:
+            return None  # Not selective enough, a traversal is faster
+
+        positions = {}
+        matched = {}
+
+        def node_chain(node):
+            # Returns the list of (node, position) from the root, or None if the node is not in the tree
+            chain = []
+            while node is not self.root:
+                parent = self._parents.get(id(node))
+                if parent is None:
+                    return None
+                parent_positions = positions.get(id(parent))
+                if parent_positions is None:
+                    parent_positions = {id(c): idx for idx, c in enumerate(parent.children)}
+                    positions[id(parent)] = parent_positions
+                idx = parent_positions.get(id(node))
+                if idx is None:
+                    return None
+                chain.append((node, idx))
+                node = parent
+            chain.append((self.root, 0))
+            chain.reverse()
+            return chain
+
+        def node_matches(chain, depth):
+            node = chain[depth][0]
+            result = matched.get(id(node))
+            if result is None:
+                rec_path = "/" + "/".join(str(n.name) for n, _ in chain[1:depth + 1])
+                result = bool((not path or rec_path.startswith(path)) and
+                              (not func or func(node)) and
+                              selector.evaluate(node))
+                matched[id(node)] = result
+            return result
+
+        selected = []
+        for node_id in candidates:
+            node = self._nodes[node_id]
+            chain = node_chain(node)
+            if chain is None or not node_matches(chain, len(chain) - 1):
+                continue
+            if not recurse and any(node_matches(chain, depth) for depth in range(len(chain) - 1)):
+                continue
+            selected.append((tuple(idx for _, idx in chain), node, chain[-2][0] if len(chain) > 1 else None))
+
+        selected.sort(key=lambda s: s[0])
+
+        if apply_func:
+            if any(parent is None for _, _, parent in selected):
+                return None  # The root cannot be replaced in place
+            self._apply(selected, apply_func)
+
+        return [node for _, node, _ in selected]
+
+    def _apply(self, selected, apply_func):
+        """
+        Applies a function to selected nodes, replacing or removing them as `DDDObject.select()` does
+        (removed nodes are dropped and replacements appended to the parent children).
+        """
+        parents = {}
+        to_remove = {}
+        to_add = {}
+        for _, node, parent in selected:
+            result = apply_func(node)
+            if result is False or (result and result is not node):
+                parents[id(parent)] = parent
+                to_remove.setdefault(id(parent), set()).add(id(node))
+                if result:
+                    added = to_add.setdefault(id(parent), [])
+                    if isinstance(result, list):
+                        added.extend(result)
+                    else:
+                        added.append(result)
+                self.remove_tree(node)
+            else:
+                self.update(node)
+
+        for parent_id, parent in parents.items():
+            removed = to_remove[parent_id]
+            added = to_add.get(parent_id, [])
+            parent.children = [c for c in parent.children if id(c) not in removed]
+            parent.children.extend(added)
+            for c in added:
+                self.add_tree(c, parent)
@@ -60,9 +60,9 @@ class TreeToSelector(Transformer):
         return t[0]
 
     def notdatafilterexpr(self, t):
+        datafilter = t[0]
         def notdatafilterexpr_func(obj):
-            return not t[0]
-
+            return not datafilter(obj)
         return notdatafilterexpr_func
 
     def datafilterand(self, t):
@@ -71,6 +71,8 @@ class TreeToSelector(Transformer):
                 selected = df(obj)
                 if not selected: return False
             return True
+        # All conditions are required, so index terms of any of them can be used
+        datafilterand_func._index_terms = [term for df in t for term in getattr(df, '_index_terms', [])]
         return datafilterand_func
 
     def datafilteror(self, t):
@@ -93,40 +95,43 @@ class TreeToSelector(Transformer):
     def datafilter_attr_eq(self, t):
         datakey = t[0]
         datavalue = t[1]
+        getter = selector_key_getter(datakey)
         def datafilter_attr_eq_func(obj):
-            metadata = obj.metadata("", "")  #TODO: Pass path {'geom:type': obj.geom.type if obj.geom else None}
-            return (datakey in metadata and metadata[datakey] == datavalue)
+            return getter(obj) == datavalue
+        if datakey not in _NOT_INDEXED_KEYS:
+            datafilter_attr_eq_func._index_terms = [(datakey, datavalue)]
         return datafilter_attr_eq_func
 
     def datafilter_attr_neq(self, t):
         datakey = t[0]
         datavalue = t[1]
+        getter = selector_key_getter(datakey)
         def datafilter_attr_neq_func(obj):
-            metadata = obj.metadata("", "")  #TODO: Pass path {'geom:type': obj.geom.type if obj.geom else None}
-            #return (datakey in metadata and metadata[datakey] != datavalue)
-            return (datakey not in metadata or metadata[datakey] != datavalue)  # If data is not present, consider it not equal
+            value = getter(obj)
+            return (value is _MISSING or value != datavalue)  # If data is not present, consider it not equal
         return datafilter_attr_neq_func
 
     def datafilter_attr_def(self, t):
         datakey = t[0]
+        getter = selector_key_getter(datakey)
         def datafilter_attr_def_func(obj):
-            metadata = obj.metadata("", "")  #TODO: Pass path {'geom:type': obj.geom.type if obj.geom else None}
-            return (datakey in metadata) or (datakey in obj.extra)
+            return (getter(obj) is not _MISSING) or (datakey in obj.extra)
+        if datakey not in _NOT_INDEXED_KEYS:
+            datafilter_attr_def_func._index_terms = [(datakey, ANY_VALUE)]
         return datafilter_attr_def_func
 
     def datafilter_attr_undef(self, t):
         datakey = t[0]
+        getter = selector_key_getter(datakey)
         def datafilter_attr_undef_func(obj):
-            metadata = obj.metadata("", "")  #TODO: Pass path {'geom:type': obj.geom.type if obj.geom else None}
-            return (datakey not in metadata) and (datakey not in obj.extra)
+            return (getter(obj) is _MISSING) and (datakey not in obj.extra)
         return datafilter_attr_undef_func
 
     def datafilter_attr_def_re(self, t):
         datakey = t[0]
         regexp = re.compile(datakey)
         def datafilter_attr_def_re_func(obj):
-            metadata = obj.metadata("", "")  #TODO: Pass path {'geom:type': obj.geom.type if obj.geom else None}
-            for datakey in metadata:
+            for datakey in selector_keys(obj):
                 matches = bool(regexp.match(datakey))
                 if matches: return True
             return False
@@ -136,25 +141,131 @@ class TreeToSelector(Transformer):
         datakey = t[0]
         datavalue = t[1]
         regexp = re.compile(datavalue)
+        getter = selector_key_getter(datakey)
         def datafilter_attr_regexp_func(obj):
-            metadata = obj.metadata("", "")  #TODO: Pass path {'geom:type': obj.geom.type if obj.geom else None}
-            if datakey in metadata:
-                if metadata[datakey] is None: return False  # Regexp doesn't match a None value
-                return regexp.match(metadata[datakey])
-            return False
+            value = getter(obj)
+            if value is _MISSING or value is None: return False  # Regexp doesn't match a None value
+            return regexp.match(value)
         return datafilter_attr_regexp_func
 
+    def datafilter_attr_ext_in(self, t):
+        datakey = t[0]
+        datavalues = t[1]
+        getter = selector_key_getter(datakey)
+        def datafilter_attr_ext_in_func(obj):
+            value = getter(obj)
+            return value is not _MISSING and value in datavalues
+        return datafilter_attr_ext_in_func
+
     def datafilter(self, t):
-        def datafilter_func(obj):
-            #logger.info("Datafilter: %s", t)
-            return t[0](obj)
-        return datafilter_func
+        return t[0]
+
+
+# Keys from DDDObject.metadata() that are not visible to selectors
+_IGNORE_KEYS = ('uv', 'osm:feature')
+
+# Keys resolved from the object itself, which are not kept in attribute indexes (see DDDAttributeIndex)
+_NOT_INDEXED_KEYS = _IGNORE_KEYS + ('ddd:path', 'ddd:object', 'geom:type')
+
+# Marks a key which is not defined for an object
+_MISSING = object()
+
+# Index term value that matches any value of a defined key
+ANY_VALUE = object()
+
+
+def selector_key_getter(datakey):
+    """
+    Returns a function that resolves a single metadata key for an object, with the same
+    result as `obj.metadata("", "")[datakey]` (or `_MISSING` if not defined), but without
+    building the metadata dictionary.
+
+    Precedence follows DDDObject.metadata(): object extra, then computed properties
+    (ddd:path, geom:type, ddd:material...), then material extra.
+    """
+
+    if datakey in _IGNORE_KEYS:
+        return lambda obj: _MISSING
+
+    if datakey == 'ddd:object':
+        return lambda obj: obj
+
+    if datakey == 'ddd:path':
+        def own_value(obj):
+            return obj.uniquename()
+    elif datakey == 'geom:type':
+        def own_value(obj):
+            if hasattr(obj, 'geom'):
+                return obj.geom.type if obj.geom else None
+            return obj.extra.get(datakey, _MISSING)
+    elif datakey == 'ddd:material':
+        def own_value(obj):
+            if obj.mat and obj.mat.name:
+                return obj.mat.name
+            return obj.extra.get(datakey, _MISSING)
+    elif datakey == 'ddd:material:color':
+        def own_value(obj):
+            if obj.mat and obj.mat.color:
+                return obj.mat.color
+            return obj.extra.get(datakey, _MISSING)
+    else:
+        def own_value(obj):
+            return obj.extra.get(datakey, _MISSING)
+
+    def getter(obj):
+        mat = obj.mat
+        if mat is not None and mat.extra and datakey in mat.extra:
+            return mat.extra[datakey]
+        return own_value(obj)
+
+    return getter
+
+
+def selector_keys(obj):
+    """
+    Returns the metadata keys that selectors can see for an object (see `selector_key_getter`).
+    """
+    keys = set(obj.extra.keys())
+    keys.update(('ddd:path', 'ddd:object'))
+    if hasattr(obj, 'geom'):
+        keys.add('geom:type')
+    if obj.mat:
+        if obj.mat.name: keys.add('ddd:material')
+        if obj.mat.color: keys.add('ddd:material:color')
+        if obj.mat.extra: keys.update(obj.mat.extra.keys())
+    keys.difference_update(_IGNORE_KEYS)
+    return keys
+
+
+def selector_items(obj):
+    """
+    Returns a dictionary with the metadata values of an object that can be kept in attribute
+    indexes (the same values returned by `selector_key_getter`, except for `_NOT_INDEXED_KEYS`).
+    """
+    items = dict(obj.extra)
+    mat = obj.mat
+    if mat:
+        if mat.name: items['ddd:material'] = mat.name
+        if mat.color: items['ddd:material:color'] = mat.color
+        if mat.extra: items.update(mat.extra)
+    for key in _NOT_INDEXED_KEYS:
+        items.pop(key, None)
+    return items
+
 
 class DDDSelector(object):
+    """
+    A compiled selector expression (eg. '["osm:highway" = "primary"]["ddd:layer" = "0"]').
+
+    Use `DDDSelector.cached(selector)` to reuse selectors already parsed.
+    """
 
     _selector_parser = None
     _tree_to_selector = None
 
+    _cache = {}
+    _cache_max = 1024
+
     @staticmethod
     def init_parser():
         if DDDSelector._selector_parser is None:
@@ -168,19 +279,35 @@ class DDDSelector(object):
         DDDSelector.init_parser()
         self._tree = self._selector_parser.parse(selector)
         self._tree = self._tree_to_selector.transform(self._tree)
+        self._func = self._tree.children[0]
+
+        # List of (key, value) terms that every selected object must match (used by attribute indexes)
+        self.index_terms = getattr(self._func, '_index_terms', None) or None
+
+    @staticmethod
+    def cached(selector):
+        """
+        Returns a DDDSelector for the given selector string, parsing it only the first time it is used.
+        """
+        if isinstance(selector, DDDSelector):
+            return selector
+        result = DDDSelector._cache.get(selector, None)
+        if result is None:
+            if len(DDDSelector._cache) >= DDDSelector._cache_max:
+                DDDSelector._cache.clear()
+            result = DDDSelector(selector)
+            DDDSelector._cache[selector] = result
+        return result
 
     def __repr__(self):
         return "Selector(%r)" % self.selector
 
     def evaluate(self, obj):
 
-        tree = self._tree
-
-        #print(tree)
-        #print(tree.pretty())
-        #logger.info("Evaluate: %s", tree)
+        #print(self._tree.pretty())
+        #logger.info("Evaluate: %s", self._tree)
 
-        selected = tree.children[0](obj)
+        selected = self._func(obj)
 
         '''
         selected = False
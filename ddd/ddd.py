@@ -56,10 +56,13 @@ from ddd.ops import extrusion
 import numpy as np
 from trimesh.util import concatenate
 from shapely.ops import unary_union, polygonize
+from shapely.prepared import prep
 from geojson.feature import FeatureCollection
 from lark.visitors import Transformer
 from ddd.core.selectors.selector_ebnf import selector_ebnf
 from ddd.core.selectors.selector import DDDSelector
+from ddd.core.selectors.index import DDDAttributeIndex
+from ddd.formats.gltf import DDDGLTFFormat
 from ddd.formats.json import DDDJSONFormat
 from ddd.formats.svg import DDDSVG
 from trimesh.convex import convex_hull
@@ -306,38 +309,166 @@ class D1D2D3():
         return DDDObject2(name=name, geom=geom)
 
     @staticmethod
-    def grid3(bounds2, detail=1.0, name=None):
-        grid2 = D1D2D3.grid2(bounds2, detail, name=name)
+    def grid3(bounds2, detail=1.0, name=None, clip=None, elevation=None, uv=False):
+        """
+        Generates a regular grid mesh covering the given bounds, with cells of (approximately) the given
+        detail (a single size or [size_x, size_y]). Cell diagonals alternate in a checkerboard pattern.
+
+        Vertices and faces are generated as arrays for the whole grid at once.
+
+        If `clip` (a DDDObject2 or a Shapely geometry) is given, only the grid inside it is generated:
+        cells are selected with a raster mask of the clip shape, and cells crossed by its boundary are
+        intersected with it and triangulated, sharing vertices with their neighbours.
+
+        If `elevation` is given, it is called once with an N x 2 array of vertex coordinates and must return
+        N heights (eg. a batch raster sampler), which are used as the Z coordinate of vertices.
+
+        If `uv` is True, UV coordinates normalized to the bounds are stored in `extra['uv']`.
+        """
         cmin, cmax = bounds2[:2], bounds2[2:]
-        #grid2 = D1D2D3.rect(cmin, cmax)
-        vertices = []
-        faces = []
-        idi = 0
-        idj = 0
-        for geom in grid2.geom:
-            flip = ((idi % 2) + (idj % 2)) % 2
-            gvs, gfs = creation.triangulate_polygon(geom)
-            if flip:
-                gfs = np.array([[3, 0, 2], [1, 2, 0]])  # Alternate faces
-            gfs = [gf + len(vertices) for gf in gfs]
-            faces.extend(gfs)
-            vertices.extend(gvs)
-
-            hitmax = False
-            for v in gvs:
-                if v[0] >= cmax[0] or v[1] >= cmax[1]:
-                    hitmax = True
-
-            idi += 1
-            if hitmax:
-                idi = 0
-                idj += 1
-
-        vertices = [[v[0], v[1], 0.0] for v in vertices]
+        if isinstance(detail, int): detail = float(detail)
+        if isinstance(detail, float): detail = [detail, detail]
+        xs = np.linspace(cmin[0], cmax[0], 1 + int((cmax[0] - cmin[0]) / detail[0]))
+        ys = np.linspace(cmin[1], cmax[1], 1 + int((cmax[1] - cmin[1]) / detail[1]))
+        nx, ny = max(len(xs) - 1, 0), max(len(ys) - 1, 0)
+
+        # Vertex (ix, iy) has index iy * (nx + 1) + ix
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        vertices = np.column_stack([grid_x.ravel(), grid_y.ravel(), np.zeros(grid_x.size)])
+
+        cells = np.ones((nx, ny), dtype=bool)
+        clip_vertices, clip_faces = np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+        if clip is not None and nx and ny:
+            cells, clip_vertices, clip_faces = D1D2D3._grid3_clip(xs, ys, clip)
+
+        # Two triangles per cell, cells ordered by column, diagonals flipped in alternate cells
+        ix, iy = np.nonzero(cells)
+        v0 = iy * (nx + 1) + ix
+        v1 = v0 + 1
+        v3 = v0 + nx + 1
+        v2 = v3 + 1
+        flip = ((ix + iy) % 2 == 1)[:, None]
+        faces_a = np.where(flip, np.column_stack([v3, v0, v2]), np.column_stack([v3, v0, v1]))
+        faces_b = np.where(flip, np.column_stack([v1, v2, v0]), np.column_stack([v1, v2, v3]))
+        faces = np.stack([faces_a, faces_b], axis=1).reshape(-1, 3)
+
+        if len(clip_faces):
+            faces = np.concatenate([faces, clip_faces + len(vertices)])
+            vertices = np.concatenate([vertices, clip_vertices])
+
         mesh = Trimesh(vertices, faces)
-        #mesh.fix_normals()
         mesh.merge_vertices()
-        return DDDObject3(name=name, mesh=mesh)
+        if clip is not None:
+            mesh.remove_unreferenced_vertices()
+
+        if elevation is not None and len(mesh.vertices):
+            vertices = np.array(mesh.vertices)
+            vertices[:, 2] = elevation(vertices[:, :2])
+            mesh.vertices = vertices
+
+        result = DDDObject3(name=name, mesh=mesh)
+
+        if uv:
+            size = [max(cmax[0] - cmin[0], ddd.EPSILON), max(cmax[1] - cmin[1], ddd.EPSILON)]
+            result.extra['uv'] = (np.array(mesh.vertices)[:, :2] - cmin) / size
+
+        return result
+
+    @staticmethod
+    def _grid3_clip(xs, ys, clip):
+        """
+        Resolves the cells of a grid (given by its X and Y lines) covered by a clip shape.
+
+        Returns a tuple (cells, vertices, faces), where cells is a boolean matrix (nx x ny) of the
+        cells fully covered, and vertices and faces are the triangulation of the cells crossed by the
+        clip boundary, clipped to the shape.
+        """
+        nx, ny = len(xs) - 1, len(ys) - 1
+        clip_geom = clip.union().geom if isinstance(clip, DDDObject) else clip
+        if not clip_geom or clip_geom.is_empty:
+            return np.zeros((nx, ny), dtype=bool), np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+
+        # Cells whose center is inside the clip shape (raster row 0 is the top of the bounds)
+        cells = ddd.raster.mask(clip_geom, [xs[0], ys[0], xs[-1], ys[-1]], (ny, nx))[::-1].T
+
+        # Cells crossed by the boundary: boundaries are sampled at less than half a cell, and marked cells
+        # are dilated by one cell, so that every cell touched by the boundary is marked
+        cell_size = np.array([(xs[-1] - xs[0]) / nx, (ys[-1] - ys[0]) / ny])
+        step = cell_size.min() / 2
+        boundary = np.zeros((nx + 2, ny + 2), dtype=bool)
+        lines = clip_geom.boundary
+        for line in (lines.geoms if hasattr(lines, 'geoms') else [lines]):
+            coords = np.asarray(line.coords)[:, :2]
+            seg_d = coords[1:] - coords[:-1]
+            counts = np.ceil(np.linalg.norm(seg_d, axis=1) / step).astype(int) + 1
+            seg = np.repeat(np.arange(len(seg_d)), counts)
+            t = (np.arange(len(seg)) - np.repeat(np.cumsum(counts) - counts, counts)) / np.repeat(counts - 1, counts).clip(1)
+            points = coords[seg] + t[:, None] * seg_d[seg]
+            pcells = np.floor((points - [xs[0], ys[0]]) / cell_size).astype(int)
+            pcells = pcells.clip(-1, [nx, ny]) + 1
+            boundary[pcells[:, 0], pcells[:, 1]] = True
+        boundary_dilated = boundary.copy()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                boundary_dilated[1:-1, 1:-1] |= boundary[1 + dx:nx + 1 + dx, 1 + dy:ny + 1 + dy]
+        boundary = boundary_dilated[1:-1, 1:-1]
+        cells &= ~boundary
+
+        prepared = prep(clip_geom)
+        polygons = []
+        for ix, iy in np.argwhere(boundary):
+            box = geometry.box(xs[ix], ys[iy], xs[ix + 1], ys[iy + 1])
+            if prepared.contains(box):
+                cells[ix, iy] = True
+                continue
+            if not prepared.intersects(box):
+                continue
+            geom = box.intersection(clip_geom)
+            for part in (geom.geoms if hasattr(geom, 'geoms') else [geom]):
+                if part.type == 'Polygon' and part.area > ddd.EPSILON:
+                    polygons.append(part)
+
+        # Stitching: full cells with clipped vertices on their edges (where the clip boundary runs
+        # along or touches grid lines) are triangulated including those vertices, to avoid T-junctions
+        origin = np.array([xs[0], ys[0]])
+        tolerance = cell_size.min() * 1e-9
+        split = {}
+        for part in polygons:
+            for point in np.asarray(part.exterior.coords)[:-1, :2]:
+                line = np.rint((point - origin) / cell_size).astype(int)
+                on_line = np.abs(line * cell_size + origin - point) < tolerance
+                if on_line[0] == on_line[1]:
+                    continue
+                axis = 0 if on_line[0] else 1
+                cell = np.floor((point - origin) / cell_size).astype(int).clip(0, [nx - 1, ny - 1])
+                for k in (line[axis] - 1, line[axis]):
+                    cell[axis] = k
+                    if 0 <= k < (nx, ny)[axis] and cells[cell[0], cell[1]]:
+                        split.setdefault((cell[0], cell[1]), []).append(point)
+
+        for (ix, iy), points in split.items():
+            cells[ix, iy] = False
+            x0, y0, x1, y1 = xs[ix], ys[iy], xs[ix + 1], ys[iy + 1]
+            points = np.array(points)
+            edges = [sorted([(x, y) for x, y in points if abs(y - y0) < tolerance] + [(x0, y0)]),
+                     sorted([(x, y) for x, y in points if abs(x - x1) < tolerance] + [(x1, y0)], key=lambda p: p[1]),
+                     sorted([(x, y) for x, y in points if abs(y - y1) < tolerance] + [(x1, y1)], reverse=True),
+                     sorted([(x, y) for x, y in points if abs(x - x0) < tolerance] + [(x0, y1)], key=lambda p: -p[1])]
+            polygons.append(Polygon([p for edge in edges for p in edge]))
+
+        vertices = []
+        faces = []
+        offset = 0
+        for polygon in polygons:
+            gvs, gfs = creation.triangulate_polygon(orient(polygon, 1))
+            if len(gfs) == 0: continue
+            vertices.append(np.column_stack([gvs, np.zeros(len(gvs))]))
+            faces.append(gfs + offset)
+            offset += len(gvs)
+
+        if not vertices:
+            return cells, np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+        return cells, np.concatenate(vertices), np.concatenate(faces)
 
     @staticmethod
     def group2(children=None, name=None, empty=None, extra=None):
@@ -372,7 +503,7 @@ class D1D2D3():
             #return None
         elif isinstance(children[0], DDDObject2):
             result = DDDObject2(children=children, name=name)
-        elif isinstance(children[0], DDDObject3) or isinstance(children[0], DDDInstance):
+        elif isinstance(children[0], (DDDObject3, DDDInstance, DDDPointSet)):
             result = DDDObject3(children=children, name=name)
         else:
             raise ValueError("Invalid object for ddd.group(): %s" % children[0])
@@ -390,10 +521,24 @@ class D1D2D3():
         obj = DDDInstance(obj, name)
         return obj
 
+    @staticmethod
+    def pointset(positions=None, angles=None, rotations=None, scales=None, type_ids=None, types=None, attributes=None, name=None, extra=None):
+        """
+        Creates a point set (see DDDPointSet). Point rotations can be given as quaternions (`rotations`)
+        or as angles around the Z axis (`angles`).
+        """
+        if angles is not None:
+            angles = np.asarray(angles, dtype=np.float64)
+            rotations = np.column_stack([np.cos(angles / 2), np.zeros(len(angles)), np.zeros(len(angles)), np.sin(angles / 2)])
+        return DDDPointSet(positions=positions, rotations=rotations, scales=scales, type_ids=type_ids, types=types,
+                           attributes=attributes, name=name, extra=extra)
+
     @staticmethod
     def json_serialize(obj):
         if hasattr(obj, 'export'):
             data = obj.export()
+        elif isinstance(obj, np.ndarray):
+            data = obj.tolist()
         elif isinstance(obj, Image.Image):
             data = "Image (%s %dx%d)" % (obj.mode, obj.size[0], obj.size[1], )
         else:
@@ -666,6 +811,9 @@ class DDDMaterial():
 
 class DDDObject():
 
+    # Attribute index this node belongs to, if any (see attr_index_create())
+    _attr_index = None
+
     def __init__(self, name=None, children=None, extra=None, material=None):
         self.name = name
         self.children = children if children is not None else []
@@ -678,7 +826,7 @@ class DDDObject():
         #self.mesh = None
 
         for c in self.children:
-            if not isinstance(c, self.__class__) and not (isinstance(c, DDDInstance) and isinstance(self, DDDObject3)):
+            if not isinstance(c, (self.__class__, DDDPointSet)) and not (isinstance(c, DDDInstance) and isinstance(self, DDDObject3)):
                 raise DDDException("Invalid children type on %s (not %s): %s" % (self, self.__class__, c), ddd_obj=self)
 
     def __repr__(self):
@@ -740,12 +888,35 @@ class DDDObject():
         instances in lists.
         """
         # TODO: Study if the system shall modify instances and let user handle cloning, this method would be unnecessary
+        old_children = self.children
         self.name = obj.name
         self.extra = obj.extra
         self.mat = obj.mat
         self.children = obj.children
+        if self._attr_index is not None:
+            self._attr_index.replace(self, old_children)
         return self
 
+    def attr_index_create(self):
+        """
+        Creates an attribute index for this node and its descendants, which is then used by `select()`
+        when called on this node to resolve selectors with equality (`["key" = "value"]`) or
+        key definition (`["key"]`) conditions without traversing the tree.
+
+        The index is updated by `set()`, `append()`, `remove()` and `replace()`. Changes made directly
+        to `extra` or `children` are not seen by the index (see DDDAttributeIndex), so selections would
+        silently miss those nodes. This is why pipelines don't use it: tasks commonly write `extra`
+        directly. Only create an index from code that modifies the tree through the methods above,
+        and clear it (`attr_index_clear()`) before handing the tree to other code.
+        """
+        self.attr_index_clear()
+        DDDAttributeIndex(self)
+        return self._attr_index
+
+    def attr_index_clear(self):
+        if self._attr_index is not None and self._attr_index.root is self:
+            self._attr_index.clear()
+
     def metadata(self, path_prefix, name_suffix):
 
         node_name = self.uniquename() + name_suffix
@@ -820,19 +991,19 @@ class DDDObject():
         TODO: Make recurse default to False (this will require extensive testing)
         """
 
-        if hasattr(self, '_remove_object'): delattr(self, '_remove_object')
-        if hasattr(self, '_add_object'): delattr(self, '_add_object')
-
         if selector and not isinstance(selector, DDDSelector):
-            selector = DDDSelector(selector)
+            selector = DDDSelector.cached(selector)
+
+        if _rec_path is None and self._attr_index is not None and self._attr_index.root is self:
+            result = self._attr_index.select(selector, path=path, func=func, recurse=recurse, apply_func=apply_func)
+            if result is not None:
+                return self.grouptyped(result)
 
         #if _rec_path is None:
         #    logger.debug("Select: func=%s selector=%s path=%s recurse=%s _rec_path=%s", func, selector, path, recurse, _rec_path)
 
         # TODO: Recurse should be false by default
 
-        result = []
-
         if _rec_path is None:
             _rec_path = "/"
         elif _rec_path == "/":
@@ -840,21 +1011,34 @@ class DDDObject():
         else:
             _rec_path = _rec_path + "/" + str(self.name)
 
-        selected = True
-
         if path:
             # TODO: Implement path pattern matching (hint: gitpattern lib)
             path = path.replace("*", "")  # Temporary hack to allow *
-            pathmatches = _rec_path.startswith(path)
-            selected = selected and pathmatches
 
-        if func:
-            selected = selected and func(self)
-        if selector:
-            selected = selected and selector.evaluate(self)
+        result = []
+        self._select_apply(result, selector, path, func, recurse, apply_func, _rec_path)
+
+        return self.grouptyped(result)
+
+    def _select_apply(self, result, selector, path, func, recurse, apply_func, rec_path):
+        """
+        Selects (and applies apply_func to) this node and its descendants in a single pass,
+        appending selected nodes to the result list.
+
+        Returns this node if it is kept, False if it has to be removed, or the object (or list of
+        objects) that replaces it, which the caller applies to its children list.
+        """
+
+        selected = True
+
+        if path:
+            selected = rec_path.startswith(path)
+        if selected and func:
+            selected = func(self)
+        if selected and selector:
+            selected = selector.evaluate(self)
 
-        remove_object = False
-        add_object = False
+        replacement = self
 
         o = self
         if selected:
@@ -862,40 +1046,35 @@ class DDDObject():
             if apply_func:
                 o = apply_func(self)
                 if o is False or (o and o is not self):  # new object or delete
-                    add_object = o
-                    remove_object = True
+                    replacement = o
+                elif self._attr_index is not None:
+                    self._attr_index.update(self)
             if o is None:
                 o = self
 
         # If a list was returned, children are not evaluated
         if o and (not isinstance(o, list)) and (not selected or recurse):
-            to_remove = []
+            to_remove = {}
             to_add = []
             for c in list(o.children):
-                cr = c.select(func=func, selector=selector, path=path, recurse=recurse, apply_func=apply_func, _rec_path=_rec_path)
-                if hasattr(cr, '_remove_object') and cr._remove_object:
-                    to_remove.append(c)
-                if hasattr(cr, '_add_object') and cr._add_object:
-                    if isinstance(cr._add_object, list):
-                        to_add.extend(cr._add_object)
-                    else:
-                        to_add.append(cr._add_object)
-                        #to_add.extend(cr.children)
-                delattr(cr, '_remove_object')
-                delattr(cr, '_add_object')
-                result.extend(cr.children)
-            o.children = [coc for coc in o.children if coc not in to_remove]
-            o.children.extend(to_add)
-
-        #if (isinstance(o, list)):
-        #    o.children.extend()
-
-        #self.children = [c for c in self.children if c not in result]
-
-        res = self.grouptyped(result)
-        res._remove_object = remove_object
-        res._add_object = add_object
-        return res
+                child_path = rec_path + str(c.name) if rec_path == "/" else rec_path + "/" + str(c.name)
+                cr = c._select_apply(result, selector, path, func, recurse, apply_func, child_path)
+                if cr is not c:
+                    to_remove[id(c)] = c
+                    if isinstance(cr, list):
+                        to_add.extend(cr)
+                    elif cr:
+                        to_add.append(cr)
+            if to_remove:
+                o.children = [coc for coc in o.children if id(coc) not in to_remove]
+                o.children.extend(to_add)
+                if o._attr_index is not None:
+                    for c in to_remove.values():
+                        o._attr_index.remove_tree(c)
+                    for c in to_add:
+                        o._attr_index.add_tree(c, o)
+
+        return replacement
 
     def filter(self, func):
         """
@@ -991,6 +1170,8 @@ class DDDObject():
             else:
                 if key not in self.extra or self.extra[key] is None:
                     self.extra[key] = default
+            if self._attr_index is not None:
+                self._attr_index.update(self)
         return self
 
     def prop_set(self, key, *args, **kwargs):
@@ -1046,8 +1227,12 @@ class DDDObject():
         if isinstance(obj, Iterable):
             for i in obj:
                 self.children.append(i)
+                if self._attr_index is not None:
+                    self._attr_index.add_tree(i, self)
         elif isinstance(obj, DDDObject):
             self.children.append(obj)
+            if self._attr_index is not None:
+                self._attr_index.add_tree(obj, self)
         else:
             raise DDDException("Cannot append object to DDDObject children (wrong type): %s" % obj)
         return self
@@ -1056,6 +1241,10 @@ class DDDObject():
         """
         Removes an object from this node children recursively. Modifies objects in-place.
         """
+        if self._attr_index is not None:
+            for c in self.children:
+                if c == obj:
+                    self._attr_index.remove_tree(c)
         self.children = [c.remove(obj) for c in self.children if c and c != obj]
         return self
 
@@ -1078,24 +1267,99 @@ class DDDObject():
             raise
 
 
+def _affine_coords_func(matrix, force_z):
+    """
+    Returns a function that applies an affine transform (4x4 matrix) to coordinate sequences,
+    for use with `shapely.ops.transform`. 2D coordinates are returned as 2D unless `force_z` is set.
+    """
+    def affine_func(x, y, z=None):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        z_in = np.asarray(z, dtype=np.float64) if z is not None else 0.0
+        rx = matrix[0, 0] * x + matrix[0, 1] * y + matrix[0, 2] * z_in + matrix[0, 3]
+        ry = matrix[1, 0] * x + matrix[1, 1] * y + matrix[1, 2] * z_in + matrix[1, 3]
+        if z is None and not force_z:
+            return (rx, ry)
+        rz = matrix[2, 0] * x + matrix[2, 1] * y + matrix[2, 2] * z_in + matrix[2, 3]
+        return (rx, ry, rz)
+    return affine_func
+
+
 class DDDObject2(DDDObject):
 
+    # Pending affine transform (4x4 matrix) for the geometry, applied when the geometry is accessed
+    _geom_transform = None
+    _geom_transform_z = False
+
     def __init__(self, name=None, children=None, geom=None, extra=None, material=None):
         super().__init__(name, children, extra, material)
         self.geom = geom
         self._strtree = None
 
+    def __setstate__(self, state):
+        # Objects pickled before geometry transforms were deferred store the geometry as 'geom'
+        if 'geom' in state:
+            state['_geom'] = state.pop('geom')
+        self.__dict__.update(state)
+
+    @property
+    def geom(self):
+        """
+        Shapely geometry of this object. Transforms (translate, rotate, scale) are accumulated
+        and applied to the geometry the first time it is accessed.
+        """
+        if self._geom_transform is not None:
+            self._geom = ops.transform(_affine_coords_func(self._geom_transform, self._geom_transform_z), self._geom)
+            self._geom_transform = None
+            self._geom_transform_z = False
+        return self._geom
+
+    @geom.setter
+    def geom(self, geom):
+        self._geom = geom
+        self._geom_transform = None
+        self._geom_transform_z = False
+
+    def _transformed(self, matrix, force_z=False):
+        """
+        Returns a copy of this object (with children not copied) with an affine transform (4x4 matrix)
+        applied to its geometry. The transform is accumulated and deferred until the geometry is accessed.
+
+        If `force_z` is True, 2D geometries become 3D when the transform is applied (as with `translate`).
+        """
+        result = DDDObject2(name=self.name, children=list(self.children), extra=dict(self.extra), material=self.mat)
+        result._geom = self._geom
+        if self._geom:
+            result._geom_transform = matrix if self._geom_transform is None else np.dot(matrix, self._geom_transform)
+            result._geom_transform_z = force_z or self._geom_transform_z
+        return result
+
+    def _transform_replace(self, matrix, force_z=False):
+        """
+        Applies (deferred) an affine transform (4x4 matrix) to the geometry of this object, in place.
+        """
+        if self._geom:
+            self._geom_transform = matrix if self._geom_transform is None else np.dot(matrix, self._geom_transform)
+            self._geom_transform_z = force_z or self._geom_transform_z
+
     def __repr__(self):
         return "%s(%s, name=%s, geom=%s (%s verts), children=%d)" % (self.__class__.__name__, id(self), self.name, self.geom.type if hasattr(self, 'geom') and self.geom else None, self.vertex_count() if hasattr(self, 'geom') else None, len(self.children) if self.children else 0)
 
     def copy(self, name=None, copy_children=True):
         """
-        Copies children, geometry (deep copying the object) and metadata (shallow copy) recursively.
+        Copies children, geometry and metadata (shallow copy) recursively.
+
+        Shapely geometries are shared by the copies (including pending transforms), so they
+        must not be modified in place (eg. by assigning `coords`), as that would change all
+        copies. Assign a new geometry to `geom` to modify an object.
         """
         children = []
         if copy_children:
             children = [c.copy() for c in self.children]
-        obj = DDDObject2(name=name if name else self.name, children=children, geom=copy.deepcopy(self.geom) if self.geom else None, extra=dict(self.extra), material=self.mat)
+        obj = DDDObject2(name=name if name else self.name, children=children, extra=dict(self.extra), material=self.mat)
+        obj._geom = self._geom
+        obj._geom_transform = self._geom_transform
+        obj._geom_transform_z = self._geom_transform_z
         return obj
 
     def copy3(self, name=None, mesh=None, copy_children=False):
@@ -1125,13 +1389,23 @@ class DDDObject2(DDDObject):
         self._strtree = None
 
     def material(self, material, include_children=True):
-        obj = self.copy()
+        obj = self.copy(copy_children=not include_children)
         obj.mat = material
         #mesh.visuals = visuals
         if include_children:
-            obj.children = [c.material(material) for c in obj.children]
+            obj.children = [c.material(material) for c in self.children]
         return obj
 
+    def material_replace(self, material, include_children=True):
+        """
+        Sets the material of this object (and its children if `include_children` is True), in place.
+        """
+        self.mat = material
+        if include_children:
+            for c in self.children:
+                c.material_replace(material)
+        return self
+
     def end(self):
         coords = self.geom.coords[-1]
         return D1D2D3.point(coords)
@@ -1185,53 +1459,142 @@ class DDDObject2(DDDObject):
         return result
 
     def translate(self, coords):
+        # Translated geometries become 3D (z is set to the translation z)
+        result = self._transformed(self._translation_matrix(coords), force_z=True)
+        result.children = [c.translate(coords) for c in self.children]
+        return result
+
+    def translate_replace(self, coords):
+        """
+        Translates this object and its children, in place.
+        """
+        self._transform_replace(self._translation_matrix(coords), force_z=True)
+        for c in self.children:
+            c.translate_replace(coords)
+        return self
+
+    def rotate(self, angle, origin=None):  # center (bb center), centroid, point
+        """
+        Angle is in radians.
+        """
+        if origin is None: origin = (0, 0)
+
+        matrix = self._rotation_matrix(angle, origin)
+        if matrix is not None:
+            result = self._transformed(matrix)
+        else:
+            # Origins that depend on the geometry ('center', 'centroid') are resolved per object
+            result = self.copy(copy_children=False)
+            if self.geom:
+                result.geom = affinity.rotate(self.geom, angle, origin=origin, use_radians=True)
+        result.children = [c.rotate(angle, origin) for c in self.children]
+        return result
+
+    def rotate_replace(self, angle, origin=None):
+        """
+        Rotates this object and its children, in place. Angle is in radians.
+        """
+        if origin is None: origin = (0, 0)
 
+        matrix = self._rotation_matrix(angle, origin)
+        if matrix is not None:
+            self._transform_replace(matrix)
+        elif self.geom:
+            self.geom = affinity.rotate(self.geom, angle, origin=origin, use_radians=True)
+        for c in self.children:
+            c.rotate_replace(angle, origin)
+        return self
+
+    def scale(self, coords, origin=None): # None=(0,0), centroid
+        coords = self._scale_coords(coords)
+        if origin is None: origin = (0, 0)
+
+        matrix = self._scale_matrix(coords, origin)
+        if matrix is not None:
+            result = self._transformed(matrix)
+        else:
+            # Origins that depend on the geometry ('center', 'centroid') are resolved per object
+            result = self.copy(copy_children=False)
+            if self.geom:
+                result.geom = affinity.scale(self.geom, coords[0], coords[1], coords[2] if len(coords) > 2 else 0.0, origin)
+        result.children = [c.scale(coords, origin) for c in self.children]
+        return result
+
+    def scale_replace(self, coords, origin=None):
+        """
+        Scales this object and its children, in place.
+        """
+        coords = self._scale_coords(coords)
+        if origin is None: origin = (0, 0)
+
+        matrix = self._scale_matrix(coords, origin)
+        if matrix is not None:
+            self._transform_replace(matrix)
+        elif self.geom:
+            self.geom = affinity.scale(self.geom, coords[0], coords[1], coords[2] if len(coords) > 2 else 0.0, origin)
+        for c in self.children:
+            c.scale_replace(coords, origin)
+        return self
+
+    def _translation_matrix(self, coords):
         if hasattr(coords, 'geom'):
             coords = coords.geom.coords[0]
 
         if len(coords) == 2: coords = [coords[0], coords[1], 0.0]
-        result = self.copy()
 
         #if math.isnan(coords[0]) or math.isnan(coords[1]):
         #    logger.warn("Invalid translate coords (%s) for object: %s", coords, self)
-        #    return result
-        '''
-        def _trfun(x, y, z=0.0):
-            print(coords)
-            print(x, y, z)
-            return (x + coords[0], y + coords[1], z + coords[2])
-        '''
 
-        if self.geom:
-            #trans_func = _trfun
-            trans_func = lambda x, y, z=0.0: (x + coords[0], y + coords[1], z + coords[2])
-            result.geom = ops.transform(trans_func, self.geom)
-
-        result.children = [c.translate(coords) for c in self.children]
-        return result
+        return transformations.translation_matrix(coords[:3])
 
-    def rotate(self, angle, origin=None):  # center (bb center), centroid, point
+    def _rotation_matrix(self, angle, origin):
         """
-        Angle is in radians.
+        Returns the matrix for a rotation around the given origin, or None if the origin
+        depends on the geometry (see `_transform_origin`).
         """
-        if origin is None: origin = (0, 0)
-        result = self.copy()
-        if self.geom:
-            result.geom = affinity.rotate(self.geom, angle, origin=origin, use_radians=True)
-        result.children = [c.rotate(angle, origin) for c in self.children]
-        return result
+        origin_coords = self._transform_origin(origin)
+        if origin_coords is None:
+            return None
 
-    def scale(self, coords, origin=None): # None=(0,0), centroid
+        cos_a, sin_a = math.cos(angle), math.sin(angle)
+        x0, y0 = origin_coords[0], origin_coords[1]
+        return np.array([[cos_a, -sin_a, 0.0, x0 - x0 * cos_a + y0 * sin_a],
+                         [sin_a, cos_a, 0.0, y0 - x0 * sin_a - y0 * cos_a],
+                         [0.0, 0.0, 1.0, 0.0],
+                         [0.0, 0.0, 0.0, 1.0]])
+
+    def _scale_coords(self, coords):
         if isinstance(coords, int): coords = float(coords)
         if isinstance(coords, float): coords = [coords, coords, 1.0]
         if len(coords) == 2: coords = [coords[0], coords[1], 1.0]
+        return coords
 
-        if origin is None: origin = (0, 0)
-        result = self.copy()
-        if self.geom:
-            result.geom = affinity.scale(self.geom, coords[0], coords[1], coords[2] if len(coords) > 2 else 0.0, origin)
-        result.children = [c.scale(coords, origin) for c in self.children]
-        return result
+    def _scale_matrix(self, coords, origin):
+        """
+        Returns the matrix for scaling around the given origin, or None if the origin
+        depends on the geometry (see `_transform_origin`).
+        """
+        origin_coords = self._transform_origin(origin)
+        if origin_coords is None:
+            return None
+
+        x0, y0, z0 = origin_coords
+        zfact = coords[2] if len(coords) > 2 else 0.0
+        return np.array([[coords[0], 0.0, 0.0, x0 - x0 * coords[0]],
+                         [0.0, coords[1], 0.0, y0 - y0 * coords[1]],
+                         [0.0, 0.0, zfact, z0 - z0 * zfact],
+                         [0.0, 0.0, 0.0, 1.0]])
+
+    def _transform_origin(self, origin):
+        """
+        Returns the (x, y, z) coordinates of a transform origin given as coordinates or a Shapely point,
+        or None if the origin depends on the geometry (eg. 'center', 'centroid').
+        """
+        if isinstance(origin, str):
+            return None
+        if isinstance(origin, geometry.Point):
+            origin = origin.coords[0]
+        return (origin[0], origin[1], origin[2] if len(origin) > 2 else 0.0)
 
     def bounds(self):
         xmin, ymin, xmax, ymax = (float("inf"), float("inf"), float("-inf"), float("-inf"))
@@ -1253,7 +1616,7 @@ class DDDObject2(DDDObject):
         return result
 
     def clean(self, eps=None, remove_empty=True, validate=True, fix_invalid=True):
-        result = self.copy()
+        result = self.copy(copy_children=False)
         if result.geom and eps is not None:
             #result = result.buffer(eps, 1, join_style=ddd.JOIN_MITRE).buffer(-eps, 1, join_style=ddd.JOIN_MITRE)
             if eps != 0:
@@ -1298,7 +1661,7 @@ class DDDObject2(DDDObject):
         result.children = [c.clean(eps=eps, remove_empty=remove_empty, validate=validate, fix_invalid=fix_invalid) for c in self.children]
 
         if remove_empty:
-            result.children = [c for c in result.children if (c.children or c.geom)]
+            result.children = [c for c in result.children if (c.children or isinstance(c, DDDPointSet) or c.geom)]
 
         if validate:
             try:
@@ -1337,7 +1700,7 @@ class DDDObject2(DDDObject):
         result.children = [c.clean_replace(eps=eps, remove_empty=remove_empty, validate=validate) for c in self.children]
 
         if remove_empty:
-            result.children = [c for c in result.children if (c.children or c.geom)]
+            result.children = [c for c in result.children if (c.children or isinstance(c, DDDPointSet) or c.geom)]
 
         if validate:
             try:
@@ -1365,7 +1728,7 @@ class DDDObject2(DDDObject):
             mitre    2
             bevel    3
         '''
-        result = self.copy()
+        result = self.copy(copy_children=False)
         if self.geom:
             result.geom = self.geom.buffer(distance, resolution=resolution,
                                            cap_style=cap_style, join_style=join_style, mitre_limit=mitre_limit)
@@ -1381,7 +1744,7 @@ class DDDObject2(DDDObject):
         Returns a copy of the object.
         """
 
-        result = self.copy()
+        result = self.copy(copy_children=False)
 
         # Attempt to optimize (test)
         #if not result.intersects(other):
@@ -1414,10 +1777,26 @@ class DDDObject2(DDDObject):
             if other.geom and not other.geom.is_empty:
                 result.geom = result.geom.difference(other.geom)
 
-        result.children = [c.subtract(other) for c in result.children]
+        result.children = [c.subtract(other) for c in self.children]
 
         return result
 
+    def subtract_replace(self, other):
+        """
+        Subtracts `other` object from this and its children, in place (see `subtract`).
+        """
+        if other.children:
+            other = other.union()
+
+        if self.geom:
+            if other.geom and not other.geom.is_empty:
+                self.geom = self.geom.difference(other.geom)
+
+        for c in self.children:
+            c.subtract_replace(other)
+
+        return self
+
     def recurse_geom(self):
 
         geoms = []
@@ -1462,12 +1841,11 @@ class DDDObject2(DDDObject):
         return ncoords
 
     def vertex_func(self, func):
-        obj = self.copy()
+        obj = self.copy(copy_children=False)
         if obj.geom:
             if obj.geom.type == 'MultiPolygon':
                 logger.warn("Unknown geometry for 2D vertex func")
-                for g in obj.geom.geoms:
-                    g.exterior.coords = self._vertex_func_coords(func, g.exterior.coords)
+                obj.geom = MultiPolygon([Polygon(self._vertex_func_coords(func, g.exterior.coords), g.interiors) for g in obj.geom.geoms])
             elif obj.geom.type == 'Polygon':
                 obj.geom = ddd.polygon(self._vertex_func_coords(func, obj.geom.exterior.coords)).geom
             elif obj.geom.type == 'LineString':
@@ -1508,14 +1886,13 @@ class DDDObject2(DDDObject):
 
         This method returns a copy of the object, and applies the same operation to children.
         """
-        result = self.copy()
+        result = self.copy(copy_children=False)
         if self.geom:
             if result.geom.type == "MultiPolygon":
-                for g in result.geom.geoms:
-                    g.coords = [(c[0], c[1]) for c in g.coords]
+                result.geom = MultiPolygon([Polygon([(c[0], c[1]) for c in g.exterior.coords],
+                                                    [[(c[0], c[1]) for c in i.coords] for i in g.interiors]) for g in result.geom.geoms])
             elif result.geom.type == "MultiLineString":
-                for g in result.geom.geoms:
-                    g.coords = [(c[0], c[1]) for c in g.coords]
+                result.geom = geometry.MultiLineString([[(c[0], c[1]) for c in g.coords] for g in result.geom.geoms])
             elif result.geom.type == "Polygon":
                 #result.geom.exterior.coords = [(x, y) for (x, y, _) in result.geom.exterior.coords]
                 #for g in result.geom.interiors:
@@ -1527,23 +1904,50 @@ class DDDObject2(DDDObject):
                 result.geom = Polygon(nnext, nnints)
 
             else:
-                result.geom.coords = [(c[0], c[1]) for c in result.geom.coords]
-        result.children = [c.remove_z() for c in result.children]
+                result.geom = type(result.geom)([(c[0], c[1]) for c in result.geom.coords])
+        result.children = [c.remove_z() for c in self.children]
         return result
 
-    def union(self, other=None):
-        result = self.copy()
-        return result.union_replace(other)
+    def union(self, other=None, mode='pairwise', precision=None):
+        if mode == 'unary':
+            # The unary union only reads children geometries, so they don't need to be copied
+            result = self.copy(copy_children=False)
+            result.children = list(self.children)
+        else:
+            result = self.copy()
+        return result.union_replace(other, mode=mode, precision=precision)
 
-    def union_replace(self, other=None):
+    def union_replace(self, other=None, mode='pairwise', precision=None):
         """
         Returns a copy of this object to which geometry from other object has been unioned.
         If the second object has children, they are also unioned recursively.
 
         If the second object is None, all children of this are unioned.
+
+        Mode 'pairwise' (default) unions children in pairs. Mode 'unary' unions all geometries
+        (of this object, the other object and their descendants) at once with a spatially partitioned
+        unary union (see DDDGeometry.union_geoms()), which is much faster for many geometries
+        and isolates topology errors. In unary mode, `precision` optionally snaps coordinates
+        to a grid of that size before the union.
         """
 
         result = self
+
+        if mode == 'unary':
+            geoms = []
+            pending = [result] + ([other] if other else [])
+            while pending:
+                obj = pending.pop()
+                if isinstance(obj, DDDPointSet):
+                    continue
+                if obj.geom and not obj.geom.is_empty:
+                    geoms.append(obj.geom)
+                pending.extend(obj.children)
+            result.children = []
+            result.geom = ddd.geomops.union_geoms(geoms, precision=precision) if geoms else None
+            return result
+        elif mode != 'pairwise':
+            raise DDDException("Invalid union mode: %s" % mode, ddd_obj=self)
         #result = result.flatten().clean()
 
         #
@@ -1564,7 +1968,7 @@ class DDDObject2(DDDObject):
         return result
         '''
 
-        objs = result.children
+        objs = [c for c in result.children if not isinstance(c, DDDPointSet)]  # Point sets have no geometry
         result.children = []
         while len(objs) > 1:
             newo = objs[0].union_replace().union_replace(objs[1].union_replace())
@@ -1606,7 +2010,7 @@ class DDDObject2(DDDObject):
         if this object contains children, each intersection will be calculated
         separately.
         """
-        result = self.copy()
+        result = self.copy(copy_children=False)
         other = other.union()
 
         if result.geom and other.geom:
@@ -1750,7 +2154,7 @@ class DDDObject2(DDDObject):
         if it was already a simple geometry. This is useful if we want to iterate individual
         geometries regardless of the original geometry type.
         """
-        result = self.copy()
+        result = self.copy(copy_children=False)
 
         newchildren = []
 
@@ -1840,7 +2244,8 @@ class DDDObject2(DDDObject):
                     result = DDDObject3(name="Could not triangulate (error during triangulation)")
 
                 # Map UV coordinates if they were set on the polygon
-                if self.get('uv', None):
+                uvs = self.get('uv', None)
+                if uvs is not None and len(uvs) > 0:
                     from ddd.ops import uvmapping
                     result = uvmapping.map_3d_from_2d(result, self)
 
@@ -2002,7 +2407,7 @@ class DDDObject2(DDDObject):
 
     def split(self, other):
         splitter = other  # .union()
-        result = self.copy()
+        result = self.copy(copy_children=False)
         result.name = "%s (split)" % self.name
 
         result.children = [c.split(other) for c in self.children]
@@ -2022,31 +2427,101 @@ class DDDObject2(DDDObject):
         dist_0 = other.distance(ddd.point(self.geom.coords[0]))
         dist_1 = other.distance(ddd.point(self.geom.coords[-1]))
         if dist_1 < dist_0:
-            result.geom.coords = reversed(list(result.geom.coords))
+            result.geom = type(result.geom)(reversed(list(result.geom.coords)))
         return result
 
     def simplify(self, distance):
-        result = self.copy()
+        result = self.copy(copy_children=False)
         if self.geom:
             result.geom = result.geom.simplify(distance, preserve_topology=True)
             #result.geom = result.geom.simplify(distance)  #, preserve_topology=True)
         result.children = [c.simplify(distance) for c in self.children]
         return result
 
-    def random_points(self, num_points=1, density=None, filter_func=None):
+    def random_points(self, num_points=1, density=None, filter_func=None, filter_vectorized=False, seed=None, min_distance=None):
         """
+        Returns a list of random points (coordinate tuples) uniformly distributed inside this shape.
+
+        The shape is triangulated once, and points are generated in batches from triangles chosen
+        according to their area.
+
         If filter_func is specified, points are passed to this function and accepted if it returns True.
+        If filter_vectorized is True, filter_func is called with an array of points (N x 2) and shall
+        return an array of booleans.
+
+        If seed is not specified, the generator is seeded from the `random` module, so results are
+        reproducible if it has been seeded.
+
+        If min_distance is specified, points closer than that to another point are discarded
+        (Poisson disk sampling), and fewer points than requested may be returned.
         """
         # TODO: use density or count, accoridng to polygon area :?
         # TODO: support line geometries
+        rng = np.random.default_rng(seed if seed is not None else random.getrandbits(32))
+
+        triangles = []
+        geoms = self.geom.geoms if self.geom.type in ('MultiPolygon', 'GeometryCollection') else [self.geom]
+        for geom in geoms:
+            if geom.type == 'Polygon' and not geom.is_empty:
+                vertices, faces = creation.triangulate_polygon(geom, triangle_args="p", engine='triangle')
+                triangles.append(np.asarray(vertices)[faces])
+
+        if not triangles:
+            return []
+
+        triangles = np.concatenate(triangles)
+        ab = triangles[:, 1] - triangles[:, 0]
+        ac = triangles[:, 2] - triangles[:, 0]
+        areas = np.abs(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0])
+        if areas.sum() <= 0:
+            return []
+        weights = areas / areas.sum()
+
+        # Grid of accepted points for Poisson disk sampling (cells hold at most one point)
+        grid = {}
+        cell_size = min_distance / math.sqrt(2) if min_distance else None
+
+        def spaced(p):
+            cx, cy = int(math.floor(p[0] / cell_size)), int(math.floor(p[1] / cell_size))
+            for ix in range(cx - 2, cx + 3):
+                for iy in range(cy - 2, cy + 3):
+                    q = grid.get((ix, iy), None)
+                    if q is not None and (q[0] - p[0]) ** 2 + (q[1] - p[1]) ** 2 < min_distance ** 2:
+                        return False
+            grid[(cx, cy)] = p
+            return True
+
         result = []
-        minx, miny, maxx, maxy = self.geom.bounds
-        while len(result) < num_points:
-            pnt = geometry.Point(random.uniform(minx, maxx), random.uniform(miny, maxy))
-            #if self.contains(ddd.point(pnt.coords)):
-            if self.geom.contains(pnt):
-                if filter_func is None or filter_func(pnt.coords[0]):
-                    result.append(pnt.coords[0])
+        attempts = 0
+        while len(result) < num_points and attempts < 100:
+            attempts += 1
+
+            count = max(16, (num_points - len(result)) * 2)
+            r = rng.random((count, 2))
+            flip = r.sum(axis=1) > 1
+            r[flip] = 1 - r[flip]
+            t = triangles[rng.choice(len(triangles), size=count, p=weights)]
+            points = t[:, 0] + r[:, 0:1] * (t[:, 1] - t[:, 0]) + r[:, 1:2] * (t[:, 2] - t[:, 0])
+
+            if filter_func is not None and filter_vectorized:
+                points = points[np.asarray(filter_func(points), dtype=bool)]
+
+            if (filter_func is None or filter_vectorized) and not min_distance:
+                result.extend(tuple(p) for p in points[:num_points - len(result)].tolist())
+                continue
+
+            for p in points.tolist():
+                if len(result) >= num_points:
+                    break
+                p = tuple(p)
+                if filter_func is not None and not filter_vectorized and not filter_func(p):
+                    continue
+                if min_distance and not spaced(p):
+                    continue
+                result.append(p)
+
+        if len(result) < num_points:
+            logger.debug("Generated %d of %d random points (filtered or spaced) for: %s", len(result), num_points, self)
 
         return result
 
@@ -2057,7 +2532,7 @@ class DDDObject2(DDDObject):
 
         TODO: How is this method different from outline() ?  check usages + fix/document // linearstring vs linearrings, last vertex, etc
         """
-        result = self.copy()
+        result = self.copy(copy_children=False)
         if self.geom:
             result.geom = result.geom.exterior if result.geom.type == "Polygon" else result.geom
         result.children = [c.linearize() for c in self.children]
@@ -2226,7 +2701,7 @@ class DDDObject2(DDDObject):
         dist2 = np.linalg.norm(np.array(coords) - np.array(segment_coords_b))
 
         if dist1 > ddd.EPSILON and dist2 > ddd.EPSILON:
-            self.geom.coords = self.geom.coords[:segment_idx + 1] + [coords] + self.geom.coords[segment_idx + 1:]
+            self.geom = type(self.geom)(self.geom.coords[:segment_idx + 1] + [coords] + self.geom.coords[segment_idx + 1:])
 
         return coords
 
@@ -2286,6 +2761,10 @@ class DDDObject2(DDDObject):
         """
         geoms = []
         if self.geom:
+            owner = getattr(self.geom, '_ddd_obj', None)
+            if owner is not None and owner is not self:
+                # Geometry shared with other objects (see copy()), use a private copy so it can reference this object
+                self.geom = copy.deepcopy(self.geom)
             self.geom._ddd_obj = self  # TODO: This is unsafe, generate a dictionary of id(geom) -> object (see https://shapely.readthedocs.io/en/stable/manual.html#strtree.STRtree.strtree.query)
             geoms = [self.geom]
         if self.children:
@@ -2417,6 +2896,18 @@ class DDDInstance(DDDObject):
         obj.transform.position = np.array(v) * obj.transform.position
         return obj
 
+    def translate_replace(self, v):
+        self.transform = self.translate(v).transform
+        return self
+
+    def rotate_replace(self, v, origin=None):
+        self.transform = self.rotate(v, origin).transform
+        return self
+
+    def scale_replace(self, v):
+        self.transform = self.scale(v).transform
+        return self
+
     def bounds(self):
         if self.ref:
             return self.ref.bounds()
@@ -2437,6 +2928,9 @@ class DDDInstance(DDDObject):
         logger.warning("Ignoring material set to DDDInstance: %s", self)
         return self
 
+    def material_replace(self, material, include_children=True):
+        return self.material(material, include_children)
+
     def combine(self, name=None):
         """
         Combine geometry of this instance.
@@ -2559,6 +3053,215 @@ class DDDInstance(DDDObject):
         return cmeshes
 
 
+class DDDPointSet(DDDObject):
+    """
+    A set of points stored as columnar arrays: positions (N x 3), rotations (N x 4 quaternions, wxyz),
+    scales (N x 3) and type ids (N), plus optional per-point attributes (arrays of length N).
+
+    Type ids are indexes into the `types` list, whose entries are either names (eg. for 2D point sets
+    generated by augmentation) or objects that are referenced by each point, as instances.
+
+    The whole set is a single node: selectors and pipeline tasks handle it as one object, and
+    exporters write it as instance buffers. This is intended for large numbers of small items
+    (grass blades, flowers...), which would otherwise need one node per item.
+    """
+
+    def __init__(self, positions=None, rotations=None, scales=None, type_ids=None, types=None, attributes=None, name=None, extra=None):
+        super().__init__(name, None, extra)
+
+        positions = np.zeros((0, 3)) if positions is None or len(positions) == 0 else np.array(positions, dtype=np.float64)
+        if positions.shape[1] == 2:
+            positions = np.column_stack([positions, np.zeros(len(positions))])
+        count = len(positions)
+
+        self.positions = positions
+        self.rotations = np.tile([1.0, 0.0, 0.0, 0.0], (count, 1)) if rotations is None else np.array(rotations, dtype=np.float64).reshape((count, 4))
+        self.scales = np.ones((count, 3)) if scales is None else np.array(scales, dtype=np.float64).reshape((count, 3))
+        self.type_ids = np.zeros(count, dtype=np.int32) if type_ids is None else np.array(type_ids, dtype=np.int32).reshape(count)
+        self.types = list(types) if types else [None]
+        self.attributes = {k: np.asarray(v) for k, v in attributes.items()} if attributes else {}
+
+        for k, v in self.attributes.items():
+            if len(v) != count:
+                raise DDDException("Invalid length for point set attribute %s (points: %d, values: %d)" % (k, count, len(v)), ddd_obj=self)
+        if count and self.type_ids.max() >= len(self.types):
+            raise DDDException("Invalid type id for point set (types: %d): %d" % (len(self.types), self.type_ids.max()), ddd_obj=self)
+
+    def __repr__(self):
+        return "%s(%s, points=%d, types=%d)" % (self.__class__.__name__, self.uniquename(), len(self.positions), len(self.types))
+
+    def copy(self, name=None):
+        obj = DDDPointSet(positions=self.positions.copy(), rotations=self.rotations.copy(), scales=self.scales.copy(),
+                          type_ids=self.type_ids.copy(), types=self.types, attributes={k: v.copy() for k, v in self.attributes.items()},
+                          name=name if name else self.name, extra=dict(self.extra))
+        return obj
+
+    def is_empty(self):
+        return len(self.positions) == 0
+
+    def subset(self, indexes):
+        """
+        Returns a new point set with the points selected by `indexes` (an index array or boolean mask).
+        """
+        obj = self.copy()
+        obj.positions = self.positions[indexes]
+        obj.rotations = self.rotations[indexes]
+        obj.scales = self.scales[indexes]
+        obj.type_ids = self.type_ids[indexes]
+        obj.attributes = {k: v[indexes] for k, v in self.attributes.items()}
+        return obj
+
+    def metadata(self, path_prefix, name_suffix):
+        metadata = super().metadata(path_prefix, name_suffix)
+        metadata['ddd:pointset:count'] = len(self.positions)
+        return metadata
+
+    def translate(self, v):
+        obj = self.copy()
+        return obj.translate_replace(v)
+
+    def translate_replace(self, v):
+        v = list(v) + [0.0] * (3 - len(v))
+        self.positions = self.positions + np.array(v, dtype=np.float64)
+        return self
+
+    def rotate(self, v, origin=None):
+        obj = self.copy()
+        return obj.rotate_replace(v, origin)
+
+    def rotate_replace(self, v, origin=None):
+        """
+        Rotates point positions around the origin, and point rotations (like DDDInstance.rotate()).
+        """
+        rot = quaternion_from_euler(v[0], v[1], v[2], "sxyz")
+        rotation_matrix = transformations.quaternion_matrix(rot)[:3, :3]
+        self.positions = np.dot(self.positions, rotation_matrix.T)
+
+        # Quaternion product (rot * rotation) for all points
+        w0, x0, y0, z0 = rot
+        w, x, y, z = self.rotations.T
+        self.rotations = np.column_stack([w0 * w - x0 * x - y0 * y - z0 * z,
+                                          w0 * x + x0 * w + y0 * z - z0 * y,
+                                          w0 * y - x0 * z + y0 * w + z0 * x,
+                                          w0 * z + x0 * y - y0 * x + z0 * w])
+        return self
+
+    def scale(self, v):
+        obj = self.copy()
+        return obj.scale_replace(v)
+
+    def scale_replace(self, v):
+        """
+        Scales point positions (per-point scales are not modified, like DDDInstance.scale()).
+        """
+        v = list(v) + [1.0] * (3 - len(v))
+        self.positions = self.positions * np.array(v, dtype=np.float64)
+        return self
+
+    def bounds(self):
+        """
+        Returns the bounds of the point positions (the extent of referenced objects is not considered).
+        """
+        if len(self.positions) == 0:
+            return None
+        return np.array([self.positions.min(axis=0), self.positions.max(axis=0)])
+
+    def material(self, material, include_children=True):
+        logger.warning("Ignoring material set to DDDPointSet: %s", self)
+        return self
+
+    def material_replace(self, material, include_children=True):
+        return self.material(material, include_children)
+
+    def combine(self, name=None, indexes=False):
+        """
+        Point sets are not combined (like instances), an empty object is returned.
+        """
+        return DDDObject3(name=name)
+
+    # Point sets can be children of 2D and 3D objects, but have no geometry or mesh:
+    # recursive geometry and mesh operations leave them unchanged.
+
+    def geom_recursive(self):
+        return []
+
+    def validate(self):
+        pass
+
+    def clean(self, *args, **kwargs):
+        return self.copy()
+
+    def clean_replace(self, *args, **kwargs):
+        return self
+
+    def twosided(self):
+        return self.copy()
+
+    def flip_faces(self):
+        return self.copy()
+
+    def smooth(self, angle=None):
+        return self.copy()
+
+    def merge_vertices(self, keep_normals=False):
+        return self
+
+    def matrices(self, indexes=None):
+        """
+        Returns the transformation matrices (N x 4 x 4) of the points (translation, rotation and scale),
+        optionally for the points selected by `indexes` (an index array or boolean mask) only.
+        """
+        positions, rotations, scales = self.positions, self.rotations, self.scales
+        if indexes is not None:
+            positions, rotations, scales = positions[indexes], rotations[indexes], scales[indexes]
+
+        w, x, y, z = (rotations / np.linalg.norm(rotations, axis=1)[:, np.newaxis]).T
+        result = np.zeros((len(positions), 4, 4))
+        result[:, 0, 0] = 1 - 2 * (y * y + z * z)
+        result[:, 0, 1] = 2 * (x * y - z * w)
+        result[:, 0, 2] = 2 * (x * z + y * w)
+        result[:, 1, 0] = 2 * (x * y + z * w)
+        result[:, 1, 1] = 1 - 2 * (x * x + z * z)
+        result[:, 1, 2] = 2 * (y * z - x * w)
+        result[:, 2, 0] = 2 * (x * z - y * w)
+        result[:, 2, 1] = 2 * (y * z + x * w)
+        result[:, 2, 2] = 1 - 2 * (x * x + y * y)
+        result[:, :3, :3] *= scales[:, np.newaxis, :]
+        result[:, :3, 3] = positions
+        result[:, 3, 3] = 1.0
+        return result
+
+    def instances(self):
+        """
+        Returns the points as individual DDDInstance objects, with per-point attributes as metadata.
+
+        Note that this creates one object per point, and is intended for code paths that do not support point sets.
+        """
+        result = []
+        for idx in range(len(self.positions)):
+            ref = self.types[self.type_ids[idx]]
+            obj = DDDInstance(ref if isinstance(ref, DDDObject) else None, name=self.name, extra=dict(self.extra))
+            if not isinstance(ref, DDDObject) and ref is not None:
+                obj.extra['ddd:pointset:type'] = ref
+            for k, v in self.attributes.items():
+                obj.extra[k] = v[idx].tolist()
+            obj.transform.position = self.positions[idx].tolist()
+            obj.transform.rotation = self.rotations[idx].tolist()
+            obj.transform.scale = self.scales[idx].tolist()
+            result.append(obj)
+        return result
+
+    def _instances_group(self):
+        return DDDObject3(name=self.name, children=self.instances(), extra=dict(self.extra))
+
+    def _recurse_scene_tree(self, path_prefix, name_suffix, instance_mesh, instance_marker, include_metadata, scene=None, scene_parent_node_name=None):
+        return self._instances_group()._recurse_scene_tree(path_prefix, name_suffix, instance_mesh, instance_marker, include_metadata,
+                                                           scene=scene, scene_parent_node_name=scene_parent_node_name)
+
+    def _recurse_meshes(self, instance_mesh, instance_marker):
+        return self._instances_group()._recurse_meshes(instance_mesh, instance_marker)
+
+
 class DDDTransform():
     """
     Stores position, rotation and scale.
@@ -2628,16 +3331,117 @@ class DDDTransform():
 
 class DDDObject3(DDDObject):
 
+    # Pending transform (4x4 matrix) for the mesh, applied when the mesh is accessed
+    _mesh_transform = None
+
+    # Counter of objects sharing this mesh (a list shared by them), or None if the mesh is not shared
+    _mesh_shared = None
+
     def __init__(self, name=None, children=None, mesh=None, extra=None, material=None):
         self.mesh = mesh
         super().__init__(name, children, extra, material)
 
+    def __setstate__(self, state):
+        # Objects pickled before mesh transforms were deferred store the mesh as 'mesh'
+        if 'mesh' in state:
+            state['_mesh'] = state.pop('mesh')
+        self.__dict__.update(state)
+
+    @property
+    def mesh(self):
+        """
+        Trimesh mesh of this object. Transforms (translate, rotate, scale) are accumulated
+        and applied to a copy of the mesh the first time it is accessed.
+
+        Accessing the mesh through this property also makes it private to this object if it is
+        shared with copies (see `copy()`), so it can be modified in place afterwards.
+        """
+        if self._mesh_transform is not None:
+            mesh = self._mesh.copy()
+            transform = self._mesh_transform
+            if np.array_equal(transform[:3, :3], np.identity(3)):
+                mesh.apply_translation(transform[:3, 3])
+            else:
+                mesh.vertices = trimesh.transform_points(mesh.vertices, transform)
+            self._mesh_release()
+            self._mesh = mesh
+            self._mesh_transform = None
+        elif self._mesh_shared is not None:
+            # The mesh is shared with copies, copy it as it may be modified in place (copy on write)
+            if self._mesh_shared[0] > 1:
+                self._mesh = self._mesh.copy()
+            self._mesh_release()
+        return self._mesh
+
+    @mesh.setter
+    def mesh(self, mesh):
+        self._mesh_release()
+        self._mesh = mesh
+        self._mesh_transform = None
+
+    def _mesh_read(self):
+        """
+        Returns the mesh for read only access, applying pending transforms but
+        without copying meshes shared with other objects (see `mesh`).
+        """
+        if self._mesh_transform is not None:
+            return self.mesh
+        return self._mesh
+
+    def _mesh_share(self, obj):
+        """
+        Shares the mesh (and pending transform) of this object with another object. The mesh will be
+        copied by the first of them that accesses it through `mesh`, while shared.
+        """
+        obj._mesh_release()
+        obj._mesh = self._mesh
+        obj._mesh_transform = self._mesh_transform
+        if self._mesh is not None:
+            if self._mesh_shared is None:
+                self._mesh_shared = [1]
+            self._mesh_shared[0] += 1
+            obj._mesh_shared = self._mesh_shared
+
+    def _mesh_release(self):
+        if self._mesh_shared is not None:
+            self._mesh_shared[0] -= 1
+            self._mesh_shared = None
+
+    def _transformed(self, matrix):
+        """
+        Returns a copy of this object (with children not copied) with a transform (4x4 matrix) applied
+        to its mesh. The transform is accumulated and deferred until the mesh is accessed.
+        """
+        result = DDDObject3(name=self.name, children=list(self.children), material=self.mat, extra=dict(self.extra))
+        self._mesh_share(result)
+        result._transform_replace(matrix)
+        return result
+
+    def _transform_replace(self, matrix):
+        """
+        Applies (deferred) a transform (4x4 matrix) to the mesh of this object, in place.
+        """
+        if self._mesh is not None:
+            self._mesh_transform = matrix if self._mesh_transform is None else np.dot(matrix, self._mesh_transform)
+
     def __repr__(self):
-        return "%s(%s, faces=%d, children=%d)" % (self.__class__.__name__, self.uniquename(), len(self.mesh.faces) if self.mesh else 0, len(self.children) if self.children else 0)
+        mesh = self._mesh_read()
+        return "%s(%s, faces=%d, children=%d)" % (self.__class__.__name__, self.uniquename(), len(mesh.faces) if mesh else 0, len(self.children) if self.children else 0)
 
     def copy(self, name=None):
+        """
+        Copies this object and metadata (shallow copy). Children are not copied.
+
+        The mesh is shared with the copy until either of them accesses it through `mesh` (copy on write).
+
+        Only accesses through `mesh` make the mesh private: a reference to the mesh obtained before
+        copying (eg. `mesh = obj.mesh`) still points to the shared mesh, so modifying it in place
+        (`mesh.vertices[...] = ...`, `mesh.apply_transform()`...) would also change the copies.
+        Access `obj.mesh` again after copying before modifying the mesh in place.
+        """
         if name is None: name = self.name
-        obj = DDDObject3(name=name, children=list(self.children), mesh=self.mesh.copy() if self.mesh else None, material=self.mat, extra=dict(self.extra))
+        obj = DDDObject3(name=name, children=list(self.children), material=self.mat, extra=dict(self.extra))
+        self._mesh_share(obj)
         #obj = DDDObject3(name=name, children=[c.copy() for c in self.children], mesh=self.mesh.copy() if self.mesh else None, material=self.mat, extra=dict(self.extra))
         return obj
 
@@ -2646,7 +3450,8 @@ class DDDObject3(DDDObject):
         Tells whether this object has no mesh, or mesh is empty, and
         all children are also empty.
         """
-        if self.mesh and not self.mesh.is_empty and not len(self.mesh.faces) == 0:
+        mesh = self._mesh_read()
+        if mesh and not mesh.is_empty and not len(mesh.faces) == 0:
             return False
         for c in self.children:
             if not c.is_empty():
@@ -2660,7 +3465,7 @@ class DDDObject3(DDDObject):
         """
         # TODO: Study if the system shall modify instances and let user handle cloning, this method would be unnecessary
         super(DDDObject3, self).replace(obj)
-        self.mesh = obj.mesh
+        obj._mesh_share(self)
         return self
 
     def bounds(self):
@@ -2676,8 +3481,9 @@ class DDDObject3(DDDObject):
             if cb is not None:
                 corners.extend((*cb, ))
 
-        if self.mesh:
-            corners.extend((*list(self.mesh.bounds), ))
+        mesh = self._mesh_read()
+        if mesh:
+            corners.extend((*list(mesh.bounds), ))
 
         if corners:
             corners = np.array(corners)
@@ -2697,18 +3503,51 @@ class DDDObject3(DDDObject):
 
     def translate(self, v):
         if len(v) == 2: v = (v[0], v[1], 0)
-        obj = self.copy()
-        if obj.mesh:
-            obj.mesh.apply_translation(v)
+        obj = self._transformed(transformations.translation_matrix(v[:3]))
         obj.apply_components("translate", v)
         obj.children = [c.translate(v) for c in self.children]
         return obj
 
+    def translate_replace(self, v):
+        """
+        Translates this object and its children, in place.
+        """
+        if len(v) == 2: v = (v[0], v[1], 0)
+        self._transform_replace(transformations.translation_matrix(v[:3]))
+        self.apply_components("translate", v)
+        for c in self.children:
+            c.translate_replace(v)
+        return self
+
     def rotate(self, v, origin='local'):
         """
         If origin is 'local' or None, object is rotated around its local origin.
         If origin is 'centroid', the centroid of the group is used (the same center is used for all children).
         """
+        rot, center_coords = self._rotation_matrix(v, origin)
+        obj = self._transformed(rot)
+
+        obj.apply_components("rotate", v, origin=center_coords)
+        obj.children = [c.rotate(v, origin=center_coords if origin != 'local' else 'local') for c in obj.children]
+        return obj
+
+    def rotate_replace(self, v, origin='local'):
+        """
+        Rotates this object and its children, in place (see `rotate`).
+        """
+        rot, center_coords = self._rotation_matrix(v, origin)
+        self._transform_replace(rot)
+
+        self.apply_components("rotate", v, origin=center_coords)
+        for c in self.children:
+            c.rotate_replace(v, origin=center_coords if origin != 'local' else 'local')
+        return self
+
+    def _rotation_matrix(self, v, origin):
+        """
+        Returns the rotation matrix for the given euler angles and origin (see `rotate`),
+        and the rotation center coordinates (or None).
+        """
         center_coords = None
         if origin == 'local':
             center_coords = None
@@ -2718,44 +3557,39 @@ class DDDObject3(DDDObject):
         elif origin:
             center_coords = origin
 
-        obj = self.copy()
-        if obj.mesh:
-            rot = transformations.euler_matrix(v[0], v[1], v[2], 'sxyz')
-            if center_coords:
-                translate_before = transformations.translation_matrix(np.array(center_coords) * -1)
-                translate_after = transformations.translation_matrix(np.array(center_coords))
-                #transf = translate_before * rot # * rot * translate_after  # doesn't work, these matrifes are 4x3, not 4x4 HTM
-                obj.mesh.vertices = trimesh.transform_points(obj.mesh.vertices, translate_before)
-                obj.mesh.vertices = trimesh.transform_points(obj.mesh.vertices, rot)
-                obj.mesh.vertices = trimesh.transform_points(obj.mesh.vertices, translate_after)
-            else:
-                #transf = rot
-                obj.mesh.vertices = trimesh.transform_points(obj.mesh.vertices, rot)
-
-        obj.apply_components("rotate", v, origin=center_coords)
-        obj.children = [c.rotate(v, origin=center_coords if origin != 'local' else 'local') for c in obj.children]
-        return obj
+        rot = transformations.euler_matrix(v[0], v[1], v[2], 'sxyz')
+        if center_coords:
+            translate_before = transformations.translation_matrix(np.array(center_coords) * -1)
+            translate_after = transformations.translation_matrix(np.array(center_coords))
+            rot = np.dot(translate_after, np.dot(rot, translate_before))
+        return rot, center_coords
 
     def rotate_quaternion(self, quaternion):
-        obj = self.copy()
-        if obj.mesh:
-            rot = transformations.quaternion_matrix(quaternion)
-            obj.mesh.vertices = trimesh.transform_points(obj.mesh.vertices, rot)
+        obj = self._transformed(transformations.quaternion_matrix(quaternion))
         obj.apply_components("rotate_quaternion", quaternion)
         obj.children = [c.rotate_quaternion(quaternion) for c in obj.children]
         return obj
 
     def scale(self, v):
-        obj = self.copy()
-        if obj.mesh:
-            sca = np.array([[v[0], 0.0, 0.0, 0.0],
-                            [0.0, v[1], 0.0, 0.0],
-                            [0.0, 0.0, v[2], 0.0],
-                            [0.0, 0.0, 0.0, 1.0]])
-            obj.mesh.vertices = trimesh.transform_points(obj.mesh.vertices, sca)
+        obj = self._transformed(self._scale_matrix(v))
         obj.children = [c.scale(v) for c in self.children]
         return obj
 
+    def scale_replace(self, v):
+        """
+        Scales this object and its children, in place.
+        """
+        self._transform_replace(self._scale_matrix(v))
+        for c in self.children:
+            c.scale_replace(v)
+        return self
+
+    def _scale_matrix(self, v):
+        return np.array([[v[0], 0.0, 0.0, 0.0],
+                         [0.0, v[1], 0.0, 0.0],
+                         [0.0, 0.0, v[2], 0.0],
+                         [0.0, 0.0, 0.0, 1.0]])
+
     def invert(self):
         """Inverts mesh triangles (which inverts triangle face normals)."""
         obj = self.copy()
@@ -2778,6 +3612,16 @@ class DDDObject3(DDDObject):
 
         return obj
 
+    def material_replace(self, material, include_children=True):
+        """
+        Sets the material of this object (and its children if `include_children` is True), in place.
+        """
+        self.mat = material
+        if include_children:
+            for c in self.children:
+                c.material_replace(material)
+        return self
+
     def elevation_func(self, func):
         obj = self.copy()
         for v in obj.mesh.vertices:
@@ -2898,9 +3742,11 @@ class DDDObject3(DDDObject):
             #vertices = list(result.mesh.vertices) + list(cc.mesh.vertices)
             #result.mesh = Trimesh(vertices, faces)
             if 'uv' not in result.extra: result.extra['uv'] = []
-            if cc.extra.get('uv', None):
+            if cc.extra.get('uv', None) is not None and len(cc.extra['uv']) > 0:
                 #offset = len(result.extra['uv'])
-                result.extra['uv'] = result.extra['uv'] + list(cc.extra['uv'])
+                # UVs may be lists or arrays (mapped UVs), so concatenate them explicitly
+                result.extra['uv'] = np.concatenate([np.asarray(result.extra['uv'], dtype=np.float64).reshape(-1, 2),
+                                                     np.asarray(cc.extra['uv'], dtype=np.float64).reshape(-1, 2)])
 
             # Store indexes and original objects
             if indexes:
@@ -3123,7 +3969,7 @@ class DDDObject3(DDDObject):
     '''
 
     def _process_mesh(self):
-        if self.extra.get('uv', None):
+        if self.extra.get('uv', None) is not None and len(self.extra['uv']) > 0:
             uvs = self.extra['uv']
         else:
             # Note that this does not flatten normals (that should be optional) - also, we assume mesh is rotated (XZ)
@@ -3143,7 +3989,7 @@ class DDDObject3(DDDObject):
 
             # Apply material uv:scale from material metadata if available
             uvscale = self.mat.extra.get('uv:scale', None)
-            if uvscale and uvs:
+            if uvscale and len(uvs) > 0:
                 if not isinstance(uvscale, list):
                     uvscale = (uvscale, uvscale)
                 try:
@@ -3385,10 +4231,8 @@ class DDDObject3(DDDObject):
             data = trimesh.exchange.fbx.export_fbx(trimesh_scene)
 
         elif path.endswith('.glb'):
-            rotated = self.rotate([-math.pi / 2.0, 0, 0])
-            #scene = rotated._recurse_scene("", "", instance_mesh=instance_mesh, instance_marker=instance_marker)
-            trimesh_scene = rotated._recurse_scene_tree("", "", instance_mesh=instance_mesh, instance_marker=instance_marker, include_metadata=include_metadata)
-            data = trimesh.exchange.gltf.export_glb(trimesh_scene, include_normals=D1D2D3Bootstrap.export_normals)
+            data = DDDGLTFFormat.export_glb(self, instance_mesh=instance_mesh, instance_marker=instance_marker,
+                                            include_metadata=include_metadata, include_normals=D1D2D3Bootstrap.export_normals)
 
         elif path.endswith('.gltf'):
             rotated = self.rotate([-math.pi / 2.0, 0, 0])
@@ -3447,6 +4291,8 @@ from ddd.ops.helper import DDDHelper
 from ddd.ops.snap import DDDSnap
 from ddd.ops.uvmapping import DDDUVMapping
 from ddd.ops.align import DDDAlign
+from ddd.ops.raster import DDDRaster
+from ddd.ops.spatial import DDDSpatial
 from ddd.pack.mats.defaultmats import DefaultMaterials
 from ddd.materials.materials import MaterialsCollection
 from ddd.util.dddrandom import DDDRandom
@@ -3468,6 +4314,10 @@ ddd.snap = DDDSnap()
 
 ddd.collision = DDDCollision()
 
+ddd.raster = DDDRaster()
+
+ddd.spatial = DDDSpatial()
+
 ddd.uv = DDDUVMapping()
 
 ddd.helper = DDDHelper()
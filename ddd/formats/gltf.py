@@ -0,0 +1,583 @@
+# ddd - D1D2D3
+# Library for simple scene modelling.
+# Jose Juan Montes and Contributors 2019-2021
+
+import io
+import json
+import logging
+import math
+import struct
+
+import numpy as np
+from trimesh import transformations
+from trimesh.visual.color import to_float
+
+from ddd.core.exception import DDDException
+
+
+# Get instance of logger for this module
+logger = logging.getLogger(__name__)
+
+
+GLTF_FLOAT = 5126
+GLTF_UNSIGNED_BYTE = 5121
+GLTF_UNSIGNED_SHORT = 5123
+GLTF_UNSIGNED_INT = 5125
+
+GLTF_ARRAY_BUFFER = 34962
+GLTF_ELEMENT_ARRAY_BUFFER = 34963
+
+GLTF_TRIANGLES = 4
+
+EXT_MESH_GPU_INSTANCING = "EXT_mesh_gpu_instancing"
+
+GLB_MAGIC = 0x46546C67
+GLB_CHUNK_JSON = 0x4E4F534A
+GLB_CHUNK_BIN = 0x004E4942
+
+
+def _quaternions_from_matrices(matrices):
+    """
+    Returns the rotation quaternions (N, 4), in glTF order (x, y, z, w), of the given rotation matrices (N, 3, 3).
+    """
+    m = matrices
+    result = np.zeros((len(m), 4))
+
+    # Choose the largest of the diagonal terms for numerical stability
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    cases = np.argmax(np.column_stack([trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]]), axis=1)
+
+    c = m[cases == 0]
+    s = np.sqrt(1.0 + c[:, 0, 0] + c[:, 1, 1] + c[:, 2, 2]) * 2
+    result[cases == 0] = np.column_stack([(c[:, 2, 1] - c[:, 1, 2]) / s, (c[:, 0, 2] - c[:, 2, 0]) / s, (c[:, 1, 0] - c[:, 0, 1]) / s, 0.25 * s])
+
+    c = m[cases == 1]
+    s = np.sqrt(1.0 + c[:, 0, 0] - c[:, 1, 1] - c[:, 2, 2]) * 2
+    result[cases == 1] = np.column_stack([0.25 * s, (c[:, 0, 1] + c[:, 1, 0]) / s, (c[:, 0, 2] + c[:, 2, 0]) / s, (c[:, 2, 1] - c[:, 1, 2]) / s])
+
+    c = m[cases == 2]
+    s = np.sqrt(1.0 + c[:, 1, 1] - c[:, 0, 0] - c[:, 2, 2]) * 2
+    result[cases == 2] = np.column_stack([(c[:, 0, 1] + c[:, 1, 0]) / s, 0.25 * s, (c[:, 1, 2] + c[:, 2, 1]) / s, (c[:, 0, 2] - c[:, 2, 0]) / s])
+
+    c = m[cases == 3]
+    s = np.sqrt(1.0 + c[:, 2, 2] - c[:, 0, 0] - c[:, 1, 1]) * 2
+    result[cases == 3] = np.column_stack([(c[:, 0, 2] + c[:, 2, 0]) / s, (c[:, 1, 2] + c[:, 2, 1]) / s, 0.25 * s, (c[:, 1, 0] - c[:, 0, 1]) / s])
+
+    return result / np.linalg.norm(result, axis=1)[:, np.newaxis]
+
+
+class DDDGLTFFormat():
+    """
+    Writes DDD object trees to glTF 2.0 binary (GLB) format.
+
+    Objects referenced by instances are written once per catalog key (or per referenced object
+    if it does not come from the catalog): every instance node references the same glTF meshes.
+    Vertex and index data are written to a single binary buffer, and the change from Z-up to
+    glTF Y-up axes is applied as the transform of the root node (geometry is not rotated).
+
+    Instance buffers (instances with 'ddd:instance:buffer:matrices') and point sets (DDDPointSet) are
+    written as nodes with the EXT_mesh_gpu_instancing extension, with binary TRANSLATION, ROTATION and
+    SCALE accessors.
+    """
+
+    def __init__(self, instance_mesh=True, instance_marker=False, include_metadata=True, include_normals=True):
+        self.instance_mesh = instance_mesh
+        self.instance_marker = instance_marker
+        self.include_metadata = include_metadata
+        self.include_normals = include_normals
+
+        self.nodes = []
+        self.meshes = []
+        self.accessors = []
+        self.buffer_views = []
+        self.materials = []
+        self.textures = []
+        self.images = []
+        self.buffer = io.BytesIO()
+        self.extensions_used = set()
+
+        self._mesh_cache = {}  # (instance key, child indexes) -> mesh index
+        self._material_cache = {}  # id(DDDMaterial) -> (material index, material)
+        self._material_hashes = {}  # hash(trimesh material) -> material index
+        self._image_cache = {}  # id(image) -> (image index, image)
+
+    @staticmethod
+    def export_glb(obj, instance_mesh=True, instance_marker=False, include_metadata=True, include_normals=True):
+        """
+        Returns the GLB file contents (bytes) for the given object.
+        """
+        writer = DDDGLTFFormat(instance_mesh=instance_mesh, instance_marker=instance_marker,
+                               include_metadata=include_metadata, include_normals=include_normals)
+        return writer.write(obj)
+
+    def write(self, obj):
+
+        root = self._node(obj, "", "")
+        if root is None:
+            root = self._node_add({'name': obj.uniquename().replace(" ", "_")})
+
+        # Root node metadata is stored in the scene (first node metadata is not available in some tools)
+        root_node = self.nodes[root]
+        scene = {'nodes': [root]}
+        extras = root_node.pop('extras', None)
+        if extras:
+            scene['extras'] = {'extras': extras}
+
+        # Z-up to Y-up
+        matrix = transformations.euler_matrix(-math.pi / 2.0, 0, 0, 'sxyz')
+        if 'matrix' in root_node:
+            matrix = np.dot(matrix, np.array(root_node['matrix']).reshape((4, 4)).T)
+        root_node['matrix'] = matrix.T.reshape(-1).tolist()
+
+        tree = {'asset': {'version': '2.0', 'generator': 'ddd'},
+                'scene': 0,
+                'scenes': [scene],
+                'nodes': self.nodes}
+        if self.extensions_used:
+            tree['extensionsUsed'] = sorted(self.extensions_used)
+        for key, values in (('meshes', self.meshes), ('materials', self.materials), ('textures', self.textures),
+                            ('images', self.images), ('accessors', self.accessors), ('bufferViews', self.buffer_views)):
+            if values:
+                tree[key] = values
+
+        buffer_data = self.buffer.getbuffer()
+        if len(buffer_data) > 0:
+            tree['buffers'] = [{'byteLength': len(buffer_data)}]
+
+        from ddd.ddd import D1D2D3
+        content = json.dumps(tree, separators=(',', ':'), default=D1D2D3.json_serialize).encode("utf-8")
+        content += b' ' * (-len(content) % 4)
+
+        length = 12 + 8 + len(content) + ((8 + len(buffer_data)) if len(buffer_data) > 0 else 0)
+        data = io.BytesIO()
+        data.write(struct.pack("<III", GLB_MAGIC, 2, length))
+        data.write(struct.pack("<II", len(content), GLB_CHUNK_JSON))
+        data.write(content)
+        if len(buffer_data) > 0:
+            data.write(struct.pack("<II", len(buffer_data), GLB_CHUNK_BIN))
+            data.write(buffer_data)
+
+        return data.getvalue()
+
+    def _node_add(self, node):
+        self.nodes.append(node)
+        return len(self.nodes) - 1
+
+    def _node(self, obj, path_prefix, name_suffix, ref_key=None):
+        """
+        Adds the node for an object and its children. Returns the node index, or None if the
+        object is not exported.
+
+        `ref_key` identifies objects in instanced subtrees (catalog key and child indexes), whose meshes are shared.
+        """
+        from ddd.ddd import DDDInstance, DDDObject3, DDDPointSet
+
+        if isinstance(obj, DDDInstance):
+            return self._node_instance(obj, path_prefix, name_suffix)
+        if isinstance(obj, DDDPointSet):
+            return self._node_pointset(obj, path_prefix, name_suffix)
+
+        node_name = obj.uniquename()
+        metadata = obj.metadata(path_prefix, name_suffix)
+
+        # Do not export nodes indicated 'ddd:export-as-marker' if not exporting markers
+        if (metadata.get('ddd:export-as-marker', False) or metadata.get('ddd:marker', False)) and not self.instance_marker:
+            return None
+
+        # TODO: Node names need not be unique in glTF, but tools (and the trimesh exporter) use the full path.
+        node = {'name': metadata['ddd:path'].replace(" ", "_")}
+        if self.include_metadata and metadata:
+            node['extras'] = metadata
+
+        if isinstance(obj, DDDObject3):
+            mesh = self._mesh(obj, node['name'], ref_key)
+            if mesh is not None:
+                node['mesh'] = mesh
+
+        idx = self._node_add(node)
+
+        children = []
+        for cidx, c in enumerate(obj.children):
+            cnode = self._node(c, path_prefix + node_name + "/", "#%d" % cidx, ref_key + (cidx, ) if ref_key else None)
+            if cnode is not None:
+                children.append(cnode)
+        if children:
+            node['children'] = children
+
+        return idx
+
+    def _node_instance(self, obj, path_prefix, name_suffix):
+
+        export_ref = self.instance_mesh and obj.ref
+        if not export_ref and not self.instance_marker:
+            return None
+
+        if export_ref and obj.transform.scale != [1, 1, 1]:
+            raise DDDException("Invalid scale for an instance object (%s): %s" % (obj.transform.scale, obj), ddd_obj=obj)
+
+        node_name = obj.uniquename()
+        metadata = obj.metadata(path_prefix, name_suffix)
+
+        if export_ref and 'ddd:instance:buffer:matrices' in metadata:
+            return self._node_instance_buffer(obj, path_prefix, metadata)
+
+        node = {'name': metadata['ddd:path'].replace(" ", "_")}
+        if self.include_metadata and metadata:
+            node['extras'] = metadata
+
+        # TODO: Call transform to_matrix
+        matrix = transformations.concatenate_matrices(
+            transformations.translation_matrix(obj.transform.position),
+            transformations.quaternion_matrix(obj.transform.rotation))
+        if not np.allclose(matrix, np.eye(4)):
+            node['matrix'] = matrix.T.reshape(-1).tolist()
+
+        idx = self._node_add(node)
+
+        if export_ref:
+            refnode = self._node(obj.ref, path_prefix + node_name + "/", "#ref", self._ref_key(obj.ref))
+            if refnode is not None:
+                node['children'] = [refnode]
+
+        return idx
+
+    def _ref_key(self, ref):
+        """
+        Returns the key that identifies an object referenced by instances (for mesh sharing).
+        """
+        ref_key = ref.get('ddd:catalog:key', None)
+        return ('catalog', ref_key) if ref_key else ('ref', id(ref))
+
+    def _node_instance_buffer(self, obj, path_prefix, metadata):
+        """
+        Adds a node for an instance buffer. Each mesh in the referenced object is added as a child node
+        using EXT_mesh_gpu_instancing, with the transforms of all instances.
+        """
+        from ddd.ddd import DDDTransform
+
+        node_name = obj.uniquename()
+
+        # Buffer matrices are stored as expected by the viewer (see DDDTransform.to_matrix()), convert them to node transforms
+        matrices = np.asarray(metadata.pop('ddd:instance:buffer:matrices'), dtype=np.float64).reshape((-1, 4, 4)).transpose((0, 2, 1))
+        matrices = np.matmul(np.linalg.inv(DDDTransform().to_matrix()), matrices)
+        metadata['ddd:instance:buffer:count'] = len(matrices)
+
+        # The buffer node is not transformed (its transform is that of the first instance)
+        node = {'name': metadata['ddd:path'].replace(" ", "_")}
+        if self.include_metadata and metadata:
+            node['extras'] = metadata
+        idx = self._node_add(node)
+
+        children = self._instance_buffer_children(obj.ref, path_prefix + node_name + "/", "#ref", self._ref_key(obj.ref), matrices)
+        if children:
+            node['children'] = children
+
+        return idx
+
+    def _node_pointset(self, obj, path_prefix, name_suffix):
+        """
+        Adds a node for a point set. Each mesh of each object referenced by the set types is added as a child
+        node using EXT_mesh_gpu_instancing, with the transforms of the points of that type. Numeric per-point
+        attributes are written as custom instancing attributes (eg. '_HEIGHT' for attribute 'height').
+        """
+        from ddd.ddd import DDDObject
+
+        if not self.instance_mesh:
+            return None
+
+        node_name = obj.uniquename()
+        metadata = obj.metadata(path_prefix, name_suffix)
+
+        node = {'name': metadata['ddd:path'].replace(" ", "_")}
+        if self.include_metadata and metadata:
+            node['extras'] = metadata
+        idx = self._node_add(node)
+
+        children = []
+        for type_id, ref in enumerate(obj.types):
+            if not isinstance(ref, DDDObject):
+                continue
+            indexes = np.nonzero(obj.type_ids == type_id)[0]
+            if len(indexes) == 0:
+                continue
+
+            attributes = {}
+            for key, values in obj.attributes.items():
+                values = np.asarray(values)[indexes]
+                if values.dtype.kind in 'biuf' and values.ndim <= 2 and (values.ndim == 1 or values.shape[1] <= 4):
+                    accessor_type = "SCALAR" if values.ndim == 1 else "VEC%d" % values.shape[1]
+                    attributes["_" + key.upper().replace(":", "_")] = self._accessor(values.astype(np.float32), accessor_type, None)
+
+            children.extend(self._instance_buffer_children(ref, path_prefix + node_name + "/", "#type%d" % type_id, self._ref_key(ref),
+                                                           obj.matrices(indexes), attributes))
+
+        if children:
+            node['children'] = children
+
+        return idx
+
+    def _instance_buffer_children(self, ref, path_prefix, name_suffix, ref_key, matrices, attributes=None):
+        """
+        Adds a node for each mesh in a referenced object, using EXT_mesh_gpu_instancing with the given
+        instance matrices (N, 4, 4) and optional extra instancing attributes. Returns the list of node indexes.
+        """
+        children = []
+        attributes_cache = {}
+        for refobj, refmetadata, refobj_key, refmatrix in self._instance_buffer_objects(ref, path_prefix, name_suffix, ref_key, np.eye(4)):
+
+            mesh = self._mesh(refobj, refmetadata['ddd:path'].replace(" ", "_"), refobj_key)
+            if mesh is None:
+                continue
+
+            matrix_key = refmatrix.tobytes()
+            if matrix_key not in attributes_cache:
+                attributes_cache[matrix_key] = self._instancing_attributes(np.matmul(matrices, refmatrix))
+                if attributes:
+                    attributes_cache[matrix_key].update(attributes)
+
+            child = {'name': refmetadata['ddd:path'].replace(" ", "_"),
+                     'mesh': mesh,
+                     'extensions': {EXT_MESH_GPU_INSTANCING: {'attributes': attributes_cache[matrix_key]}}}
+            if self.include_metadata and refmetadata:
+                child['extras'] = refmetadata
+            children.append(self._node_add(child))
+
+        if children:
+            self.extensions_used.add(EXT_MESH_GPU_INSTANCING)
+
+        return children
+
+    def _instance_buffer_objects(self, obj, path_prefix, name_suffix, ref_key, matrix):
+        """
+        Returns the objects in an instanced subtree as a flat list of (object, metadata, ref key, matrix) tuples,
+        where the matrix is the transform of the object relative to the instance.
+        """
+        from ddd.ddd import DDDInstance, DDDObject3
+
+        if isinstance(obj, DDDInstance):
+            if not obj.ref:
+                return []
+            instance_matrix = transformations.concatenate_matrices(
+                transformations.translation_matrix(obj.transform.position),
+                transformations.quaternion_matrix(obj.transform.rotation))
+            return self._instance_buffer_objects(obj.ref, path_prefix + obj.uniquename() + "/", "#ref", self._ref_key(obj.ref),
+                                                 np.dot(matrix, instance_matrix))
+
+        metadata = obj.metadata(path_prefix, name_suffix)
+        if (metadata.get('ddd:export-as-marker', False) or metadata.get('ddd:marker', False)) and not self.instance_marker:
+            return []
+
+        result = [(obj, metadata, ref_key, matrix)] if isinstance(obj, DDDObject3) else []
+        for cidx, c in enumerate(obj.children):
+            result.extend(self._instance_buffer_objects(c, path_prefix + obj.uniquename() + "/", "#%d" % cidx, ref_key + (cidx, ), matrix))
+        return result
+
+    def _instancing_attributes(self, matrices):
+        """
+        Adds TRANSLATION, ROTATION and SCALE accessors for the given instance matrices (N, 4, 4).
+        """
+        scale = np.linalg.norm(matrices[:, :3, :3], axis=1)
+        rotation = _quaternions_from_matrices(matrices[:, :3, :3] / scale[:, np.newaxis, :])
+
+        attributes = {'TRANSLATION': self._accessor(matrices[:, :3, 3].astype(np.float32), "VEC3", None),
+                      'ROTATION': self._accessor(rotation.astype(np.float32), "VEC4", None)}
+        if not np.allclose(scale, 1.0):
+            attributes['SCALE'] = self._accessor(scale.astype(np.float32), "VEC3", None)
+        return attributes
+
+    def _mesh(self, obj, name, ref_key):
+        """
+        Returns the index of the glTF mesh for an object, or None if the object has no geometry.
+        Meshes of instanced objects are written only once.
+        """
+        if ref_key is not None and ref_key in self._mesh_cache:
+            return self._mesh_cache[ref_key]
+
+        # Read the mesh without triggering a copy of shared meshes
+        mesh = obj._mesh_read()
+
+        idx = None
+        if mesh is not None and len(mesh.faces) > 0 and len(mesh.vertices) > 0:
+            try:
+                idx = self._mesh_write(obj, mesh, name, ref_key is not None)
+            except Exception as e:
+                logger.error("Could not process mesh for serialization (%s): %s", obj, e)
+                raise DDDException("Could not process mesh for serialization: %s" % e, ddd_obj=obj)
+
+        if ref_key is not None:
+            self._mesh_cache[ref_key] = idx
+
+        return idx
+
+    def _mesh_write(self, obj, mesh, name, instanced):
+
+        vertices = np.asarray(mesh.vertices, dtype=np.float32)
+        faces = np.asarray(mesh.faces)
+        faces = faces.astype(np.uint16 if len(vertices) <= 0xffff else np.uint32).reshape(-1)
+
+        attributes = {'POSITION': self._accessor(vertices, "VEC3", GLTF_ARRAY_BUFFER)}
+        primitive = {'attributes': attributes,
+                     'indices': self._accessor(faces, "SCALAR", GLTF_ELEMENT_ARRAY_BUFFER),
+                     'mode': GLTF_TRIANGLES}
+
+        if self.include_normals:
+            attributes['NORMAL'] = self._accessor(np.asarray(mesh.vertex_normals, dtype=np.float32), "VEC3", GLTF_ARRAY_BUFFER)
+
+        if obj.mat:
+            primitive['material'] = self._material(obj.mat)
+            attributes['TEXCOORD_0'] = self._accessor(self._uvs(obj, vertices, instanced), "VEC2", GLTF_ARRAY_BUFFER)
+        elif mesh.visual.kind in ('vertex', 'face'):
+            colors = np.asarray(mesh.visual.vertex_colors, dtype=np.uint8)
+            attributes['COLOR_0'] = self._accessor(colors, "VEC4", GLTF_ARRAY_BUFFER, normalized=True)
+
+        gltf_mesh = {'name': "Geom %s" % name, 'primitives': [primitive]}
+        if mesh.metadata:
+            gltf_mesh['extras'] = dict(mesh.metadata)
+
+        self.meshes.append(gltf_mesh)
+        return len(self.meshes) - 1
+
+    def _uvs(self, obj, vertices, instanced):
+        """
+        Returns texture coordinates for a mesh (from the 'uv' attribute, or projected from the ground plane),
+        with material uv:scale applied and flipped as required by glTF.
+        """
+        uvs = obj.extra.get('uv', None)
+        if uvs is not None and len(uvs) != len(vertices):
+            logger.warning("Invalid number of UV coordinates: %s (vertices: %s, uv: %s)", obj, len(vertices), len(uvs))
+            uvs = None
+
+        if uvs is not None and len(uvs) > 0:
+            uvs = np.array(uvs, dtype=np.float64)[:, :2]
+        elif instanced:
+            # Instanced geometry is not rotated to Y-up when exported, default UVs were computed from (x, z)
+            uvs = vertices[:, [0, 2]].astype(np.float64)
+        else:
+            # Same as (x, z) of geometry rotated to Y-up
+            uvs = np.column_stack([vertices[:, 0], -vertices[:, 1]]).astype(np.float64)
+
+        uvscale = obj.mat.extra.get('uv:scale', None)
+        if uvscale:
+            if not isinstance(uvscale, list):
+                uvscale = (uvscale, uvscale)
+            try:
+                uvscale_x, uvscale_y = uvscale
+                uvs = uvs * [uvscale_x, uvscale_y]
+            except Exception as e:
+                logger.error("Error computing UV coordinates for %s: %s", obj, e)
+
+        uvs[:, 1] = 1.0 - uvs[:, 1]
+        return uvs.astype(np.float32)
+
+    def _buffer_view(self, data, target=None):
+        """
+        Appends data (a numpy array or bytes) to the binary buffer. Returns the buffer view index.
+        """
+        offset = self.buffer.tell()
+        length = self.buffer.write(np.ascontiguousarray(data) if isinstance(data, np.ndarray) else data)
+        self.buffer.write(b'\x00' * (-length % 4))
+
+        view = {'buffer': 0, 'byteOffset': offset, 'byteLength': length}
+        if target:
+            view['target'] = target
+        self.buffer_views.append(view)
+        return len(self.buffer_views) - 1
+
+    def _accessor(self, data, accessor_type, target, normalized=False):
+
+        component_types = {np.dtype(np.float32): GLTF_FLOAT, np.dtype(np.uint8): GLTF_UNSIGNED_BYTE,
+                           np.dtype(np.uint16): GLTF_UNSIGNED_SHORT, np.dtype(np.uint32): GLTF_UNSIGNED_INT}
+
+        accessor = {'bufferView': self._buffer_view(data, target),
+                    'componentType': component_types[data.dtype],
+                    'count': len(data),
+                    'type': accessor_type}
+        if normalized:
+            accessor['normalized'] = True
+        if accessor_type == "SCALAR":
+            accessor['min'] = [data.min().item()]
+            accessor['max'] = [data.max().item()]
+        else:
+            accessor['min'] = data.min(axis=0).tolist()
+            accessor['max'] = data.max(axis=0).tolist()
+
+        self.accessors.append(accessor)
+        return len(self.accessors) - 1
+
+    def _image(self, img):
+        """
+        Appends a PIL image to the binary buffer. Returns the image index.
+        """
+        if id(img) in self._image_cache:
+            return self._image_cache[id(img)][0]
+
+        # Do not re-encode JPEG images
+        save_as = 'JPEG' if img.format == 'JPEG' else 'png'
+        with io.BytesIO() as f:
+            img.save(f, format=save_as)
+            view = self._buffer_view(f.getvalue())
+
+        self.images.append({'bufferView': view, 'mimeType': 'image/%s' % save_as.lower()})
+        idx = len(self.images) - 1
+        self._image_cache[id(img)] = (idx, img)
+        return idx
+
+    def _material(self, mat):
+        """
+        Returns the index of the glTF material for a DDDMaterial.
+        Materials are converted from their (cached) trimesh material, as done by the trimesh glTF exporter.
+        """
+        if id(mat) in self._material_cache:
+            return self._material_cache[id(mat)][0]
+
+        tmat = mat._trimesh_material()
+        hashed = hash(tmat)
+        if hashed in self._material_hashes:
+            idx = self._material_hashes[hashed]
+            self._material_cache[id(mat)] = (idx, mat)
+            return idx
+
+        pbr = tmat.to_pbr() if hasattr(tmat, 'to_pbr') else tmat
+
+        result = {}
+        pbr_metallic = {}
+        try:
+            pbr_metallic['baseColorFactor'] = to_float(pbr.baseColorFactor).reshape(4).tolist()
+        except Exception:
+            pass
+        try:
+            result['emissiveFactor'] = pbr.emissiveFactor.reshape(3).tolist()
+        except Exception:
+            pass
+
+        if isinstance(pbr.name, str):
+            result['name'] = pbr.name
+        if isinstance(pbr.alphaMode, str) and isinstance(pbr.alphaCutoff, float):
+            result['alphaMode'] = pbr.alphaMode
+            result['alphaCutoff'] = pbr.alphaCutoff
+        if isinstance(pbr.doubleSided, bool):
+            result['doubleSided'] = pbr.doubleSided
+        if isinstance(pbr.metallicFactor, float):
+            pbr_metallic['metallicFactor'] = pbr.metallicFactor
+        if isinstance(pbr.roughnessFactor, float):
+            pbr_metallic['roughnessFactor'] = pbr.roughnessFactor
+
+        for key in ('baseColorTexture', 'emissiveTexture', 'normalTexture', 'occlusionTexture', 'metallicRoughnessTexture'):
+            img = getattr(pbr, key)
+            if img is None or not hasattr(img, 'format'):
+                continue
+            self.textures.append({'source': self._image(img)})
+            texture = {'index': len(self.textures) - 1}
+            if key in ('baseColorTexture', 'metallicRoughnessTexture'):
+                pbr_metallic[key] = texture
+            else:
+                result[key] = texture
+
+        if pbr_metallic:
+            result['pbrMetallicRoughness'] = pbr_metallic
+
+        self.materials.append(result)
+        idx = len(self.materials) - 1
+        self._material_hashes[hashed] = idx
+        self._material_cache[id(mat)] = (idx, mat)
+        return idx
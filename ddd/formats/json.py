@@ -74,6 +74,11 @@ class DDDJSONFormat():
                 refdata = DDDJSONFormat.export_data(ref, path_prefix="", name_suffix="#marker", instance_mesh=instance_mesh, instance_marker=instance_marker)
                 data['_marker'] = refdata
 
+        from ddd.ddd import DDDPointSet
+        if isinstance(obj, DDDPointSet):
+            data['_points'] = len(obj.positions)
+            data['_types'] = [str(t) for t in obj.types]
+
         return data
 
 
@@ -0,0 +1,100 @@
+# ddd - DDD123
+# Library for simple scene modelling.
+# Jose Juan Montes and Contributors 2019-2021
+
+import json
+import logging
+import os
+
+import argparse
+import numpy as np
+
+from ddd.core import settings
+from ddd.core.command import DDDCommand
+from ddd.geo.georaster import GeoRasterTile
+
+
+# Get instance of logger for this module
+logger = logging.getLogger(__name__)
+
+
+class GeoRasterMemmapCommand(DDDCommand):
+    """
+    Converts the DEM tiles configured in DDD_GEO_DEM_TILES to the memory-mapped raster format
+    (a flat array file plus a JSON sidecar with geotransform and CRS).
+
+    Converted files are written next to each tile (or to DDD_GEO_RASTER_MEMMAP_DIR if set),
+    and are used automatically by GeoRasterTile.load() when present.
+    """
+
+    def parse_args(self, args):
+
+        #program_name = os.path.basename(sys.argv[0])
+        parser = argparse.ArgumentParser()  # description='', usage = ''
+
+        parser.add_argument("--overwrite", action="store_true", default=False, help="overwrite existing memory-mapped files")
+        parser.add_argument("--rows", type=int, default=1024, help="number of raster rows copied per read (default: %(default)s)")
+
+        args = parser.parse_args(args)
+
+        self.overwrite = args.overwrite
+        self.rows = args.rows
+
+    def run(self):
+        logger.info("DDD123 Geo Raster memory-mapped files conversion.")
+        self.georaster_memmap()
+
+    def georaster_memmap(self):
+
+        tiles_config = settings.DDD_GEO_DEM_TILES
+
+        converted = 0
+        for tc in tiles_config:
+
+            memmap_file = GeoRasterTile.memmap_path(tc['path'])
+            if os.path.exists(memmap_file + GeoRasterTile.MEMMAP_SIDECAR_EXTENSION) and not self.overwrite:
+                logger.info("Skipping DEM file (memory-mapped file exists): %s", memmap_file)
+                continue
+
+            if not os.path.exists(tc['path']):
+                logger.warn("DEM file not found: %s", tc['path'])
+                continue
+
+            self.convert(tc['path'], tc['crs'], memmap_file)
+            converted += 1
+
+        logger.info("Converted %d georaster files.", converted)
+
+    def convert(self, georaster_file, crs, memmap_file):
+
+        logger.info("Converting DEM file %s to: %s", georaster_file, memmap_file)
+
+        # Sidecar is removed first so partially written files are never used (it is written last)
+        if os.path.exists(memmap_file + GeoRasterTile.MEMMAP_SIDECAR_EXTENSION):
+            os.unlink(memmap_file + GeoRasterTile.MEMMAP_SIDECAR_EXTENSION)
+
+        # Sidecar was removed above, so this loads the original file through GDAL
+        tile = GeoRasterTile.load(georaster_file, crs)
+        layer = tile.layer
+        band = layer.GetRasterBand(1)
+
+        width, height = layer.RasterXSize, layer.RasterYSize
+        first_rows = band.ReadAsArray(0, 0, width, min(self.rows, height))
+        dtype = first_rows.dtype.newbyteorder('<')
+
+        data = np.memmap(memmap_file, dtype=dtype, mode='w+', shape=(height, width))
+        for row in range(0, height, self.rows):
+            rows = min(self.rows, height - row)
+            data[row:row + rows, :] = first_rows if row == 0 else band.ReadAsArray(0, row, width, rows)
+        data.flush()
+        del data
+
+        sidecar = {'source': os.path.basename(georaster_file),
+                   'crs': crs,
+                   'geotransform': list(tile.geotransform),
+                   'width': width,
+                   'height': height,
+                   'dtype': dtype.str,
+                   'nodata': band.GetNoDataValue()}
+        with open(memmap_file + GeoRasterTile.MEMMAP_SIDECAR_EXTENSION, 'w') as f:
+            json.dump(sidecar, f, indent=2)
@@ -5,6 +5,8 @@
 import logging
 import math
 
+import numpy as np
+
 from ddd.geo.georaster import GeoRasterLayer
 from ddd.core import settings
 from ddd.core.exception import DDDException
@@ -53,6 +55,27 @@ class ElevationModel:
 
         return value
 
+    def values(self, points):
+        """
+        Returns elevation values for an array of WGS84 points (N x 2) as an array of N values.
+
+        Values are sanitized as in `elevation()` (non finite or suspicious values are set to 0).
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.dummy: return np.ones(len(points))
+
+        values = self.dem.values(points)
+
+        non_finite = ~np.isfinite(values)
+        if np.any(non_finite):
+            logger.warn("Non finite elevation values found at %d points (first: %s)", np.count_nonzero(non_finite), points[non_finite][0])
+            values[non_finite] = 0
+
+        # (Sea values in EUDEM11 are found to be -3.573423841207179e+38)
+        values[(values < -1000.0) | (values > 10000.0)] = 0
+
+        return values
+
     '''
     def elevation_info(self, longitude, latitude, altitude):
         """
@@ -2,8 +2,12 @@
 # Library for simple scene modelling.
 # Jose Juan Montes and Contributors 2019-2021
 
+from collections import OrderedDict
+import hashlib
+import json
 import logging
 import math
+import os
 
 from geographiclib.geodesic import Geodesic
 import numpy
@@ -11,9 +15,12 @@ from osgeo import gdal
 from osgeo.gdalconst import GA_ReadOnly
 import pyproj
 from scipy.interpolate.interpolate import interp2d
+from shapely.geometry import box
+from shapely.strtree import STRtree
 
 from ddd.core import settings
 from ddd.core.exception import DDDException
+from ddd.util.common import parse_bool
 import numpy as np
 
 
@@ -21,30 +28,180 @@ import numpy as np
 logger = logging.getLogger(__name__)
 
 
+class GeoRasterBlockCache:
+    """
+    In-memory cache of decoded raster blocks (numpy arrays), shared by all GeoRasterTiles.
+
+    Blocks are square regions of `block_size` pixels, keyed by raster file and block index.
+    Memory usage is bounded by `max_bytes`, evicting least recently used blocks first.
+
+    The budget can be configured with the DDD_GEO_RASTER_CACHE_MB setting
+    and the block size with DDD_GEO_RASTER_CACHE_BLOCK_SIZE.
+    """
+
+    _instance = None
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, block_size=256):
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+
+        self._blocks = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def instance():
+        if GeoRasterBlockCache._instance is None:
+            max_mb = float(settings.DDD_SETTINGS_GET("DDD_GEO_RASTER_CACHE_MB", 256))
+            block_size = int(settings.DDD_SETTINGS_GET("DDD_GEO_RASTER_CACHE_BLOCK_SIZE", 256))
+            GeoRasterBlockCache._instance = GeoRasterBlockCache(int(max_mb * 1024 * 1024), block_size)
+        return GeoRasterBlockCache._instance
+
+    def __repr__(self):
+        return "%s(blocks=%d, mb=%.1f/%.1f, hits=%d, misses=%d, evictions=%d)" % (
+            self.__class__.__name__, len(self._blocks), self._bytes / (1024 * 1024), self.max_bytes / (1024 * 1024),
+            self.hits, self.misses, self.evictions)
+
+    def block(self, tile, block_x, block_y):
+        """
+        Returns the raster block (block_x, block_y) for the given tile, reading it if it is not cached.
+        Returns None if the raster data could not be read.
+        """
+        key = (tile.path, block_x, block_y)
+        data = self._blocks.get(key, None)
+        if data is not None:
+            self.hits += 1
+            self._blocks.move_to_end(key)
+            return data
+
+        self.misses += 1
+
+        x0 = block_x * self.block_size
+        y0 = block_y * self.block_size
+        x_size = min(self.block_size, tile.layer.RasterXSize - x0)
+        y_size = min(self.block_size, tile.layer.RasterYSize - y0)
+        data = tile.layer.GetRasterBand(1).ReadAsArray(x0, y0, x_size, y_size)
+        if data is None:
+            return None
+
+        self._blocks[key] = data
+        self._bytes += data.nbytes
+        while self._bytes > self.max_bytes and len(self._blocks) > 1:
+            _, evicted = self._blocks.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+        return data
+
+    def stats(self):
+        """
+        Returns cache usage counters as a dictionary.
+        """
+        total = self.hits + self.misses
+        return {'blocks': len(self._blocks),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits / total) if total else 0.0}
+
+    def clear(self):
+        self._blocks.clear()
+        self._bytes = 0
+
+
 class GeoRasterTile:
 
-    _cache = {}
+    # Opened tiles by (path, crs), least recently used first (see `load_cached`)
+    _cache = OrderedDict()
+
+    # Transformers from WGS84 to each CRS (creating transformers is expensive)
+    _transformers = {}
+
+    MEMMAP_EXTENSION = '.ddd-mmap'
+    MEMMAP_SIDECAR_EXTENSION = '.json'  # Appended to the memory-mapped file path
 
     def __init__(self):
+        self.path = None
         self.geotransform = None
         self.layer = None
         self.crs = None
         self.crs_transformer = None
 
+        # Memory-mapped raster data (if loaded from the memmap format, see `load_memmap`)
+        self.data = None
+
+    @staticmethod
+    def transformer(crs):
+        """
+        Returns a (cached) transformer from WGS84 to the given CRS.
+        """
+        crs = crs.lower()
+        transformer = GeoRasterTile._transformers.get(crs, None)
+        if transformer is None:
+            transformer = pyproj.Transformer.from_proj('epsg:4326', crs, always_xy=True)
+            GeoRasterTile._transformers[crs] = transformer
+        return transformer
+
+    @staticmethod
+    def load_cached(georaster_file, crs):
+        """
+        Returns a GeoRasterTile, reusing previously opened datasets.
+
+        The number of datasets kept open is bounded by the DDD_GEO_RASTER_OPEN_TILES setting
+        (least recently used tiles are released first).
+        """
+        key = (georaster_file, crs.lower())
+        tile = GeoRasterTile._cache.get(key, None)
+        if tile is not None:
+            GeoRasterTile._cache.move_to_end(key)
+            return tile
+
+        tile = GeoRasterTile.load(georaster_file, crs)
+        GeoRasterTile._cache[key] = tile
+
+        max_open = int(settings.DDD_SETTINGS_GET("DDD_GEO_RASTER_OPEN_TILES", 32))
+        while len(GeoRasterTile._cache) > max(1, max_open):
+            GeoRasterTile._cache.popitem(last=False)
+
+        return tile
+
     @staticmethod
-    def load_cached(self, georaster_file, crs):
-        if georaster_file not in GeoRasterTile._cache:
-            GeoRasterTile._cache[georaster_file] = GeoRasterTile.load(georaster_file, crs)
-        return GeoRasterTile._cache[georaster_file]
+    def memmap_path(georaster_file):
+        """
+        Returns the path of the memory-mapped version of a georaster file.
+
+        Memory-mapped files are stored next to the original file, or in the directory
+        configured by DDD_GEO_RASTER_MEMMAP_DIR if set (then their name includes a hash of the
+        absolute path of the original file).
+        """
+        memmap_dir = settings.DDD_SETTINGS_GET("DDD_GEO_RASTER_MEMMAP_DIR", None)
+        if memmap_dir:
+            # Tiles with the same file name in different directories must not share a memory-mapped file
+            path_hash = hashlib.sha1(os.path.abspath(os.path.expanduser(georaster_file)).encode("utf8")).hexdigest()[:12]
+            memmap_name = "%s.%s%s" % (os.path.basename(georaster_file), path_hash, GeoRasterTile.MEMMAP_EXTENSION)
+            return os.path.join(os.path.expanduser(memmap_dir), memmap_name)
+        return georaster_file + GeoRasterTile.MEMMAP_EXTENSION
 
     @staticmethod
     def load(georaster_file, crs):
 
+        # Use the memory-mapped format if available (see geo-raster-memmap command)
+        if parse_bool(settings.DDD_SETTINGS_GET("DDD_GEO_RASTER_MEMMAP", True)):
+            memmap_file = GeoRasterTile.memmap_path(georaster_file)
+            if os.path.exists(memmap_file + GeoRasterTile.MEMMAP_SIDECAR_EXTENSION):
+                return GeoRasterTile.load_memmap(memmap_file, crs, georaster_file)
+
         logger.info("Loading georaster file: %s" % georaster_file)
 
         tile = GeoRasterTile()
+        tile.path = georaster_file
         tile.crs = crs.lower()
-        tile.crs_transformer = pyproj.Transformer.from_proj('epsg:4326', tile.crs, always_xy=True)
+        tile.crs_transformer = GeoRasterTile.transformer(tile.crs)
 
         try:
             tile.layer = gdal.Open(georaster_file, GA_ReadOnly)
@@ -62,6 +219,43 @@ class GeoRasterTile:
 
         return tile
 
+    @staticmethod
+    def load_memmap(memmap_file, crs, georaster_file=None):
+        """
+        Loads a georaster tile stored as a flat, memory-mapped array with a JSON sidecar
+        (geotransform, CRS, dimensions and data type).
+
+        Data is not read on load: lookups index the memory-mapped array directly, and
+        pages are shared between processes through the OS page cache.
+        """
+
+        logger.info("Loading memory-mapped georaster file: %s" % memmap_file)
+
+        try:
+            with open(memmap_file + GeoRasterTile.MEMMAP_SIDECAR_EXTENSION, 'r') as f:
+                sidecar = json.load(f)
+
+            tile = GeoRasterTile()
+            tile.path = georaster_file if georaster_file else memmap_file
+            tile.crs = (crs if crs else sidecar['crs']).lower()
+            tile.crs_transformer = GeoRasterTile.transformer(tile.crs)
+            tile.geotransform = tuple(sidecar['geotransform'])
+            tile.data = np.memmap(memmap_file, dtype=np.dtype(sidecar['dtype']), mode='r',
+                                  shape=(sidecar['height'], sidecar['width']))
+        except Exception as e:
+            logger.warn("Could not read memory-mapped georaster file %s: %s", memmap_file, e)
+            raise DDDException("Could not read memory-mapped georaster file %s: %s" % (memmap_file, e))
+
+        return tile
+
+    def raster_size(self):
+        """
+        Returns raster size in pixels as (width, height).
+        """
+        if self.data is not None:
+            return (self.data.shape[1], self.data.shape[0])
+        return (self.layer.RasterXSize, self.layer.RasterYSize)
+
     def value(self, point, interpolate=True):
 
         georaster_offset_wgs84_xy = [0, 0]  # [-0.00004389999, 0.00004389999]  # Arbitrary offset test
@@ -86,7 +280,7 @@ class GeoRasterTile:
         raster_x = int((x - self.geotransform[0]) / self.geotransform[1])
         raster_y = int((y - self.geotransform[3]) / self.geotransform[5])
 
-        height_matrix = self.layer.GetRasterBand(1).ReadAsArray(raster_x, raster_y, 1, 1)
+        height_matrix = self.read_window(raster_x, raster_y, 1, 1)
 
         return float(height_matrix[0][0])
 
@@ -114,9 +308,9 @@ class GeoRasterTile:
 
         try:
             if k == 1:
-                height_matrix = self.layer.GetRasterBand(1).ReadAsArray(raster_x, raster_y, 2, 2)
+                height_matrix = self.read_window(raster_x, raster_y, 2, 2)
             elif k == 3:
-                height_matrix = self.layer.GetRasterBand(1).ReadAsArray(raster_x - 1, raster_y - 1, 4, 4)
+                height_matrix = self.read_window(raster_x - 1, raster_y - 1, 4, 4)
         except Exception as e:
             # TODO: Better support for borders
             return self.value_simple(point)
@@ -140,62 +334,309 @@ class GeoRasterTile:
 
         return float(value)
 
+    def values(self, points, interpolate=True):
+        """
+        Returns elevation values for an array of WGS84 points (N x 2) as an array of N values.
+
+        This is the batch counterpart of `value()`: points are projected in a single call,
+        the raster window covering all points is read once, and values are interpolated
+        with a vectorized kernel (bicubic if `interpolate` is True, nearest pixel otherwise).
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        x, y = points[:, 0], points[:, 1]
+        if self.crs != 'epsg:4326':
+            x, y = self.crs_transformer.transform(x, y)
+        return self.values_projected(np.asarray(x), np.asarray(y), interpolate=interpolate)
+
+    def values_projected(self, x, y, interpolate=True):
+        """
+        Returns values for arrays of coordinates already expressed in this tile CRS.
+        """
+
+        if not self.geotransform:
+            # Data is not available
+            raise AssertionError("No elevation data available for the given points.")
+
+        if len(x) == 0:
+            return np.zeros(0)
+
+        # Transform to raster point coordinates (integer pixel and fractional offset)
+        raster_fx = (x - self.geotransform[0]) / self.geotransform[1]
+        raster_fy = (y - self.geotransform[3]) / self.geotransform[5]
+        raster_x = np.floor(raster_fx).astype(np.int64)
+        raster_y = np.floor(raster_fy).astype(np.int64)
+        offset_x = raster_fx - raster_x
+        offset_y = raster_fy - raster_y
+
+        # Read the window covering all points (plus the bicubic kernel margin) once
+        margin = 1 if interpolate else 0
+        win_x0 = int(raster_x.min()) - margin
+        win_y0 = int(raster_y.min()) - margin
+        win_x1 = int(raster_x.max()) + margin * 2
+        win_y1 = int(raster_y.max()) + margin * 2
+        window = self.read_window(win_x0, win_y0, win_x1 - win_x0 + 1, win_y1 - win_y0 + 1)
+
+        if window is None:
+            # Fix None values (empty / missing)
+            return np.zeros(len(x))
+
+        # Correct EUDEM11 <10000 values
+        window = np.maximum(window, 0)
+
+        local_x = raster_x - win_x0
+        local_y = raster_y - win_y0
+
+        if not interpolate:
+            return window[local_y, local_x].astype(np.float64)
+
+        kernel = np.arange(-1, 3)
+        rows = local_y[:, None] + kernel[None, :]
+        cols = local_x[:, None] + kernel[None, :]
+        patches = window[rows[:, :, None], cols[:, None, :]].astype(np.float64)  # N x 4 (y) x 4 (x)
+
+        weights_x = _cubic_weights(offset_x)
+        weights_y = _cubic_weights(offset_y)
+        values = np.einsum('ni,nij,nj->n', weights_y, patches, weights_x)
+
+        return values
+
+    def read_window(self, x_off, y_off, x_size, y_size):
+        """
+        Reads a raster window. Parts of the window that fall outside the raster
+        are filled by repeating the nearest edge pixels.
+        """
+        raster_x_size, raster_y_size = self.raster_size()
+
+        read_x0 = min(max(x_off, 0), raster_x_size - 1)
+        read_y0 = min(max(y_off, 0), raster_y_size - 1)
+        read_x1 = min(max(x_off + x_size - 1, 0), raster_x_size - 1)
+        read_y1 = min(max(y_off + y_size - 1, 0), raster_y_size - 1)
+
+        data = self._read_blocks(read_x0, read_y0, read_x1, read_y1)
+        if data is None:
+            return None
+
+        if (read_x0, read_y0, read_x1, read_y1) != (x_off, y_off, x_off + x_size - 1, y_off + y_size - 1):
+            rows = np.clip(np.arange(y_off, y_off + y_size), read_y0, read_y1) - read_y0
+            cols = np.clip(np.arange(x_off, x_off + x_size), read_x0, read_x1) - read_x0
+            data = data[np.ix_(rows, cols)]
+
+        return data
+
+    def _read_blocks(self, x0, y0, x1, y1):
+        """
+        Reads the raster region [x0, x1] x [y0, y1] (inclusive, within raster bounds) through the block cache.
+
+        Memory-mapped tiles are sliced directly (no copy) and do not use the block cache.
+        """
+        if self.data is not None:
+            return self.data[y0:y1 + 1, x0:x1 + 1]
+
+        cache = GeoRasterBlockCache.instance()
+        block_size = cache.block_size
+        block_x0, block_x1 = x0 // block_size, x1 // block_size
+        block_y0, block_y1 = y0 // block_size, y1 // block_size
+
+        rows = []
+        for block_y in range(block_y0, block_y1 + 1):
+            row = []
+            for block_x in range(block_x0, block_x1 + 1):
+                block = cache.block(self, block_x, block_y)
+                if block is None:
+                    return None
+                row.append(block)
+            rows.append(row[0] if len(row) == 1 else np.concatenate(row, axis=1))
+        data = rows[0] if len(rows) == 1 else np.concatenate(rows, axis=0)
+
+        offset_x = x0 - block_x0 * block_size
+        offset_y = y0 - block_y0 * block_size
+        return data[offset_y:offset_y + (y1 - y0 + 1), offset_x:offset_x + (x1 - x0 + 1)]
+
+
+def _cubic_weights(t):
+    """
+    Cubic (Lagrange) interpolation weights for the samples at [-1, 0, 1, 2] for offsets `t` in [0, 1).
+
+    Interpolating a 4x4 patch with these weights on each axis is equivalent to the
+    cubic `interp2d` interpolation used by `GeoRasterTile.value_interpolated`.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    return np.stack([-t * (t - 1) * (t - 2) / 6.0,
+                     (t + 1) * (t - 1) * (t - 2) / 2.0,
+                     -(t + 1) * t * (t - 2) / 2.0,
+                     (t + 1) * t * (t - 1) / 6.0], axis=-1)
+
 
 class GeoRasterLayer:
     """
     Groups several GeoRasterTile configurations.
+
+    Tile footprints are indexed in WGS84 (R-tree) when the layer is created, so points are only
+    projected to the CRS of the candidate tiles. The most recently used tiles are kept in a small
+    pool and checked first, as consecutive lookups usually fall in the same tiles.
     """
 
+    # Number of recently used tiles checked before querying the tile index
+    max_open_tiles = 4
+
+    # Points per footprint edge projected to WGS84 to compute footprint bounds
+    footprint_edge_points = 16
+
     def __init__(self, tiles_config):
         self.tiles_config = tiles_config
 
-        self._last_tile = None
-        self._last_tile_config = None
+        # Recently used tiles (tile config index -> GeoRasterTile), least recently used first
+        self._open_tiles = OrderedDict()
 
-        # Cache of transformers for different georaster tile CRS
+        # Cache of transformers for different georaster tile CRS (from and to WGS84)
         self._transformers = {}
+        self._transformers_inverse = {}
+
+        self._footprints = np.array([self._footprint_wgs84(cc) for cc in tiles_config]).reshape(-1, 4)
+        self._footprint_geoms = [box(*f) for f in self._footprints]
+        self._footprint_idx = {id(g): idx for idx, g in enumerate(self._footprint_geoms)}
+        self._strtree = STRtree(self._footprint_geoms) if self._footprint_geoms else None
 
     def _get_transformer(self, crs):
         crs = crs.lower()
         transformer = self._transformers.get(crs, None)
         if transformer is None:
-            transformer = pyproj.Transformer.from_proj('epsg:4326', crs, always_xy=True)
+            transformer = GeoRasterTile.transformer(crs)
             self._transformers[crs] = transformer
         return transformer
 
     def _transform_wgs84_to(self, point, crs):
         projected_point = point
-        if crs != 'epsg:4326':
+        if crs.lower() != 'epsg:4326':
             tile_crs_transformer = self._get_transformer(crs)
             projected_point = tile_crs_transformer.transform(point[0], point[1])
         return projected_point
 
+    def _footprint_wgs84(self, tile_config):
+        """
+        Returns the bounds (minx, miny, maxx, maxy) in WGS84 of a tile configuration.
+
+        Tile bounds edges are densified before projecting, and the result is padded, so the
+        footprint contains the whole tile (it is used only to select candidate tiles).
+        """
+        minx, miny, maxx, maxy = tile_config['bounds']
+        crs = tile_config['crs'].lower()
+        if crs == 'epsg:4326':
+            return (minx, miny, maxx, maxy)
+
+        t = np.linspace(0, 1, self.footprint_edge_points)
+        x = np.concatenate([minx + (maxx - minx) * t, np.full_like(t, maxx), maxx - (maxx - minx) * t, np.full_like(t, minx)])
+        y = np.concatenate([np.full_like(t, miny), miny + (maxy - miny) * t, np.full_like(t, maxy), maxy - (maxy - miny) * t])
+
+        transformer = self._transformers_inverse.get(crs, None)
+        if transformer is None:
+            transformer = pyproj.Transformer.from_proj(tile_config['crs'], 'epsg:4326', always_xy=True)
+            self._transformers_inverse[crs] = transformer
+        lon, lat = transformer.transform(x, y)
+        lon, lat = np.asarray(lon), np.asarray(lat)
+        valid = np.isfinite(lon) & np.isfinite(lat)
+        if not np.any(valid):
+            logger.warn("Could not compute WGS84 footprint for georaster tile (using whole world): %s", tile_config['path'])
+            return (-180.0, -90.0, 180.0, 90.0)
+
+        lon, lat = lon[valid], lat[valid]
+        margin_x = (lon.max() - lon.min()) * 0.01 + 1e-9
+        margin_y = (lat.max() - lat.min()) * 0.01 + 1e-9
+        return (lon.min() - margin_x, lat.min() - margin_y, lon.max() + margin_x, lat.max() + margin_y)
+
+    def _tile(self, idx):
+        """
+        Returns the GeoRasterTile for a tile configuration index, keeping it in the pool of open tiles.
+        """
+        tile = self._open_tiles.get(idx, None)
+        if tile is None:
+            cc = self.tiles_config[idx]
+            tile = GeoRasterTile.load_cached(cc['path'], cc['crs'])
+            self._open_tiles[idx] = tile
+            while len(self._open_tiles) > self.max_open_tiles:
+                self._open_tiles.popitem(last=False)
+        else:
+            self._open_tiles.move_to_end(idx)
+        return tile
+
+    def _contains(self, idx, x, y):
+        bounds = self.tiles_config[idx]['bounds']
+        return (x >= bounds[0]) & (x < bounds[2]) & (y >= bounds[1]) & (y < bounds[3])
+
+    def candidates(self, bounds):
+        """
+        Returns the indexes (in configuration order) of tiles whose footprint intersects the given WGS84 bounds.
+        """
+        if self._strtree is None:
+            return []
+        # Query results are geometries (Shapely < 2) or indexes (Shapely >= 2)
+        result = self._strtree.query(box(*bounds))
+        return sorted(int(g) if isinstance(g, (int, np.integer)) else self._footprint_idx[id(g)] for g in result)
+
     def tile_from_point(self, point):
         """
         Returns the GeoRasterTile for the given point.
 
-        This method caches the last accessed tile, as it is more likely to be hit next.
+        Recently used tiles are checked first, as they are more likely to be hit next.
+        """
+
+        for idx in reversed(self._open_tiles):
+            projected_point = self._transform_wgs84_to(point, self.tiles_config[idx]['crs'])
+            if self._contains(idx, projected_point[0], projected_point[1]):
+                return self._tile(idx)
+
+        for idx in self.candidates((point[0], point[1], point[0], point[1])):
+            if idx in self._open_tiles:
+                continue
+            projected_point = self._transform_wgs84_to(point, self.tiles_config[idx]['crs'])
+            if self._contains(idx, projected_point[0], projected_point[1]):
+                return self._tile(idx)
+
+        return None
+
+    def tiles_from_points(self, points):
         """
+        Assigns an array of WGS84 points (N x 2) to tiles in a single pass.
 
-        if self._last_tile:
-            projected_point = self._transform_wgs84_to(point, self._last_tile.crs)
-            if (projected_point[0] >= self._last_tile_config['bounds'][0] and projected_point[0] < self._last_tile_config['bounds'][2] and
-                projected_point[1] >= self._last_tile_config['bounds'][1] and projected_point[1] < self._last_tile_config['bounds'][3]):
-                return self._last_tile
+        Returns a tuple (assignments, pending), where assignments is a list of (tile, indices, x, y)
+        tuples with the indices of the points covered by each tile and their coordinates in the
+        tile CRS, and pending is the array of indices of points not covered by any tile.
+        As in `tile_from_point`, points covered by several tiles are assigned to the first one.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        pending = np.arange(len(points))
+        assignments = []
 
-        for cc in self.tiles_config:
+        if len(points) == 0:
+            return assignments, pending
 
-            projected_point = self._transform_wgs84_to(point, cc['crs'])
+        bounds = (points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max())
+        for idx in self.candidates(bounds):
+            if len(pending) == 0:
+                break
 
-            #if (point[0] >= cc['bounds_wgs84_xy'][0] and point[0] < cc['bounds_wgs84_xy'][2] and
-            #    point[1] >= cc['bounds_wgs84_xy'][1] and point[1] < cc['bounds_wgs84_xy'][3]):
-            if (projected_point[0] >= cc['bounds'][0] and projected_point[0] < cc['bounds'][2] and
-                projected_point[1] >= cc['bounds'][1] and projected_point[1] < cc['bounds'][3]):
-                self._last_tile_config = cc
-                self._last_tile = GeoRasterTile.load(cc['path'], cc['crs'])
-                return self._last_tile
+            # Discard points outside the tile footprint before projecting
+            footprint = self._footprints[idx]
+            px, py = points[pending, 0], points[pending, 1]
+            near = (px >= footprint[0]) & (px <= footprint[2]) & (py >= footprint[1]) & (py <= footprint[3])
+            if not np.any(near):
+                continue
 
-        return None
+            near_idx = pending[near]
+            x, y = px[near], py[near]
+            crs = self.tiles_config[idx]['crs'].lower()
+            if crs != 'epsg:4326':
+                x, y = self._get_transformer(crs).transform(x, y)
+                x, y = np.asarray(x), np.asarray(y)
+
+            inside = self._contains(idx, x, y)
+            if not np.any(inside):
+                continue
+
+            assignments.append((self._tile(idx), near_idx[inside], x[inside], y[inside]))
+            pending = np.setdiff1d(pending, near_idx[inside], assume_unique=True)
+
+        return assignments, pending
 
     def value(self, point, interpolate=True):
         tile = self.tile_from_point(point)
@@ -203,6 +644,25 @@ class GeoRasterLayer:
             raise DDDException("No raster tile found for point: %s" % (point, ))
         return tile.value(point, interpolate)
 
+    def values(self, points, interpolate=True):
+        """
+        Returns values for an array of WGS84 points (N x 2).
+
+        Points are assigned to tiles in bulk (see `tiles_from_points`) and each
+        tile is sampled once for all of its points.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        result = np.zeros(len(points))
+
+        assignments, pending = self.tiles_from_points(points)
+        if len(pending) > 0:
+            raise DDDException("No raster tile found for %d points (first: %s)" % (len(pending), points[pending[0]]))
+
+        for tile, indices, x, y in assignments:
+            result[indices] = tile.values_projected(x, y, interpolate)
+
+        return result
+
     def area(self, bounds):
         """
         Returns a height matrix for the area defined by the given bounds in WGS84 coordinates.
@@ -217,8 +677,8 @@ class GeoRasterLayer:
             raise DDDException("No elevation data available for the given point.")
 
         if tile.crs != 'epsg:4326':
-            minx, miny = self.crs_transformer.transform(minx, miny)
-            maxx, maxy = self.crs_transformer.transform(maxx, maxy)
+            minx, miny = tile.crs_transformer.transform(minx, miny)
+            maxx, maxy = tile.crs_transformer.transform(maxx, maxy)
 
         # Transform to raster point coordinates
         raster_min_x = int((minx - tile.geotransform[0]) / tile.geotransform[1])
@@ -227,20 +687,19 @@ class GeoRasterLayer:
         raster_max_y = int((maxy - tile.geotransform[3]) / tile.geotransform[5])
 
         # Check if limits are hit
-        if (raster_max_x > tile.layer.RasterXSize - 1) or raster_max_y < 0:
+        raster_x_size, raster_y_size = tile.raster_size()
+        if (raster_max_x > raster_x_size - 1) or raster_max_y < 0:
             logger.error("Raster area [%d, %d, %d, %d] requested exceeds tile bounds [%d, %d] (not implemented).",
-                         raster_min_x, raster_min_y, raster_max_x, raster_max_y, tile.layer.RasterXSize, tile.layer.RasterYSize)
+                         raster_min_x, raster_min_y, raster_max_x, raster_max_y, raster_x_size, raster_y_size)
             raise NotImplementedError()
-        if raster_max_x > tile.layer.RasterXSize - 1:
-            raster_max_x = tile.layer.RasterXSize - 1
+        if raster_max_x > raster_x_size - 1:
+            raster_max_x = raster_x_size - 1
         if raster_max_y < 0:
             raster_max_y = 0
 
-        # Note that readasarray is positive south, whereas bounds are positive up
-        height_matrix = tile.layer.GetRasterBand(1).ReadAsArray(raster_min_x,
-                                                                raster_max_y,
-                                                                raster_max_x - raster_min_x + 1,
-                                                                raster_min_y - raster_max_y + 1)
+        # Note that rasters are positive south, whereas bounds are positive up
+        # (read through the tile so memory-mapped tiles, which have no GDAL layer, are supported)
+        height_matrix = np.array(tile._read_blocks(raster_min_x, raster_max_y, raster_max_x, raster_min_y))
 
         return height_matrix
 
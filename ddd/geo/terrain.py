@@ -3,11 +3,13 @@
 # Jose Juan Montes and Contributors 2019-2021
 
 import noise
+import numpy as np
 import pyproj
 
 from ddd.core.exception import DDDException
-from ddd.ddd import ddd
+from ddd.ddd import ddd, DDDObject3, DDDInstance, DDDPointSet
 from ddd.geo.elevation import ElevationModel
+from ddd.math.noise import pnoise2
 
 
 #dem_file = '/home/jjmontes/git/ddd/data/dem/eudem/eudem_dem_5deg_n40w010.tif'  # Galicia, Salamanca
@@ -28,15 +30,12 @@ def terrain_grid(bounds, detail=1.0, height=1.0, scale=0.025):
         distance = bounds
         bounds = [-distance, -distance, distance, distance]
 
-    mesh = ddd.grid3(bounds, detail=detail, name="Terrain grid")
-
     #func = lambda x, y: 2.0 * noise.pnoise2(x, y, octaves=3, persistence=0.5, lacunarity=2.0, repeatx=1024, repeaty=1024)
-    def func(x, y):
-        val = height * noise.pnoise2(x * scale, y * scale, octaves=2, persistence=0.5, lacunarity=2.0, repeatx=1024, repeaty=1024, base=0)
-        #print("%s, %s = %s" % (x, y, val))
+    def func(points):
+        val = height * pnoise2(points[:, 0] * scale, points[:, 1] * scale, octaves=2, persistence=0.5, lacunarity=2.0, repeatx=1024, repeaty=1024, base=0)
         return val
     #func = lambda x, y: random.uniform(0, 2)
-    mesh = mesh.elevation_func(func)
+    mesh = ddd.grid3(bounds, detail=detail, name="Terrain grid", elevation=func)
 
     return mesh
 
@@ -56,43 +55,133 @@ def transform_ddd_to_geo(ddd_proj, point):
     x, y = transformer_ddd_to_geo(ddd_proj).transform(point[0], point[1])
     return [x, y]
 
+def transform_ddd_to_geo_array(ddd_proj, points):
+    """
+    Transforms an array of DDD points (N x 2 or more columns) to WGS84 in a single call.
+    Returns an N x 2 array.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    x, y = transformer_ddd_to_geo(ddd_proj).transform(points[:, 0], points[:, 1])
+    return np.column_stack([x, y])
+
+
+def terrain_geotiff_elevation_values(points, ddd_proj):
+    """
+    Returns terrain elevation for an array of DDD points (N x 2 or more columns).
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(len(points), -1)
+    if len(points) == 0:
+        return np.zeros(0)
+    elevation = ElevationModel.instance()
+    return elevation.values(transform_ddd_to_geo_array(ddd_proj, points))
+
+def terrain_geotiff_elevation_grid(bounds, size, ddd_proj):
+    """
+    Samples terrain elevation on a regular grid of `size` x `size` points covering
+    the given DDD bounds [xmin, ymin, xmax, ymax] (both ends included).
+
+    Returns a `size` x `size` matrix in image order (first row is the northmost, ymax).
+    The whole grid is projected and sampled in a single batch.
+    """
+    if isinstance(size, int): size = (size, size)
+    xs = np.linspace(bounds[0], bounds[2], size[0], endpoint=True)
+    ys = np.linspace(bounds[3], bounds[1], size[1], endpoint=True)
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    points = np.column_stack([grid_x.ravel(), grid_y.ravel()])
+    return terrain_geotiff_elevation_values(points, ddd_proj).reshape((size[1], size[0]))
+
+def _mesh_objects_copy(obj, objs):
+    """
+    Copies a DDDObject3 hierarchy (as `vertex_func` does), collecting copied objects with meshes.
+    """
+    result = obj.copy()
+    if getattr(result, 'mesh', None) is not None and len(result.mesh.vertices) > 0:
+        objs.append(result)
+    result.children = [_mesh_objects_copy(c, objs) for c in obj.children]
+    return result
+
 
-def terrain_geotiff(bounds, ddd_proj, detail=1.0):
+def terrain_geotiff(bounds, ddd_proj, detail=1.0, clip=None):
     """
     Generates a square grid and applies terrain elevation to it.
+
+    Elevation for all grid vertices is sampled in a single batch. If `clip` is given, the grid
+    is clipped to that shape (see D1D2D3.grid3()).
     """
     # TODO: we should load the chunk as a heightmap, and load via terrain_heightmap for reuse
     #elevation = ElevationChunk.load('/home/jjmontes/git/ddd/data/elevation/eudem/eudem_dem_5deg_n40w010.tif')
     #elevation = ElevationChunk.load(dem_file)
-    elevation = ElevationModel.instance()
 
-    mesh = terrain_grid(bounds, detail=detail)
-    func = lambda x, y, z, i: [x, y, elevation.value(transform_ddd_to_geo(ddd_proj, [x, y]))]
-    mesh = mesh.vertex_func(func)
+    mesh = ddd.grid3(bounds, detail=detail, name="Terrain grid", clip=clip,
+                     elevation=lambda points: terrain_geotiff_elevation_values(points, ddd_proj))
     #mesh.mesh.invert()
     return mesh
 
+def _terrain_geotiff_pointset_elevation_apply(obj, ddd_proj):
+    """
+    Adds terrain elevation at each point position to the points of a point set.
+    Returns a copy of the object.
+    """
+    obj = obj.copy()
+    obj.positions[:, 2] += terrain_geotiff_elevation_values(obj.positions, ddd_proj)
+    return obj
+
 def terrain_geotiff_elevation_apply(obj, ddd_proj):
-    elevation = ElevationModel.instance()
-    #print(transform_ddd_to_geo(ddd_proj, [obj.mesh.vertices[0][ 0], obj.mesh.vertices[0][1]]))
-    func = lambda x, y, z, i: [x, y, z + elevation.value(transform_ddd_to_geo(ddd_proj, [x, y]))]
-    obj = obj.vertex_func(func)
+    """
+    Adds terrain elevation to the Z coordinate of every vertex of the object and its children.
+
+    Elevation is resolved for all vertices of the hierarchy in a single batch query.
+    Returns a copy of the object.
+    """
+    if isinstance(obj, DDDPointSet):
+        return _terrain_geotiff_pointset_elevation_apply(obj, ddd_proj)
+
+    if not isinstance(obj, DDDObject3):
+        elevation = ElevationModel.instance()
+        func = lambda x, y, z, i: [x, y, z + elevation.value(transform_ddd_to_geo(ddd_proj, [x, y]))]
+        return obj.vertex_func(func)
+
+    objs = []
+    obj = _mesh_objects_copy(obj, objs)
+    if objs:
+        vertices = [np.array(o.mesh.vertices) for o in objs]
+        elevations = terrain_geotiff_elevation_values(np.concatenate(vertices), ddd_proj)
+        offset = 0
+        for o, ov in zip(objs, vertices):
+            ov[:, 2] += elevations[offset:offset + len(ov)]
+            offset += len(ov)
+            o.mesh.vertices = ov
     #mesh.mesh.invert()
     return obj
 
+def _terrain_geotiff_vertices(obj):
+    """
+    Returns the vertex arrays of an object, as iterated by `vertex_iterator()` (instances yield the
+    vertices of the referenced object, rotated and translated).
+    """
+    if isinstance(obj, DDDInstance):
+        if not obj.ref:
+            return []
+        return [obj.transform.transform_vertices(v) for v in _terrain_geotiff_vertices(obj.ref)]
+    meshes = obj._recurse_meshes(instance_mesh=False, instance_marker=False)
+    return [m.vertices for m in meshes if len(m.vertices) > 0]
+
+def _terrain_geotiff_vertex_elevations(obj, ddd_proj):
+    vertices = [v[:, :2] for v in _terrain_geotiff_vertices(obj)]
+    if not vertices:
+        return np.zeros(0)
+    return terrain_geotiff_elevation_values(np.concatenate(vertices), ddd_proj)
+
 def terrain_geotiff_min_elevation_apply(obj, ddd_proj):
-    elevation = ElevationModel.instance()
 
-    min_h = None
-    for v in obj.vertex_iterator():
-        v_h = elevation.value(transform_ddd_to_geo(ddd_proj, [v[0], v[1]]))
-        if min_h is None:
-            min_h = v_h
-        if v_h < min_h:
-            min_h = v_h
+    # Each point of a point set is an item (elevated at its own position)
+    if isinstance(obj, DDDPointSet):
+        return _terrain_geotiff_pointset_elevation_apply(obj, ddd_proj)
 
-    if min_h is None:
+    elevations = _terrain_geotiff_vertex_elevations(obj, ddd_proj)
+    if len(elevations) == 0:
         raise DDDException("Cannot calculate min value for elevation: %s" % obj)
+    min_h = float(elevations.min())
 
     #func = lambda x, y, z, i: [x, y, z + min_h]
     obj = obj.translate([0, 0, min_h])
@@ -101,18 +190,14 @@ def terrain_geotiff_min_elevation_apply(obj, ddd_proj):
     return obj
 
 def terrain_geotiff_max_elevation_apply(obj, ddd_proj):
-    elevation = ElevationModel.instance()
 
-    max_h = None
-    for v in obj.vertex_iterator():
-        v_h = elevation.value(transform_ddd_to_geo(ddd_proj, [v[0], v[1]]))
-        if max_h is None:
-            max_h = v_h
-        if v_h > max_h:
-            max_h = v_h
+    if isinstance(obj, DDDPointSet):
+        return _terrain_geotiff_pointset_elevation_apply(obj, ddd_proj)
 
-    if max_h is None:
+    elevations = _terrain_geotiff_vertex_elevations(obj, ddd_proj)
+    if len(elevations) == 0:
         raise DDDException("Cannot calculate max value for elevation: %s" % obj)
+    max_h = float(elevations.max())
 
     #func = lambda x, y, z, i: [x, y, z + max_h]
     obj = obj.translate([0, 0, max_h])
@@ -125,5 +210,3 @@ def terrain_geotiff_elevation_value(v, ddd_proj):
     v_h = elevation.value(transform_ddd_to_geo(ddd_proj, [v[0], v[1]]))
     return v_h
 
-
-
@@ -0,0 +1,88 @@
+# ddd - DDD123
+# Library for simple scene modelling.
+# Jose Juan Montes 2021
+
+import logging
+
+import numpy as np
+
+
+# Get instance of logger for this module
+logger = logging.getLogger(__name__)
+
+
+# Permutation and gradient tables of the `noise` package C extension (which differ from
+# the ones in `noise.perlin`), so results match `noise.pnoise2()`
+_PERM = np.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225, 140, 36, 103, 30, 69,
+    142, 8, 99, 37, 240, 21, 10, 23, 190, 6, 148, 247, 120, 234, 75, 0, 26, 197, 62, 94, 252, 219,
+    203, 117, 35, 11, 32, 57, 177, 33, 88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175,
+    74, 165, 71, 134, 139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122, 60, 211, 133, 230,
+    220, 105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54, 65, 25, 63, 161, 1, 216, 80, 73, 209, 76,
+    132, 187, 208, 89, 18, 169, 200, 196, 135, 130, 116, 188, 159, 86, 164, 100, 109, 198, 173,
+    186, 3, 64, 52, 217, 226, 250, 124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212, 207, 206,
+    59, 227, 47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213, 119, 248, 152, 2, 44, 154, 163,
+    70, 221, 153, 101, 155, 167, 43, 172, 9, 129, 22, 39, 253, 19, 98, 108, 110, 79, 113, 224, 232,
+    178, 185, 112, 104, 218, 246, 97, 228, 251, 34, 242, 193, 238, 210, 144, 12, 191, 179, 162,
+    241, 81, 51, 145, 235, 249, 14, 239, 107, 49, 192, 214, 31, 181, 199, 106, 157, 184, 84, 204,
+    176, 115, 121, 50, 45, 127, 4, 150, 254, 138, 236, 205, 93, 222, 114, 67, 29, 24, 72, 243, 141,
+    128, 195, 78, 66, 215, 61, 156, 180] * 2, dtype=np.int64)
+_GRAD2 = np.array([[1, 1], [-1, 1], [1, -1], [-1, -1], [1, 0], [-1, 0], [1, 0], [-1, 0],
+                   [0, 1], [0, -1], [0, 1], [0, -1], [1, 0], [-1, 0], [0, -1], [0, 1]], dtype=np.float32)
+
+
+def _noise2(x, y, repeatx, repeaty, base):
+    """
+    Single octave of 2D Perlin noise for arrays of coordinates (float32, as the `noise` package).
+    """
+    i = np.floor(np.fmod(x, repeatx)).astype(np.int64)
+    j = np.floor(np.fmod(y, repeaty)).astype(np.int64)
+    ii = np.fmod(i + 1, repeatx).astype(np.int64)
+    jj = np.fmod(j + 1, repeaty).astype(np.int64)
+    i = (i & 255) + base
+    j = (j & 255) + base
+    ii = (ii & 255) + base
+    jj = (jj & 255) + base
+
+    x = x - np.floor(x)
+    y = y - np.floor(y)
+    fx = x * x * x * (x * (x * 6 - 15) + 10)
+    fy = y * y * y * (y * (y * 6 - 15) + 10)
+
+    a = _PERM[i]
+    aa = _PERM[a + j]
+    ab = _PERM[a + jj]
+    b = _PERM[ii]
+    ba = _PERM[b + j]
+    bb = _PERM[b + jj]
+
+    def grad2(h, gx, gy):
+        g = _GRAD2[h & 15]
+        return gx * g[:, 0] + gy * g[:, 1]
+
+    def lerp(t, a, b):
+        return a + t * (b - a)
+
+    return lerp(fy, lerp(fx, grad2(_PERM[aa], x, y), grad2(_PERM[ba], x - 1, y)),
+                lerp(fx, grad2(_PERM[ab], x, y - 1), grad2(_PERM[bb], x - 1, y - 1)))
+
+
+def pnoise2(x, y, octaves=1, persistence=0.5, lacunarity=2.0, repeatx=1024, repeaty=1024, base=0):
+    """
+    Vectorized 2D Perlin noise: returns the same values as `noise.pnoise2()` (with the same arguments)
+    for arrays of x and y coordinates, evaluating all points at once.
+    """
+    x = np.asarray(x, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+
+    freq = np.float32(1.0)
+    amp = np.float32(1.0)
+    total = np.zeros(x.shape, dtype=np.float32)
+    amp_max = np.float32(0.0)
+    for _ in range(octaves):
+        total += _noise2(x * freq, y * freq, np.float32(repeatx) * freq, np.float32(repeaty) * freq, base) * amp
+        amp_max += amp
+        freq *= np.float32(lacunarity)
+        amp *= np.float32(persistence)
+
+    return total / amp_max
@@ -5,6 +5,9 @@
 import logging
 import math
 import shapely
+from shapely import ops
+from shapely.errors import TopologicalError
+from shapely.geometry import GeometryCollection
 from shapely.geometry.polygon import orient, Polygon, LinearRing
 
 from ddd.core.exception import DDDException
@@ -167,7 +170,7 @@ class DDDGeometry():
                     newcoords.append((pointsx[i], pointsy[i], pointsz[i]))
             newcoords.append(pb)
 
-        obj.geom.coords = newcoords
+        obj.geom = type(obj.geom)(newcoords)
 
         obj.children = [self.subdivide_to_size(c, max_edge) for c in obj.children]
 
@@ -211,6 +214,104 @@ class DDDGeometry():
         if obj.children:
             raise NotImplementedError()
 
-        geom_b.exterior.coords = LinearRing(coords_b)
         obj.geom = Polygon(coords_b, obj.geom.interiors)
         return obj
+
+    def union_geoms(self, geoms, bucket_size=64, precision=None):
+        """
+        Unions a list of Shapely geometries, returning a single geometry (an empty GeometryCollection
+        if there are no non empty geometries).
+
+        All geometries are first unioned with a single unary union (which GEOS cascades over an
+        STR tree). If that fails, geometries are partitioned spatially in buckets of up to
+        `bucket_size` nearby geometries (sort-tile-recursive, by the X and then the Y coordinate
+        of their centers), each bucket is unioned on its own, and the bucket results are unioned
+        again the same way. A topology error thus only affects its bucket, which is repaired
+        (invalid polygons are buffered) and retried, or as a last resort unioned geometry by
+        geometry. If any geometry still cannot be unioned, TopologicalError is raised (instead
+        of silently dropping it) so callers can apply their own fallbacks.
+
+        If `precision` is given, coordinates are snapped to a grid of that size before the union,
+        which avoids most robustness errors caused by nearly coincident vertices.
+        """
+        geoms = [g for g in geoms if g is not None and not g.is_empty]
+        if precision:
+            geoms = [self._snap_precision(g, precision) for g in geoms]
+            geoms = [g for g in geoms if not g.is_empty]
+
+        if not geoms:
+            return GeometryCollection()
+        if len(geoms) == 1:
+            return geoms[0]
+        return self._union_cascaded(geoms, bucket_size)
+
+    def _union_cascaded(self, geoms, bucket_size):
+        try:
+            return ops.unary_union(geoms)
+        except Exception as e:
+            logger.warn("Could not union %d geometries, partitioning: %s", len(geoms), e)
+
+        if len(geoms) <= bucket_size:
+            return self._union_bucket_repair(geoms)
+
+        parts = [self._union_cascaded(bucket, bucket_size) for bucket in self._union_buckets(geoms, bucket_size)]
+        parts = [g for g in parts if g is not None and not g.is_empty]
+        if not parts:
+            return GeometryCollection()
+        if len(parts) == 1:
+            return parts[0]
+        return self._union_cascaded(parts, bucket_size)
+
+    def _union_buckets(self, geoms, bucket_size):
+        """
+        Partitions geometries in buckets of nearby geometries (sort-tile-recursive).
+        """
+        bounds = np.array([g.bounds for g in geoms])
+        centers = (bounds[:, :2] + bounds[:, 2:]) / 2.0
+
+        num_slices = int(math.ceil(math.sqrt(len(geoms) / bucket_size)))
+        order = np.argsort(centers[:, 0], kind='stable')
+
+        buckets = []
+        for slice_idx in np.array_split(order, num_slices):
+            slice_idx = slice_idx[np.argsort(centers[slice_idx, 1], kind='stable')]
+            for start in range(0, len(slice_idx), bucket_size):
+                buckets.append([geoms[idx] for idx in slice_idx[start:start + bucket_size]])
+        return buckets
+
+    def _union_bucket_repair(self, geoms):
+        """
+        Unions a bucket of geometries whose union failed, repairing invalid polygons and,
+        if it still fails, unioning them one by one. Raises TopologicalError if any of them fails.
+        """
+        geoms = [g if g.is_valid or g.type not in ('Polygon', 'MultiPolygon') else g.buffer(0) for g in geoms]
+        try:
+            return ops.unary_union(geoms)
+        except Exception as e:
+            logger.warn("Could not union %d repaired geometries, unioning them one by one: %s", len(geoms), e)
+
+        result = None
+        failed = 0
+        for geom in geoms:
+            try:
+                result = geom if result is None else result.union(geom)
+            except Exception as e:
+                logger.error("Could not union geometry: %s", e)
+                failed += 1
+        if failed:
+            raise TopologicalError("Could not union %d of %d geometries" % (failed, len(geoms)))
+        return result
+
+    def _snap_precision(self, geom, precision):
+        """
+        Snaps geometry coordinates to a grid of the given size, repairing polygons that become invalid.
+        """
+        def snap(x, y, z=None):
+            x = np.round(np.asarray(x) / precision) * precision
+            y = np.round(np.asarray(y) / precision) * precision
+            return (x, y) if z is None else (x, y, z)
+
+        result = ops.transform(snap, geom)
+        if not result.is_valid and result.type in ('Polygon', 'MultiPolygon'):
+            result = result.buffer(0)
+        return result
@@ -0,0 +1,174 @@
+# ddd - D1D2D3
+# Library for simple scene modelling.
+# Jose Juan Montes 2020
+
+import logging
+import math
+
+import numpy as np
+from shapely.geometry.base import BaseGeometry
+
+from ddd.ddd import ddd, DDDObject2
+
+
+# Get instance of logger for this module
+logger = logging.getLogger(__name__)
+
+
+class DDDRaster():
+    """
+    Rasterization of 2D geometries into numpy arrays.
+
+    Rasters are given by their bounds (minx, miny, maxx, maxy) and shape (rows, cols).
+    As in images, row 0 is the top (max y) of the bounds.
+    """
+
+    def mask(self, obj, bounds, shape):
+        """
+        Returns a boolean matrix of the given shape, which is True for the cells whose center
+        falls inside any of the polygons of the object.
+
+        The object can be a DDDObject2 (including its children), a Shapely geometry, or a list of them.
+        Polygons are filled using the even-odd rule on scanlines through cell centers.
+        Non polygonal geometries are ignored.
+        """
+        result = np.zeros(shape, dtype=bool)
+        for geom in self._geoms(obj):
+            self._mask_polygonal(geom, bounds, result)
+        return result
+
+    def coverage(self, obj, bounds, shape, supersample=4):
+        """
+        Returns a float matrix of the given shape with the fraction (0..1) of each cell covered
+        by the polygons of the object.
+
+        Coverage is approximated by rasterizing the geometry at `supersample` x `supersample`
+        samples per cell. Overlapping polygons are not counted twice.
+        """
+        rows, cols = shape
+        mask = self.mask(obj, bounds, (rows * supersample, cols * supersample))
+        return mask.reshape(rows, supersample, cols, supersample).mean(axis=(1, 3))
+
+    def coverage_window(self, obj, bounds, shape, supersample=4):
+        """
+        Like coverage(), but only rasterizes the cells within the bounds of the object, which is
+        much faster for objects that are small relative to the raster.
+
+        Returns a tuple (coverage, window), where `window` is a tuple of slices (rows, cols) of the
+        full raster that corresponds to the coverage matrix, or (None, None) if the object has no
+        geometry within the raster.
+        """
+        geoms = [g for g in self._geoms(obj) if not g.is_empty]
+        if not geoms:
+            return (None, None)
+
+        rows, cols = shape
+        minx, miny, maxx, maxy = bounds
+        dx = (maxx - minx) / cols
+        dy = (maxy - miny) / rows
+
+        geom_bounds = np.array([g.bounds for g in geoms])
+        col_min = max(0, int(math.floor((geom_bounds[:, 0].min() - minx) / dx)))
+        col_max = min(cols, int(math.ceil((geom_bounds[:, 2].max() - minx) / dx)))
+        row_min = max(0, int(math.floor((maxy - geom_bounds[:, 3].max()) / dy)))
+        row_max = min(rows, int(math.ceil((maxy - geom_bounds[:, 1].min()) / dy)))
+        if row_min >= row_max or col_min >= col_max:
+            return (None, None)
+
+        window_bounds = (minx + col_min * dx, maxy - row_max * dy, minx + col_max * dx, maxy - row_min * dy)
+        coverage = self.coverage(geoms, window_bounds, (row_max - row_min, col_max - col_min), supersample)
+        return (coverage, (slice(row_min, row_max), slice(col_min, col_max)))
+
+    def _geoms(self, obj):
+        if obj is None:
+            return []
+        if isinstance(obj, BaseGeometry):
+            return [obj]
+        if isinstance(obj, DDDObject2):
+            geoms = [obj.geom] if obj.geom else []
+            for c in obj.children:
+                geoms.extend(self._geoms(c))
+            return geoms
+        geoms = []
+        for o in obj:
+            geoms.extend(self._geoms(o))
+        return geoms
+
+    def _rings(self, geom):
+        if geom.is_empty:
+            return []
+        if geom.type == "Polygon":
+            return [geom.exterior] + list(geom.interiors)
+        if geom.type in ("MultiPolygon", "GeometryCollection"):
+            rings = []
+            for g in geom.geoms:
+                rings.extend(self._rings(g))
+            return rings
+        return []
+
+    def _mask_polygonal(self, geom, bounds, result):
+        """
+        Fills (OR) the polygonal parts of a Shapely geometry into a boolean matrix.
+
+        Each ring edge toggles the parity of every sample to the right of the point where it crosses
+        a scanline. Toggles are accumulated and summed along rows, so all edges and scanlines are
+        processed as array operations.
+        """
+
+        rings = self._rings(geom)
+        if not rings:
+            return
+
+        rows, cols = result.shape
+        minx, miny, maxx, maxy = bounds
+        dx = (maxx - minx) / cols
+        dy = (maxy - miny) / rows
+
+        # Edges in sample space (sample centers are at integer coordinates, v grows downwards)
+        edges = []
+        for ring in rings:
+            coords = np.asarray(ring.coords)[:, :2]
+            if len(coords) < 2: continue
+            edges.append(np.hstack([coords[:-1], coords[1:]]))
+        if not edges:
+            return
+        edges = np.vstack(edges)
+        u0 = (edges[:, 0] - minx) / dx - 0.5
+        v0 = (maxy - edges[:, 1]) / dy - 0.5
+        u1 = (edges[:, 2] - minx) / dx - 0.5
+        v1 = (maxy - edges[:, 3]) / dy - 0.5
+
+        # Window of rows and columns affected by this geometry
+        row_min = max(0, int(math.floor(min(v0.min(), v1.min()))))
+        row_max = min(rows, int(math.ceil(max(v0.max(), v1.max()))) + 1)
+        col_min = max(0, int(math.floor(min(u0.min(), u1.min()))))
+        col_max = min(cols, int(math.ceil(max(u0.max(), u1.max()))) + 1)
+        if row_min >= row_max or col_min >= col_max:
+            return
+
+        # Scanlines crossed by each edge: vmin <= row < vmax (half-open, so shared vertices count once)
+        vmin = np.minimum(v0, v1)
+        vmax = np.maximum(v0, v1)
+        first = np.clip(np.ceil(vmin), row_min, row_max).astype(np.int64)
+        last = np.clip(np.ceil(vmax), row_min, row_max).astype(np.int64)
+        counts = np.maximum(last - first, 0)
+        if counts.sum() == 0:
+            return
+
+        edge_idx = np.repeat(np.arange(len(edges)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        scan_rows = first[edge_idx] + offsets
+
+        eu0, ev0 = u0[edge_idx], v0[edge_idx]
+        eu1, ev1 = u1[edge_idx], v1[edge_idx]
+        cross_u = eu0 + (scan_rows - ev0) * (eu1 - eu0) / (ev1 - ev0)
+
+        # Samples strictly to the right of the crossing are toggled
+        toggle_cols = np.clip(np.floor(cross_u).astype(np.int64) + 1, col_min, col_max) - col_min
+
+        toggles = np.zeros((row_max - row_min, col_max - col_min + 1), dtype=np.int32)
+        np.add.at(toggles, (scan_rows - row_min, toggle_cols), 1)
+        inside = (np.cumsum(toggles, axis=1)[:, :-1] % 2) == 1
+
+        result[row_min:row_max, col_min:col_max] |= inside
+
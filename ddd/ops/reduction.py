@@ -4,7 +4,7 @@
 
 import numpy as np
 import logging
-from ddd.ddd import ddd, DDDInstance, DDDObject2
+from ddd.ddd import ddd, DDDInstance, DDDObject2, DDDPointSet
 import math
 from trimesh.base import Trimesh
 from trimesh import creation, intersections
@@ -219,6 +219,8 @@ class DDDMeshOps():
             newuvs = []
             vertices, faces = result.mesh.vertices, result.mesh.faces
             uvs = result.get('uv', None)
+            if uvs is not None and len(uvs) == 0:
+                uvs = None
 
             for face in faces:
 
@@ -337,7 +339,7 @@ class DDDMeshOps():
                         newfaces.extend(gfs)
                         newverts.extend(gvs)
 
-                        if uvs:
+                        if uvs is not None:
                             (uv1, uv2, uv3) = (uvs[face[0]], uvs[face[1]], uvs[face[2]])
                             (p1, p2, p3) = (vertices[face[0]], vertices[face[1]], vertices[face[2]])
                             for gv in gvs:
@@ -355,7 +357,7 @@ class DDDMeshOps():
                 result.mesh.vertices = newverts
                 result.mesh.faces = newfaces
 
-                if uvs:
+                if uvs is not None:
                     result.set('uv', newuvs)
 
                 #result.mesh.merge_vertices()
@@ -420,10 +422,10 @@ class DDDMeshOps():
             #root.select_remove(func=lambda o: key_func(o) == key)
             logger.debug("Combining %d objects by key: %s", len(objs.children), key)
 
-            instances = objs.select(func=lambda o: isinstance(o, DDDInstance), recurse=False)
+            instances = objs.select(func=lambda o: isinstance(o, (DDDInstance, DDDPointSet)), recurse=False)
             if len(instances.children) > 0:
                 instances.name = "Batched Inst: %s" % key
-                objs.select_remove(func=lambda o: isinstance(o, DDDInstance))
+                objs.select_remove(func=lambda o: isinstance(o, (DDDInstance, DDDPointSet)))
                 root.append(instances)
                 added_objects.append(instances)
 
@@ -437,11 +439,14 @@ class DDDMeshOps():
                 root.append(batched)
                 added_objects.append(batched)
 
-            logger.debug("Batched objects result for key %s: %s", key, batched)
+            logger.debug("Batched objects result for key %s: %s", key, added_objects)
 
-        # Remove objects
+        # Remove objects (batched objects are detached meanwhile, so the instances and point sets moved into them are kept)
+        for added in added_objects:
+            root.remove(added)
         for key in keys:
-            root.select_remove(func=lambda o: key_func(o) == key and o not in added_objects)
+            root.select_remove(func=lambda o: key_func(o) == key)
+        root.append(added_objects)
 
         return root
 
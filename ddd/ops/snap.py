@@ -6,18 +6,174 @@ import logging
 
 from ddd.ddd import ddd
 import math
-from shapely.geometry.polygon import LinearRing
+import numpy as np
+from scipy.spatial import cKDTree
 from ddd.core.exception import DDDException
 
 
 # Get instance of logger for this module
 logger = logging.getLogger(__name__)
 
+
+class DDDSnapSegments():
+    """
+    Flattened segment index of the outline of an object (its linearized geometry and children),
+    used to project batches of points.
+
+    Segments are stored as arrays (start and end points, owner object and segment index within it),
+    and located through a KD-tree of points sampled along them. Objects are considered in the same
+    order as DDDObject2.closest() does, so ties resolve to the same object and segment.
+    """
+
+    def __init__(self, obj):
+
+        self.objs = []
+
+        coords_a = []
+        coords_b = []
+        seg_obj = []
+        seg_idx = []
+
+        linearized = obj.individualize().linearize()
+        pending = [linearized]
+        while pending:
+            o = pending.pop()
+            pending.extend(reversed(o.children))
+            if not o.geom or o.geom.is_empty or o.geom.type not in ('LineString', 'LinearRing'):
+                continue
+            coords = np.asarray(o.geom.coords, dtype=np.float64)
+            if len(coords) < 2:
+                continue
+            if coords.shape[1] < 3:
+                coords = np.hstack([coords, np.zeros((len(coords), 1))])
+            coords_a.append(coords[:-1])
+            coords_b.append(coords[1:])
+            seg_obj.append(np.full(len(coords) - 1, len(self.objs)))
+            seg_idx.append(np.arange(len(coords) - 1))
+            self.objs.append(o)
+
+        self.size = sum(len(c) for c in coords_a)
+        if not self.size:
+            return
+
+        self.coords_a = np.concatenate(coords_a)
+        self.coords_b = np.concatenate(coords_b)
+        self.seg_obj = np.concatenate(seg_obj)
+        self.seg_idx = np.concatenate(seg_idx)
+
+        # Rings are sided (interior/exterior) using their winding, lines are always considered exterior
+        self.obj_ring = np.array([o.geom.type == 'LinearRing' for o in self.objs])
+        self.obj_ccw = np.array([o.geom.type == 'LinearRing' and o.geom.is_ccw for o in self.objs])
+        self.obj_has_z = np.array([o.geom.has_z for o in self.objs])
+
+        # Sample segments so that any point of a segment is within half the spacing of one of its samples
+        lengths = np.linalg.norm((self.coords_b - self.coords_a)[:, :2], axis=1)
+        spacing = max(lengths.mean(), ddd.EPSILON)
+        pieces = np.maximum(1, np.ceil(lengths / spacing)).astype(int)
+        self.sample_seg = np.repeat(np.arange(self.size), pieces)
+        offsets = np.arange(len(self.sample_seg)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        t = (offsets + 0.5) / pieces[self.sample_seg]
+        samples = self.coords_a[self.sample_seg, :2] + t[:, None] * (self.coords_b - self.coords_a)[self.sample_seg, :2]
+        self.sample_radius = (lengths / pieces / 2).max()
+        self.tree = cKDTree(samples)
+
+    def closest(self, points):
+        """
+        Returns, for each of the given points (N x 2 array), the index of the closest segment and
+        the closest point on it (N x 3, with Z interpolated along the segment).
+
+        If several segments are at the same distance, the first one is chosen.
+        """
+        points = np.asarray(points, dtype=np.float64)[:, :2]
+
+        # The closest segment is at most as far as the closest sample, so its samples lie within that distance plus the sample radius
+        dists, _ = self.tree.query(points)
+        candidates = self.tree.query_ball_point(points, dists + self.sample_radius + ddd.EPSILON)
+        counts = np.array([len(c) for c in candidates])
+        cand_point = np.repeat(np.arange(len(points)), counts)
+        cand_seg = self.sample_seg[np.concatenate([np.asarray(c, dtype=int) for c in candidates])]
+
+        a = self.coords_a[cand_seg]
+        d = self.coords_b[cand_seg] - a
+        p = points[cand_point]
+        dd = (d[:, :2] ** 2).sum(axis=1)
+        t = np.zeros(len(cand_seg))
+        np.divide(((p - a[:, :2]) * d[:, :2]).sum(axis=1), dd, out=t, where=dd > 0)
+        t = np.clip(t, 0.0, 1.0)
+        proj = a + t[:, None] * d
+        dist = np.linalg.norm(proj[:, :2] - p, axis=1)
+
+        # Minimum distance per point, ties resolved to the lowest segment index
+        dmin = np.full(len(points), np.inf)
+        np.minimum.at(dmin, cand_point, dist)
+        tied = dist <= dmin[cand_point] * (1 + 1e-9) + 1e-12
+        best = np.full(len(points), self.size)
+        np.minimum.at(best, cand_point[tied], cand_seg[tied])
+
+        best_mask = tied & (cand_seg == best[cand_point])
+        coords = np.zeros((len(points), 3))
+        coords[cand_point[best_mask]] = proj[best_mask]
+
+        return best, coords
+
+    def project(self, points, penetrate=None):
+        """
+        Projects points (N x 2 array) onto the closest segment.
+
+        Penetrate can be a single distance or a sequence with a distance per point (None values
+        are not penetrated). Penetration is applied towards the interior of rings.
+
+        Returns a tuple (coords, segments, sides, angles) of arrays:
+        - coords: projected points (N x 3)
+        - segments: index of the closest segment in this index (use `seg_obj` and `seg_idx` to resolve the object and segment within it)
+        - sides: 1 if the point is outside the closest ring (or the closest object is a line), -1 if it is inside
+        - angles: normal angle for alignment (as in DDDSnap.project())
+        """
+        points = np.asarray(points, dtype=np.float64)[:, :2]
+        segments, coords = self.closest(points)
+
+        dirvec = coords[:, :2] - points
+        dirvec_l = np.linalg.norm(dirvec, axis=1)
+        valid = dirvec_l > 0
+        dirvec[valid] = dirvec[valid] / dirvec_l[valid, None]
+        dirvec[~valid] = 0
+        if not valid.all():
+            logger.warn("Could not calculate closest segment director vector for align project %d points.", (~valid).sum())
+
+        # Side of the point relative to the segment, interior if it has the same winding as the ring
+        # (points on the segment count as counter-clockwise, as GEOS does for degenerate rings)
+        seg_a = self.coords_a[segments, :2]
+        seg_d = self.coords_b[segments, :2] - seg_a
+        cross = seg_d[:, 0] * (points[:, 1] - seg_a[:, 1]) - seg_d[:, 1] * (points[:, 0] - seg_a[:, 0])
+        obj_idx = self.seg_obj[segments]
+        sides = np.where(self.obj_ring[obj_idx] & ((cross >= 0) == self.obj_ccw[obj_idx]), -1, 1)
+
+        if penetrate is not None:
+            if np.isscalar(penetrate):
+                penetrate = np.full(len(points), penetrate)
+            penetrate = np.array([p if p is not None else 0.0 for p in penetrate], dtype=np.float64)
+            coords[:, :2] += dirvec * (penetrate * sides)[:, None]
+
+        angles = np.arctan2(dirvec[:, 1], dirvec[:, 0]) + np.where(sides < 0, math.pi, 0.0)
+
+        return coords, segments, sides, angles
+
+
 class DDDSnap():
 
     def __init__(self):
         self._last_obj = None
-        self._last_linearized = None
+        self._last_segments = None
+
+    def segments(self, obj):
+        """
+        Returns the segment index (DDDSnapSegments) of the outline of an object.
+        The index of the last object is cached.
+        """
+        if obj is not self._last_obj:
+            self._last_obj = obj
+            self._last_segments = DDDSnapSegments(obj)
+        return self._last_segments
 
     def project(self, point, obj, penetrate=0.0):
         """
@@ -27,47 +183,50 @@ class DDDSnap():
 
         See examples/snap.py for several examples of usage.
         """
+        return self.project_batch([point], obj, penetrate=penetrate)[0]
 
-        # Cache last object
-        if obj != self._last_obj:
-            self._last_obj = obj
-            obj = obj.individualize().linearize()
-            self._last_linearized = obj
-        else:
-            obj = self._last_linearized
-
-        result = point.copy()
-
-        try:
-            coords_p, segment_idx, segment_coords_a, segment_coords_b, closest_obj, closest_d = obj.closest_segment(point)
-        except DDDException as e:
-            logger.warn("Could not snap project point %s onto %s", point, obj)
-            return result
-
-
-        dirvec_d = [coords_p[0] - point.geom.coords[0][0], coords_p[1] - point.geom.coords[0][1]]
-        dirvec_l = math.sqrt(dirvec_d[0] ** 2 + dirvec_d[1] ** 2)
-        if dirvec_l > 0:
-            dirvec = [dirvec_d[0] / dirvec_l, dirvec_d[1] / dirvec_l]
-        else:
-            logger.warn("Could not calculate closest segment director vector for align project point %s onto %s", point, obj)
-            dirvec = [0, 0]
-
-        # Find side (TODO: for linear -not rings- there is no winding direction)
-        exterior = 1
-        pol = LinearRing([segment_coords_a[:2], segment_coords_b[:2], (point.geom.coords[0][0], point.geom.coords[0][1], 0)])
-        if closest_obj.geom.type != "LineString":
-            if pol.is_ccw == closest_obj.geom.is_ccw:
-                exterior = -1
-
-        if penetrate:
-            coords_p = [coords_p[0] + dirvec[0] * penetrate * exterior, coords_p[1] + dirvec[1] * penetrate * exterior]
-
-        result.geom.coords = coords_p
-        result.extra['ddd:angle:calculated'] = math.atan2(dirvec[1], dirvec[0]) + (math.pi if exterior < 0 else 0)
-        result.extra['ddd:angle'] = result.extra['ddd:angle'] if result.extra.get('ddd:angle', None) is not None else result.extra['ddd:angle:calculated']
+    def project_batch(self, points, obj, penetrate=0.0):
+        """
+        Projects a list of points to another object outline (see project()), building the
+        segment index of the object once. Penetrate can be a single value or a list with
+        a value per point.
+
+        Returns a list with a projected copy of each point.
+        """
+        segments = self.segments(obj)
+        if not points:
+            return []
+
+        if not segments.size:
+            logger.warn("Could not snap project %d points onto %s (no linear geometry)", len(points), obj)
+            return [point.copy() for point in points]
+
+        penetrates = penetrate if isinstance(penetrate, (list, tuple, np.ndarray)) else [penetrate] * len(points)
+        coords, segs, sides, angles = segments.project([point.geom.coords[0] for point in points], penetrates)
+
+        result = []
+        for idx, point in enumerate(points):
+            projected = point.copy()
+            if penetrates[idx] or not segments.obj_has_z[segments.seg_obj[segs[idx]]]:
+                projected.geom = type(projected.geom)(coords[idx][:2])
+            else:
+                projected.geom = type(projected.geom)(coords[idx])
+            projected.extra['ddd:angle:calculated'] = float(angles[idx])
+            projected.extra['ddd:angle'] = projected.extra['ddd:angle'] if projected.extra.get('ddd:angle', None) is not None else projected.extra['ddd:angle:calculated']
+            result.append(projected)
 
         return result
 
+    def project_points(self, points, obj, penetrate=None):
+        """
+        Projects an array of points (N x 2) to another object outline.
+
+        Returns arrays (coords, segments, sides, angles), see DDDSnapSegments.project().
+        """
+        segments = self.segments(obj)
+        if not segments.size:
+            raise DDDException("Could not snap project points onto %s (no linear geometry)" % obj, ddd_obj=obj)
+        return segments.project(points, penetrate)
+
 
     # for snap3, check https://github.com/mikedh/trimesh/blob/master/trimesh/proximity.py
@@ -0,0 +1,200 @@
+# ddd - D1D2D3
+# Library for simple scene modelling.
+# Jose Juan Montes 2020
+
+import logging
+
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+
+from ddd.ddd import DDDObject
+
+
+# Get instance of logger for this module
+logger = logging.getLogger(__name__)
+
+
+class DDDSpatial():
+    """
+    Spatial joins between two collections of 2D nodes, and cropping of node collections to a region.
+
+    Collections can be given as a DDDObject2 (its children are used) or as a list of nodes.
+    The geometries of one of the collections are indexed in an STRtree, and predicates are
+    evaluated with prepared geometries, so each join is roughly O((n + m) log n) instead
+    of testing every pair of nodes.
+
+    As in DDDObject2.contains(), a node of the indexed collection is matched if its geometry
+    or the geometry of any of its descendants satisfies the predicate.
+    """
+
+    def _nodes(self, objs):
+        if isinstance(objs, DDDObject):
+            return list(objs.children)
+        return list(objs)
+
+    def index(self, objs, recurse=True):
+        """
+        Returns a tuple (tree, geoms, owners, nodes) for the given collection, where `geoms` maps
+        the id of each indexed geometry to the list of its entries and `owners[i]` is the index in
+        `nodes` of the node that owns entry `i`. Returns a None tree if there are no geometries.
+
+        Node copies share geometry objects, so the same geometry can have several entries
+        (one for each node that owns it).
+
+        If recurse is False, only the geometry of each node is indexed (not its descendants).
+        """
+        nodes = self._nodes(objs)
+        geoms = []
+        owners = []
+        for idx, node in enumerate(nodes):
+            for geom in self._geoms(node, recurse):
+                geoms.append(geom)
+                owners.append(idx)
+        entries = {}
+        for gidx, geom in enumerate(geoms):
+            entries.setdefault(id(geom), []).append(gidx)
+        tree = STRtree(geoms) if geoms else None
+        return (tree, entries, owners, nodes)
+
+    def join(self, objs, others, predicate='intersects', recurse=True):
+        """
+        For each node in `objs`, returns the list of nodes in `others` for which
+        `other.<predicate>(obj)` holds, in the order they have in `others`.
+
+        The predicate is the name of any predicate supported by Shapely prepared
+        geometries (intersects, contains, contains_properly, covers, crosses, overlaps,
+        touches, within). Nodes in `objs` with children are unioned before testing.
+        If recurse is False, descendants of the nodes in `others` are not considered.
+        """
+        tree, geoms, owners, nodes = self.index(others, recurse)
+        prepared = {}
+
+        result = []
+        for obj in self._nodes(objs):
+            matches = set()
+            geom = self._query_geom(obj) if tree else None
+            if geom is not None:
+                for cand in tree.query(geom):
+                    # Shared geometries are returned once by the tree but may belong to several nodes
+                    cand_owners = [owners[gidx] for gidx in geoms[id(cand)] if owners[gidx] not in matches]
+                    if not cand_owners: continue
+                    pgeom = prepared.get(id(cand))
+                    if pgeom is None:
+                        pgeom = prep(cand)
+                        prepared[id(cand)] = pgeom
+                    if getattr(pgeom, predicate)(geom):
+                        matches.update(cand_owners)
+            result.append([nodes[idx] for idx in sorted(matches)])
+
+        return result
+
+    def contains(self, containers, objs, recurse=True):
+        """
+        For each node in `objs`, returns the list of nodes in `containers` that contain it.
+        """
+        return self.join(objs, containers, 'contains', recurse)
+
+    def intersects(self, objs, others, recurse=True):
+        """
+        For each node in `objs`, returns the list of nodes in `others` that intersect it.
+        """
+        return self.join(objs, others, 'intersects', recurse)
+
+    def nearest(self, objs, others, recurse=True):
+        """
+        For each node in `objs`, returns a tuple (node, distance) with the nearest node in `others`,
+        or (None, None) if it cannot be resolved (empty geometries or no nodes in `others`).
+        """
+        tree, geoms, owners, nodes = self.index(others, recurse)
+
+        result = []
+        for obj in self._nodes(objs):
+            geom = self._query_geom(obj) if tree else None
+            if geom is None:
+                result.append((None, None))
+                continue
+            nearest = tree.nearest(geom)
+            result.append((nodes[owners[geoms[id(nearest)][0]]], nearest.distance(geom)))
+
+        return result
+
+    def crop(self, objs, region):
+        """
+        Crops nodes to a region, with the same result as calling `obj.intersection(region)` for each of them,
+        but classifying all geometries (of the nodes and their descendants) against the region at once:
+
+        - outside: geometries whose bounds don't intersect the region, or which don't intersect it, are removed
+        - inside: geometries contained in the region are kept unchanged
+        - boundary: only geometries crossing the region boundary are intersected
+
+        Non simple lines are always intersected, as the intersection nodes them.
+
+        Returns a tuple (result, counts). For each node, result contains the node itself if none of
+        its geometries changed, None if it is empty after cropping, or a cropped copy otherwise.
+        Counts is a dictionary with the number of geometries in each class.
+        """
+        nodes = self._nodes(objs)
+        counts = {'outside': 0, 'inside': 0, 'boundary': 0}
+
+        region = region.union()
+        if not region.geom:
+            return (nodes, counts)
+
+        geoms = []
+        for obj in nodes:
+            geoms.extend(self._geoms(obj))
+
+        candidates = set()
+        if geoms:
+            candidates = set(id(g) for g in STRtree(geoms).query(region.geom))
+        prepared = prep(region.geom)
+
+        def crop_geom(geom):
+            if id(geom) not in candidates:
+                counts['outside'] += 1
+                return None
+            if prepared.contains(geom) and (geom.type in ('Polygon', 'MultiPolygon') or geom.is_simple):
+                counts['inside'] += 1
+                return geom
+            if prepared.intersects(geom):
+                counts['boundary'] += 1
+                return geom.intersection(region.geom)
+            counts['outside'] += 1
+            return None
+
+        def crop_obj(obj):
+            geom = obj.geom
+            if geom:
+                geom = crop_geom(geom)
+            children = [crop_obj(c) for c in obj.children]
+            if geom is obj.geom and all(cc is c for cc, c in zip(children, obj.children)):
+                return obj
+            children = [c for c in children if c is not None and not c.is_empty()]
+            if not geom and not children:
+                return None
+            result = obj.copy(copy_children=False)
+            result.geom = geom
+            result.children = children
+            return result
+
+        return ([crop_obj(obj) for obj in nodes], counts)
+
+    def _geoms(self, obj, recurse=True):
+        """
+        Returns the non empty geometries of this node and (if recurse is True) its descendants.
+        """
+        result = []
+        if obj.geom is not None and not obj.geom.is_empty:
+            result.append(obj.geom)
+        if recurse:
+            for c in obj.children:
+                result.extend(self._geoms(c))
+        return result
+
+    def _query_geom(self, obj):
+        if obj.children:
+            obj = obj.union()
+        if obj.geom is None or obj.geom.is_empty:
+            return None
+        return obj.geom
+
@@ -17,6 +17,7 @@
 
 import random
 import numpy as np
+from scipy.spatial import cKDTree
 
 from shapely.geometry.polygon import LinearRing
 
@@ -32,24 +33,62 @@ logger = logging.getLogger(__name__)
 
 class DDDUVMapping():
 
-    def _setuv(self, face, idx, uv):
+    def _face_normals(self, obj, vertices, faces):
         """
-        Helper function to set a UV on a mesh vertex
+        Returns the (non normalized) normals of all faces of a mesh.
         """
-        uv = (uv[0] * scale[0] + offset[0], uv[1] * scale[1] + offset[1])
-        if split and result.extra['uv'][idx] != None and (result.extra['uv'][idx] != uv):
-            # FIXME: Study and provide for when vertex should be duplicated (regarding UV and normals). Normals shall be calculated
-            # before UV mapping as vertex may need to be duplicated (although an adequate mapping would also reduce this)
-            newidx = len(result.mesh.vertices)
-            result.mesh.vertices = np.array(list(result.mesh.vertices) + [result.mesh.vertices[idx]])
-            if face[0] == idx: face[0] = newidx
-            if face[1] == idx: face[1] = newidx
-            if face[2] == idx: face[2] = newidx
-            result.extra['uv'].append(uv)
-            #raise ValueError("Cannot map same vertex twice in cubic mapping.")
-        else:
-            result.extra['uv'][idx] = uv
+        triangles = vertices[faces]
+        normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        invalid = np.count_nonzero(~normals.any(axis=1))
+        if invalid:
+            logger.error("Invalid triangles (linear dependent, no normal): %s (%d faces)", obj, invalid)
+        return normals
+
+    def _assign_uvs(self, result, uvs, scale, offset, split):
+        """
+        Assigns UV coordinates, given for each face corner (faces x 3 x 2), to the mesh vertices.
+
+        If split is True, vertices which are given different UV coordinates by different faces are
+        duplicated (one vertex for each distinct vertex and UV pair). Otherwise, the last UV
+        coordinates given to each vertex are used.
 
+        UV coordinates are stored as an array in the 'uv' attribute.
+        """
+        mesh = result._mesh_read()
+        vertices = np.asarray(mesh.vertices)
+        corners = np.asarray(mesh.faces).reshape(-1)
+        uvs = uvs.reshape(-1, 2) * scale + offset
+
+        if not split:
+            # Last corner for each vertex
+            vertex_ids, last = np.unique(corners[::-1], return_index=True)
+            result_uvs = np.zeros((len(vertices), 2))
+            result_uvs[vertex_ids] = uvs[::-1][last]
+            result.extra['uv'] = result_uvs
+            return
+
+        # Distinct (vertex, uv) pairs, in order of first use
+        pairs, first, inverse = np.unique(np.column_stack([corners, uvs]), axis=0, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind='stable')
+        pairs = pairs[order]
+        inverse = np.argsort(order)[inverse.reshape(-1)]
+        pair_vertices = pairs[:, 0].astype(np.int64)
+
+        # The first pair of each vertex keeps the vertex, others use new vertices
+        keep = np.zeros(len(pairs), dtype=bool)
+        keep[np.unique(pair_vertices, return_index=True)[1]] = True
+        new_vertices = pair_vertices.copy()
+        new_vertices[~keep] = len(vertices) + np.arange(np.count_nonzero(~keep))
+
+        result_uvs = np.zeros((len(vertices) + np.count_nonzero(~keep), 2))
+        result_uvs[new_vertices] = pairs[:, 1:]
+
+        if np.any(~keep):
+            mesh = result.mesh
+            mesh.vertices = np.concatenate([vertices, vertices[pair_vertices[~keep]]])
+            mesh.faces = new_vertices[inverse].reshape(-1, 3)
+
+        result.extra['uv'] = result_uvs
 
     def map_random(self, obj_3d):
         """
@@ -57,12 +96,14 @@ class DDDUVMapping():
         This method does not create a copy of objects, affecting the hierarchy.
         """
         result = obj_3d
-        result.extra['uv'] = [(random.uniform(0, 1), random.uniform(0, 1)) for v in result.mesh.vertices]
-        result.children = [self.map_3d_random(c) for c in result.children]
+        result.extra['uv'] = np.array([(random.uniform(0, 1), random.uniform(0, 1)) for v in result.mesh.vertices]).reshape(-1, 2)
+        result.children = [self.map_random(c) for c in result.children]
         return result
 
     def map_cubic(self, obj, offset=None, scale=None, split=True):
         """
+        Projects each face onto the axis plane most perpendicular to its normal.
+
         FIXME: Study and provide for when vertex should be duplicated (regarding UV and normals). Normals shall be calculated
         before UV mapping as vertex may need to be duplicated (although an adequate mapping would also reduce this)
         """
@@ -71,7 +112,7 @@ class DDDUVMapping():
         if scale is None: scale = (1, 1)
 
         result = obj.copy()
-        if result.mesh:
+        if result._mesh_read():
 
             '''
             # Inform/Avoid remapping (?)
@@ -80,112 +121,43 @@ class DDDUVMapping():
                 #raise DDDException("Object already has UV coordinates: %s" % result)
             '''
 
-            result.extra['uv'] = [None for idx, v in enumerate(result.mesh.vertices)]
-            #logger.debug("UV mapping object: %s", obj)
-            for face in result.mesh.faces:
-                v1 = result.mesh.vertices[face[1]] - result.mesh.vertices[face[0]]
-                v2 = result.mesh.vertices[face[2]] - result.mesh.vertices[face[0]]
-                v = np.cross(v1, v2)
-
-                vnorm = np.linalg.norm(v)
-                if vnorm == 0:
-                    logger.error("Invalid triangle (linear dependent, no normal): %s", obj)
-                else:
-                    v = v / vnorm
-
-                def setuv(face, idx, uv):
-                    uv = (uv[0] * scale[0] + offset[0], uv[1] * scale[1] + offset[1])
-                    if split and result.extra['uv'][idx] != None and (result.extra['uv'][idx] != uv):
-                        # FIXME: Study and provide for when vertex should be duplicated (regarding UV and normals). Normals shall be calculated
-                        # before UV mapping as vertex may need to be duplicated (although an adequate mapping would also reduce this)
-                        newidx = len(result.mesh.vertices)
-                        result.mesh.vertices = np.array(list(result.mesh.vertices) + [result.mesh.vertices[idx]])
-                        if face[0] == idx: face[0] = newidx
-                        if face[1] == idx: face[1] = newidx
-                        if face[2] == idx: face[2] = newidx
-                        result.extra['uv'].append(uv)
-                        #raise ValueError("Cannot map same vertex twice in cubic mapping.")
-                    else:
-                        result.extra['uv'][idx] = uv
-
-                if abs(v[0]) > abs(v[1]) and abs(v[0]) > abs(v[2]):
-                    # Normal along X, project onto YZ
-                    p0, p1, p2 = result.mesh.vertices[face[0]], result.mesh.vertices[face[1]], result.mesh.vertices[face[2]]
-                    setuv(face, face[0], (p0[1], p0[2]))
-                    setuv(face, face[1], (p1[1], p1[2]))
-                    setuv(face, face[2], (p2[1], p2[2]))
-                elif abs(v[1]) > abs(v[0]) and abs(v[1]) > abs(v[2]):
-                    p0, p1, p2 = result.mesh.vertices[face[0]], result.mesh.vertices[face[1]], result.mesh.vertices[face[2]]
-                    setuv(face, face[0], (p0[0], p0[2]))
-                    setuv(face, face[1], (p1[0], p1[2]))
-                    setuv(face, face[2], (p2[0], p2[2]))
-                else:
-                    p0, p1, p2 = result.mesh.vertices[face[0]], result.mesh.vertices[face[1]], result.mesh.vertices[face[2]]
-                    setuv(face, face[0], (p0[0], p0[1]))
-                    setuv(face, face[1], (p1[0], p1[1]))
-                    setuv(face, face[2], (p2[0], p2[1]))
+            vertices = np.asarray(result._mesh_read().vertices)
+            faces = np.asarray(result._mesh_read().faces)
+            normals = np.abs(self._face_normals(obj, vertices, faces))
+
+            # Normal along X, project onto YZ; along Y, project onto XZ; otherwise onto XY
+            along_x = (normals[:, 0] > normals[:, 1]) & (normals[:, 0] > normals[:, 2])
+            along_y = ~along_x & (normals[:, 1] > normals[:, 0]) & (normals[:, 1] > normals[:, 2])
+            axes = np.where(along_x[:, np.newaxis], [1, 2], np.where(along_y[:, np.newaxis], [0, 2], [0, 1]))
+
+            triangles = vertices[faces]
+            uvs = np.take_along_axis(triangles, axes[:, np.newaxis, :], axis=2)
+            self._assign_uvs(result, uvs, scale, offset, split)
 
         result.children = [self.map_cubic(c, offset, scale, split=split) for c in result.children]
         return result
 
     def map_spherical(self, obj, offset=None, scale=None, split=True):
         """
-        Uses a vertical cylinder centered on (0, 0).
+        Uses a sphere centered on (0, 0, 0).
 
+        As coordinates depend only on vertex positions, vertices are never split.
         TODO: "split" does not apply here, check and remove
-        TODO: use numpy for all vertices at once, see https://stackoverflow.com/questions/4116658/faster-numpy-cartesian-to-spherical-coordinate-conversion
         """
         if scale is None: scale = (1, 1)
         if offset is None: offset = (0, 0)
 
         result = obj.copy()
-        if result.mesh:
-
-            result.extra['uv'] = [None for idx, v in enumerate(result.mesh.vertices)]
-
-            #logger.debug("UV mapping object: %s", obj)
-            for face in result.mesh.faces:
-                v1 = result.mesh.vertices[face[1]] - result.mesh.vertices[face[0]]
-                v2 = result.mesh.vertices[face[2]] - result.mesh.vertices[face[0]]
-                v = np.cross(v1, v2)
-
-                vnorm = np.linalg.norm(v)
-                if vnorm == 0:
-                    logger.error("Invalid triangle (linear dependent, no normal): %s", obj)
-                else:
-                    v = v / vnorm
-
-                def setuv(face, idx, uv):
-                    uv = (uv[0] * scale[0] + offset[0], uv[1] * scale[1] + offset[1])
-                    if split and result.extra['uv'][idx] != None and (result.extra['uv'][idx] != uv):
-                        # FIXME: Study and provide for when vertex should be duplicated (regarding UV and normals). Normals shall be calculated
-                        # before UV mapping as vertex may need to be duplicated (although an adequate mapping would also reduce this)
-                        newidx = len(result.mesh.vertices)
-                        result.mesh.vertices = np.array(list(result.mesh.vertices) + [result.mesh.vertices[idx]])
-                        if face[0] == idx: face[0] = newidx
-                        if face[1] == idx: face[1] = newidx
-                        if face[2] == idx: face[2] = newidx
-                        result.extra['uv'].append(uv)
-                        #raise ValueError("Cannot map same vertex twice in cubic mapping.")
-                    else:
-                        result.extra['uv'][idx] = uv
-
-                # From: https://stackoverflow.com/questions/4116658/faster-numpy-cartesian-to-spherical-coordinate-conversion
-                def cart2sph(x,y,z):
-                    XsqPlusYsq = x**2 + y**2
-                    r = math.sqrt(XsqPlusYsq + z**2)               # r
-                    elev = math.atan2(z,math.sqrt(XsqPlusYsq))     # theta
-                    az = math.atan2(y,x)                           # phi
-                    return r, elev, az
-
-                # Map sphere
-                p0, p1, p2 = result.mesh.vertices[face[0]], result.mesh.vertices[face[1]], result.mesh.vertices[face[2]]
-                r0, theta0, phi0 = cart2sph(*p0)
-                r1, theta1, phi1 = cart2sph(*p1)
-                r2, theta2, phi2 = cart2sph(*p2)
-                setuv(face, face[0], (0.5 + (phi0 / (math.pi * 2)), 0.5 + theta0 / (math.pi * 1)))
-                setuv(face, face[1], (0.5 + (phi1 / (math.pi * 2)), 0.5 + theta1 / (math.pi * 1)))
-                setuv(face, face[2], (0.5 + (phi2 / (math.pi * 2)), 0.5 + theta2 / (math.pi * 1)))
+        if result._mesh_read():
+
+            # From: https://stackoverflow.com/questions/4116658/faster-numpy-cartesian-to-spherical-coordinate-conversion
+            vertices = np.asarray(result._mesh_read().vertices)
+            x, y, z = vertices[:, 0], vertices[:, 1], vertices[:, 2]
+            elev = np.arctan2(z, np.sqrt(x ** 2 + y ** 2))
+            az = np.arctan2(y, x)
+
+            uvs = np.column_stack([0.5 + az / (math.pi * 2), 0.5 + elev / math.pi])
+            result.extra['uv'] = uvs * scale + offset
 
         result.children = [self.map_cubic(c, offset, scale, split=split) for c in result.children]
         return result
@@ -198,49 +170,20 @@ class DDDUVMapping():
         if offset is None: offset = (0, 0)
 
         result = obj.copy()
-        if result.mesh:
-
-            result.extra['uv'] = [None for idx, v in enumerate(result.mesh.vertices)]
-            #logger.debug("UV mapping object: %s", obj)
-            for face in result.mesh.faces:
-                v1 = result.mesh.vertices[face[1]] - result.mesh.vertices[face[0]]
-                v2 = result.mesh.vertices[face[2]] - result.mesh.vertices[face[0]]
-                v = np.cross(v1, v2)
-
-                vnorm = np.linalg.norm(v)
-                if vnorm == 0:
-                    logger.error("Invalid triangle (linear dependent, no normal): %s", obj)
-                else:
-                    v = v / vnorm
-
-                def setuv(face, idx, uv):
-                    uv = (uv[0] * scale[0] + offset[0], uv[1] * scale[1] + offset[1])
-                    if split and result.extra['uv'][idx] != None and (result.extra['uv'][idx] != uv):
-                        # FIXME: Study and provide for when vertex should be duplicated (regarding UV and normals). Normals shall be calculated
-                        # before UV mapping as vertex may need to be duplicated (although an adequate mapping would also reduce this)
-                        newidx = len(result.mesh.vertices)
-                        result.mesh.vertices = np.array(list(result.mesh.vertices) + [result.mesh.vertices[idx]])
-                        if face[0] == idx: face[0] = newidx
-                        if face[1] == idx: face[1] = newidx
-                        if face[2] == idx: face[2] = newidx
-                        result.extra['uv'].append(uv)
-                        #raise ValueError("Cannot map same vertex twice in cubic mapping.")
-                    else:
-                        result.extra['uv'][idx] = uv
-
-                if abs(v[2]) > abs(v[0]) and abs(v[2]) > abs(v[1]):
-                    # Normal along Z, project onto X (caps)
-                    p0, p1, p2 = result.mesh.vertices[face[0]], result.mesh.vertices[face[1]], result.mesh.vertices[face[2]]
-                    setuv(face, face[0], (p0[0], p0[1]))
-                    setuv(face, face[1], (p1[0], p1[1]))
-                    setuv(face, face[2], (p2[0], p2[1]))
-                else:
-                    # Map cylinder
-                    p0, p1, p2 = result.mesh.vertices[face[0]], result.mesh.vertices[face[1]], result.mesh.vertices[face[2]]
-                    angle0, angle1, angle2 = math.atan2(p0[1], p0[0]), math.atan2(p1[1], p1[0]), math.atan2(p2[1], p2[0])
-                    setuv(face, face[0], (angle0 / (math.pi * 2), p0[2]))
-                    setuv(face, face[1], (angle1 / (math.pi * 2), p1[2]))
-                    setuv(face, face[2], (angle2 / (math.pi * 2), p2[2]))
+        if result._mesh_read():
+
+            vertices = np.asarray(result._mesh_read().vertices)
+            faces = np.asarray(result._mesh_read().faces)
+            normals = np.abs(self._face_normals(obj, vertices, faces))
+
+            # Normal along Z, project onto XY (caps), otherwise map cylinder
+            caps = (normals[:, 2] > normals[:, 0]) & (normals[:, 2] > normals[:, 1])
+
+            triangles = vertices[faces]
+            uvs = np.where(caps[:, np.newaxis, np.newaxis],
+                           triangles[:, :, [0, 1]],
+                           np.stack([np.arctan2(triangles[:, :, 1], triangles[:, :, 0]) / (math.pi * 2), triangles[:, :, 2]], axis=2))
+            self._assign_uvs(result, uvs, scale, offset, split)
 
         result.children = [self.map_cubic(c, offset, scale, split=split) for c in result.children]
         return result
@@ -310,35 +253,37 @@ def map_3d_from_2d(obj_3d, obj_2d):
     """
     Apply 2D UV coordinates to 3D shapes (using UV from closest point in 2D space).
     This method does not create a copy of objects.
-    """
-
-    def uv_apply_func(x, y, z, idx):
-        # Find nearest point in shape (or children), and return its height
-        closest_o, closest_d = obj_2d.closest(ddd.point([x, y]))
-        closest_uv = None
-        closest_distsqr = float('inf')
-        if closest_o.extra.get('uv', None):
-            for idx, v in enumerate(closest_o.geom.exterior.coords):
-                point_2d = [v[0], v[1], 0]
-                diff = [point_2d[0] - x, point_2d[1] - y]
-                distsqr = (diff[0] ** 2) + (diff[1] ** 2)
-                if (distsqr < closest_distsqr):
-                    closest_uv = closest_o.extra['uv'][idx]
-                    closest_distsqr = distsqr
-        else:
-            logger.error("Closest object has no UV mapping: %s (%s) (obj_2d=%s, obj_3d=%s)", closest_o, closest_o.extra.get('uv', None), obj_2d, obj_3d)
-            raise DDDException("Closest object has no UV mapping: %s (%s)" % (closest_o, closest_o.extra.get('uv', None)), ddd_obj=obj_3d)
-
-        if closest_uv is None:
-            logger.error("Error mapping 3D from 2D (3d=%s, 2d=%s %s %s)", obj_3d, obj_2d, obj_2d.geom, [x.geom for x in obj_2d.children])
-            raise DDDException("Could not map 3D from 2D (no closest vertex found): %s" % obj_3d, ddd_obj=obj_3d)
-
-        return closest_uv
-
-    result = obj_3d
-    if result.mesh:
-        result.extra['uv'] = [uv_apply_func(v[0], v[1], v[2], idx) for idx, v in enumerate(result.mesh.vertices)]
-    result.children = [map_3d_from_2d(c, obj_2d) for c in result.children]
-    return result
 
+    UV coordinates are taken from the exterior vertices of the 2D object and its children which have
+    UV coordinates. All 3D vertices are resolved with a nearest neighbour query on a KD-tree of those vertices.
+    """
 
+    points = []
+    uvs = []
+    pending = [obj_2d]
+    while pending:
+        o = pending.pop()
+        pending.extend(reversed(o.children))
+        o_uvs = o.extra.get('uv', None)
+        if o_uvs is None or len(o_uvs) == 0 or not o.geom or o.geom.type != "Polygon":
+            continue
+        coords = np.asarray(o.geom.exterior.coords)[:len(o_uvs), :2]
+        points.append(coords)
+        uvs.append(np.asarray(o_uvs, dtype=np.float64)[:len(coords), :2])
+
+    if not points:
+        logger.error("Error mapping 3D from 2D, no UV mapping found (3d=%s, 2d=%s %s %s)", obj_3d, obj_2d, obj_2d.geom, [x.geom for x in obj_2d.children])
+        raise DDDException("Could not map 3D from 2D (2D object has no UV mapping): %s" % obj_3d, ddd_obj=obj_3d)
+
+    tree = cKDTree(np.concatenate(points))
+    uvs = np.concatenate(uvs)
+
+    def map_3d_from_2d_tree(obj):
+        mesh = obj._mesh_read()
+        if mesh:
+            dists, indexes = tree.query(np.asarray(mesh.vertices)[:, :2])
+            obj.extra['uv'] = uvs[indexes]
+        obj.children = [map_3d_from_2d_tree(c) for c in obj.children]
+        return obj
+
+    return map_3d_from_2d_tree(obj_3d)
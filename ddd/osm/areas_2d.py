@@ -35,12 +35,16 @@ class Areas2DOSMBuilder():
         areas.sort(key=lambda a: a.get('ddd:area:area'))  # extra['ddd:area:area'])
         #areas.sort(key=lambda a: a.geom.area)  # extra['ddd:area:area'])
 
+        # Containers are resolved with a spatial join, and for each area the first (smallest) larger area is used
+        logger.info("Resolving 2D area containment (%d).", len(areas))
+        areas_idx = {id(a): idx for idx, a in enumerate(areas)}
+        containers = ddd.spatial.contains(areas, areas)
         for idx in range(len(areas)):
             area = areas[idx]
             #area_smaller = area.buffer(-0.05)
             #area.set('ddd:area:original', default=area)
-            for larger in areas[idx + 1:]:
-                if larger.contains(area):
+            for larger in containers[idx]:
+                if areas_idx[id(larger)] > idx:
                     #logger.info("Area %s contains %s.", larger, area)
                     area.extra['ddd:area:container'] = larger
                     larger.extra['ddd:area:contained'].append(area)
@@ -92,9 +96,11 @@ class Areas2DOSMBuilder():
         Unions a series of groups.
 
         This is used for generation of interways, as the resulting union interiors are the target areas.
+        All geometries are unioned at once (unary union mode). If some geometry cannot be unioned,
+        groups are cleaned and unioned one by one instead.
         """
         try:
-            union = groups.copy().union_replace()
+            union = groups.union(mode='unary')
             union = union.clean(eps=0.01)
         except TopologicalError as e:
             logger.debug("Error calculating safe union_safe (1/3): %s", e)
@@ -392,17 +398,19 @@ class Areas2DOSMBuilder():
         logger.info("Linking %d items to %d areas.", len(items_1d.children), len(areas_2d.children))
         # TODO: Link to building parts, inspect facade, etc.
 
-        #items_1d_query = STRtree(items_1d.)
+        items = [item for item, crop in zip(items_1d.children, ddd.spatial.contains([self.osm.area_crop2], items_1d)) if crop]
 
-        for item in items_1d.children:
-            if not self.osm.area_crop2.contains(item): continue
+        # Candidate areas are all descendants with geometry, the smallest one containing the item is used
+        areas = areas_2d.select(func=lambda a: a.geom and not a.geom.is_empty).children
+        containers = ddd.spatial.contains(areas, items, recurse=False)
+
+        for item, item_areas in zip(items, containers):
             # Find closest building
             #point = feature.copy(name="Point: %s" % (feature.extra.get('name', None)))
-            areas = areas_2d.select(func=lambda a: a.contains(item)).children
-            if areas:
-                areas.sort(key=lambda a: a.geom.area if a.geom else float("inf"))  # extra['ddd:area:area'])
-                #logger.debug("Assigning point feature to area: %s -> %s", item, areas[0])
-                item.set('ddd:area:container', areas[0])
+            if item_areas:
+                area = min(item_areas, key=lambda a: a.geom.area)
+                #logger.debug("Assigning point feature to area: %s -> %s", item, area)
+                item.set('ddd:area:container', area)
             else:
                 #logger.debug("Point feature with no container area: %s", item)
                 pass
@@ -0,0 +1,177 @@
+# ddd - DDD123
+# Library for simple scene modelling.
+# Jose Juan Montes and Contributors 2019-2021
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+
+from ddd.core import settings
+from ddd.core.cli import D1D2D3Bootstrap
+from ddd.core.command import DDDCommand
+from ddd.core.exception import DDDException
+from ddd.pipeline.pipeline import DDDPipeline
+
+
+# Get instance of logger for this module
+logger = logging.getLogger(__name__)
+
+
+# Pipeline tasks loaded once by each worker process (see _batch_worker_init)
+_batch_tasks = None
+
+
+def parse_xyztile_range(value):
+    """
+    Parses an XYZ tile or tile range in the form 'x,y,z', where x and y can be inclusive
+    ranges (eg. '1000-1010,2000-2005,17'). Returns a list of (x, y, z) tuples.
+    """
+    def parse_range(v):
+        if '-' in v:
+            vmin, vmax = v.split('-', 1)
+            return range(int(vmin), int(vmax) + 1)
+        return [int(v)]
+
+    try:
+        x, y, z = value.split(",")
+        return [(tx, ty, int(z)) for tx in parse_range(x) for ty in parse_range(y)]
+    except ValueError:
+        raise DDDException("Invalid XYZ tile or tile range (expected 'x,y,z' or 'x0-x1,y0-y1,z'): %s" % value)
+
+
+def _batch_worker_init(script):
+    """
+    Loads the pipeline definition once per worker process. Materials, the prefab catalog,
+    DEM tiles and parsed selectors are kept in the process and reused by all tiles it builds.
+    """
+    global _batch_tasks
+    pipeline = DDDPipeline(script)
+    _batch_tasks = pipeline.tasks
+
+
+def _batch_build(xyztile):
+    """
+    Builds a tile with the loaded pipeline. Returns a report dictionary.
+    """
+    x, y, z = xyztile
+
+    pipeline = DDDPipeline(name="DDD OSM Batch Build Pipeline")
+    pipeline.tasks = list(_batch_tasks)
+    pipeline.data['ddd:osm:area:xyztile'] = "%d,%d,%d" % (x, y, z)
+
+    report = {'tile': [x, y, z], 'status': None, 'seconds': None, 'output': None, 'error': None}
+
+    start_time = time.time()
+    try:
+        pipeline.run()
+        report['status'] = 'built'
+    except SystemExit as e:
+        # Pipelines exit early without error when the output already exists
+        report['status'] = 'skipped' if not e.code else 'failed'
+        if e.code:
+            report['error'] = "Pipeline exited with code: %s" % e.code
+    except Exception as e:
+        logger.error("Error building tile %s: %s", xyztile, e)
+        report['status'] = 'failed'
+        report['error'] = "%s\n%s" % (e, traceback.format_exc())
+
+    report['seconds'] = round(time.time() - start_time, 3)
+    report['output'] = pipeline.data.get('ddd:osm:output:filename', None)
+
+    return report
+
+
+class OSMBatchBuildCommand(DDDCommand):
+    """
+    Builds a list or range of XYZ tiles with a pipeline (eg. pipelines/osm/osm_build.py), using a
+    bounded pool of worker processes which load the pipeline and shared resources only once.
+
+    Tiles whose output already exists are skipped by the pipeline (unless --overwrite is used).
+    A report with the status and build time of each tile is written as JSON.
+    """
+
+    def parse_args(self, args):
+
+        parser = argparse.ArgumentParser()  # description='', usage = ''
+
+        parser.add_argument("script", type=str, help="pipeline to run for each tile")
+        parser.add_argument("tiles", type=str, nargs="*", help="XYZ tiles or ranges (eg. 1000,2000,17 or 1000-1010,2000-2005,17)")
+        parser.add_argument("--tiles-file", type=str, default=None, help="file with one XYZ tile or range per line")
+        parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+        parser.add_argument("--max-tiles-per-worker", type=int, default=None, help="restart worker processes after building this number of tiles")
+        parser.add_argument("--report", type=str, default=None, help="report file (default: ddd-batch-report.json in the working directory)")
+
+        args = parser.parse_args(args)
+
+        tiles_specs = list(args.tiles)
+        if args.tiles_file:
+            with open(args.tiles_file) as f:
+                tiles_specs.extend([l.strip() for l in f if l.strip() and not l.strip().startswith("#")])
+
+        self.tiles = []
+        for spec in tiles_specs:
+            for tile in parse_xyztile_range(spec):
+                if tile not in self.tiles:
+                    self.tiles.append(tile)
+
+        self.script = args.script
+        self.workers = args.workers if args.workers else os.cpu_count()
+        self.max_tiles_per_worker = args.max_tiles_per_worker
+        self.report_path = args.report if args.report else os.path.join(settings.DDD_WORKDIR, "ddd-batch-report.json")
+
+    def run(self):
+
+        logger.info("DDD123 OSM batch build: %d tiles, %d workers, pipeline: %s", len(self.tiles), self.workers, self.script)
+
+        if 'ddd:osm:area:xyztile' in D1D2D3Bootstrap.data:
+            raise DDDException("Property ddd:osm:area:xyztile cannot be used with batch builds (tiles are passed as arguments).")
+
+        self.start_date = datetime.datetime.now()
+        self.reports = []
+
+        if self.workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+            with context.Pool(self.workers, initializer=_batch_worker_init, initargs=(self.script, ),
+                              maxtasksperchild=self.max_tiles_per_worker) as pool:
+                for report in pool.imap_unordered(_batch_build, self.tiles):
+                    self.report_tile(report)
+        else:
+            _batch_worker_init(self.script)
+            for tile in self.tiles:
+                self.report_tile(_batch_build(tile))
+
+        self.report_save()
+
+        counts = {status: len([r for r in self.reports if r['status'] == status]) for status in ('built', 'skipped', 'failed')}
+        logger.info("Batch build finished: %d built, %d skipped, %d failed (report: %s)", counts['built'], counts['skipped'], counts['failed'], self.report_path)
+        for report in self.reports:
+            if report['status'] == 'failed':
+                logger.warn("Failed tile %s: %s", report['tile'], report['error'].split("\n")[0] if report['error'] else None)
+
+    def report_tile(self, report):
+        self.reports.append(report)
+        logger.info("Tile %s %s in %.1f s (%d/%d)", report['tile'], report['status'], report['seconds'], len(self.reports), len(self.tiles))
+        # Saved after each tile so the report is available if the batch is interrupted
+        self.report_save()
+
+    def report_save(self):
+        reports = sorted(self.reports, key=lambda r: (r['tile'][2], r['tile'][0], r['tile'][1]))
+        data = {'script': self.script,
+                'start_date': self.start_date.isoformat(),
+                'workers': self.workers,
+                'tiles_total': len(self.tiles),
+                'tiles_built': len([r for r in reports if r['status'] == 'built']),
+                'tiles_skipped': len([r for r in reports if r['status'] == 'skipped']),
+                'tiles_failed': len([r for r in reports if r['status'] == 'failed']),
+                'seconds_total': round(sum(r['seconds'] for r in reports), 3),
+                'tiles': reports}
+        report_dir = os.path.dirname(self.report_path)
+        if report_dir and not os.path.exists(report_dir):
+            os.makedirs(report_dir)
+        with open(self.report_path, "w") as f:
+            json.dump(data, f, indent=2)
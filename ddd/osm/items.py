@@ -8,7 +8,7 @@ import random
 
 import numpy as np
 
-from ddd.ddd import ddd
+from ddd.ddd import ddd, DDDPointSet
 from ddd.pack.sketchy import plants, urban, landscape, industrial, sports,\
     common
 from ddd.geo import terrain
@@ -290,12 +290,19 @@ class ItemsOSMBuilder():
         item_3d.name = 'Tree: %s' % item_2d.name
         return item_3d
 
-    def generate_item_3d_grass_blade(self, item_2d):
-
-        coords = item_2d.geom.coords[0]
+    def generate_item_3d_pointset(self, item_2d, instance_func):
+        """
+        Generates a 3D point set from a 2D point set whose types are item type names. Each type
+        is replaced by the catalog object referenced by the instance returned by `instance_func(type)`.
+        """
+        item_3d = item_2d.copy()
+        item_3d.types = [instance_func(t).ref for t in item_2d.types]
 
-        grass_type = item_2d.get('ddd:grass:type', random.choice(['default', 'dry']))
+        # TODO: Elevation shall come from pipeline
+        item_3d.extra['_height_mapping'] = 'terrain_geotiff_incline_elevation_apply'
+        return item_3d
 
+    def grass_blade_instance(self, grass_type):
         key = "grassblade" if grass_type == 'default' else ("grassblade-" + grass_type)
         material = ddd.mats.grass_blade if grass_type == 'default' else ddd.mats.grass_blade_dry
 
@@ -304,6 +311,17 @@ class ItemsOSMBuilder():
             item_3d = plants.grass_blade()
             item_3d = item_3d.material(material)
             item_3d = self.osm.catalog.add(key, item_3d)
+        return item_3d
+
+    def generate_item_3d_grass_blade(self, item_2d):
+
+        if isinstance(item_2d, DDDPointSet):
+            return self.generate_item_3d_pointset(item_2d, self.grass_blade_instance)
+
+        coords = item_2d.geom.coords[0]
+
+        grass_type = item_2d.get('ddd:grass:type', random.choice(['default', 'dry']))
+        item_3d = self.grass_blade_instance(grass_type)
 
         # TODO: Elevation shall come from pipeline
         item_3d.extra['_height_mapping'] = 'terrain_geotiff_incline_elevation_apply'
@@ -314,11 +332,7 @@ class ItemsOSMBuilder():
         #item_3d.name = 'Grass blade: %s' % item_2d.name
         return item_3d
 
-    def generate_item_3d_flowers(self, item_2d):
-
-        flowers_type = item_2d.get('ddd:flowers:type')
-
-        coords = item_2d.geom.coords[0]
+    def flowers_instance(self, flowers_type):
         key = "flowers-%s" % flowers_type
 
         item_3d = self.osm.catalog.instance(key)
@@ -330,6 +344,17 @@ class ItemsOSMBuilder():
                 material = ddd.mats.flowers_roses_blade
             item_3d = plants.flowers_blade(material)
             item_3d = self.osm.catalog.add(key, item_3d)
+        return item_3d
+
+    def generate_item_3d_flowers(self, item_2d):
+
+        if isinstance(item_2d, DDDPointSet):
+            return self.generate_item_3d_pointset(item_2d, self.flowers_instance)
+
+        flowers_type = item_2d.get('ddd:flowers:type')
+
+        coords = item_2d.geom.coords[0]
+        item_3d = self.flowers_instance(flowers_type)
 
         # TODO: Elevation shall come from pipeline
         item_3d.extra['_height_mapping'] = 'terrain_geotiff_incline_elevation_apply'
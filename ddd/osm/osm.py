@@ -50,7 +50,7 @@ class OSMBuilder():
 
     def __init__(self, features=None, area_filter=None, area_crop=None, osm_proj=None, ddd_proj=None):
 
-        self.catalog = PrefabCatalog()
+        self.catalog = PrefabCatalog.shared()
 
         self.items = ItemsOSMBuilder(self)
         self.items2 = AreaItemsOSMBuilder(self)
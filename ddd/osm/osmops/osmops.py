@@ -51,7 +51,7 @@ class OSMBuilderOps():
         left = (coords_p[0] + perpendicular_vec[0] * item_dist, coords_p[1] + perpendicular_vec[1] * item_dist)
 
         angle = math.atan2(dir_vec[1], dir_vec[0])
-        obj.geom.coords = right if obj.extra.get('osm:direction', 'forward') == 'forward' else left
+        obj.geom = geometry.Point(right if obj.extra.get('osm:direction', 'forward') == 'forward' else left)
         obj.extra['ddd:angle'] = (angle) if obj.extra.get('osm:direction', 'forward') == 'forward' else (angle + math.pi)
         #print (obj.extra)
 
@@ -84,62 +84,36 @@ class Ways1DOSMBuilder():
         for way in ways_1d.children:
             way.extra['ddd:connections'] = []
 
-        # Split ways on joins
-        vertex_cache = defaultdict(list)
-        for way in ways_1d.children:
-            start = way.geom.coords[0]
-            end = way.geom.coords[-1]
-            #for c in (start, end):
-            for c in list(way.geom.coords):
-                vertex_cache[c].append(way)
-
-        split = True
-        while split:
-            split = False
-            for way in ways_1d.children:
-                for way_idx, c in enumerate(way.geom.coords[1:-1]):
-                    # If vertex is shared (in cache and more than one feature uses it)
-                    if c in vertex_cache and len(vertex_cache[c]) > 1:
-                        split1, split2 = self.split_way_1d_vertex(ways_1d, way, c)
-                        if split1 and split2:
-                            for way_coords in (way.geom.coords[0], way.geom.coords[-1]):
-                                vertex_cache[way_coords].remove(way)
-                            for way_coords in (split1.geom.coords[0], split1.geom.coords[-1]):
-                                vertex_cache[way_coords].append(split1)
-                            for way_coords in (split2.geom.coords[0], split2.geom.coords[-1]):
-                                vertex_cache[way_coords].append(split2)
-                            split = True
-                        if split: break
-                if split: break
-        vertex_cache = None
+        # Vertex to ways adjacency (each way is listed once for each of its vertices at that coordinate)
+        ways_coords = [(way, list(way.geom.coords)) for way in ways_1d.children]
+        vertex_ways = defaultdict(list)
+        for way, coords in ways_coords:
+            for way_idx, c in enumerate(coords):
+                vertex_ways[c].append((way, way_idx))
+
+        # Split ways on joins (interior vertices shared with other ways, or repeated in the same way)
+        split_ways_coords = []
+        for way, coords in ways_coords:
+            split_ways_coords.extend(self.split_way_1d_shared(way, coords, vertex_ways))
+        ways_1d.children = [way for way, coords in split_ways_coords]
 
         logger.debug("Ways after splitting mid connections: %d", len(ways_1d.children))
 
-        # Assign item nodes
-        # TODO: this shall better come from osm node-names/relations directly, but supporting geojson is also nice
-        # TODO: Before or after splitting?
-        vertex_cache = defaultdict(list)
-        for way in ways_1d.children:
-            for c in list(way.geom.coords):
-                vertex_cache[c].append(way)
-
-
         # Find connections
         # TODO: this shall possibly come from OSM relations (or maybe not, or optional)
         logger.info("Resolving connections between ways (%d ways).", len(ways_1d.children))
-        vertex_cache = defaultdict(list)
-        for way in ways_1d.children:
-            # start = way.geom.coords[0]
-            # end = way.geom.coords[-1]
-            for way_idx, c in enumerate(way.geom.coords):
-                # cidx = "%.0f,%.0f" % (c[0], c[1])
-                cidx = c
-                vertex_cache[cidx].append(way)
-                for other in vertex_cache[cidx]:
-                    if other == way: continue
-                    # way.extra['ddd:connections'].append(WayConnection(other, way_idx, 0))
-                    self.connect_ways_1d(way, other)  # , way_idx)
-        vertex_cache = None
+        vertex_ways = defaultdict(list)
+        for way, coords in split_ways_coords:
+            for way_idx, c in enumerate(coords):
+                vertex_ways[c].append((way, way_idx))
+
+        for way, coords in split_ways_coords:
+            connections = way.extra['ddd:connections']
+            for way_idx, c in enumerate(coords):
+                for other, other_idx in vertex_ways[c]:
+                    if other is not way:
+                        connections.append(WayConnection(other, way_idx, other_idx))
+        vertex_ways = None
 
         # Find transitions between more than one layer (ie tunnel to bridge) and split
         for way in ways_1d.children:
@@ -395,7 +369,7 @@ class Ways1DOSMBuilder():
                 # logger.debug("  Distance: %.2f  Height: %.2f", l, h)
                 ncoords.append((pn[0], pn[1], h))
 
-            way.geom.coords = ncoords
+            way.geom = LineString(ncoords)
 
             # way.extra['height_start'] = height_start
             # way.extra['height_end'] = height_end
@@ -437,6 +411,37 @@ class Ways1DOSMBuilder():
 
         return height_apply_func
 
+    def split_way_1d_shared(self, way, coords, vertex_ways):
+        """
+        Splits a way (with the given coordinates) at all its interior vertices that are shared (appear more
+        than once in the `vertex_ways` adjacency, a map of coordinates to lists of (way, vertex index)).
+
+        Returns a list of (way, coordinates) tuples for the resulting ways (the way itself if it is not split).
+        """
+        split_idxs = []
+        part_start = 0
+        for way_idx in range(1, len(coords) - 1):
+            c = coords[way_idx]
+            # Vertices equal to the start of the current part cannot split it
+            if len(vertex_ways[c]) > 1 and c != coords[part_start]:
+                split_idxs.append(way_idx)
+                part_start = way_idx
+
+        if not split_idxs:
+            return [(way, coords)]
+
+        # logger.debug("Splitting %s at %s", way, split_idxs)
+
+        parts = []
+        for idx_start, idx_end in zip([0] + split_idxs, split_idxs + [len(coords) - 1]):
+            part_coords = coords[idx_start:idx_end + 1]
+            part = way.copy()
+            part.geom = LineString(part_coords)
+            part.extra['ddd:connections'] = []
+            parts.append((part, part_coords))
+
+        return parts
+
     def split_way_1d_vertex(self, ways_1d, way, v):
 
         coord_idx = way.vertex_index(v)
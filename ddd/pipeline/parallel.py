@@ -0,0 +1,240 @@
+# ddd - DDD123
+# Library for simple scene modelling.
+# Jose Juan Montes and Contributors 2019-2021
+
+import io
+import logging
+import multiprocessing
+import pickle
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from ddd.core.exception import DDDException
+from ddd.ddd import DDDObject, DDDInstance, DDDMaterial, DDDPointSet, ddd
+
+
+# Get instance of logger for this module
+logger = logging.getLogger(__name__)
+
+
+# State shared with worker processes (inherited when the worker pool is forked)
+_parallel_state = None
+
+
+class DDDSharedPickler(pickle.Pickler):
+    """
+    Pickler that serializes objects and materials which exist in both the parent process and the
+    forked worker processes as references (their id in the parent), so they are not copied and keep
+    their identity when results are sent back. Objects in `local_ids` are always serialized by value.
+    """
+
+    def __init__(self, file, shared, local_ids):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shared = shared
+        self.local_ids = local_ids
+
+    def persistent_id(self, obj):
+        if isinstance(obj, (DDDObject, DDDMaterial)):
+            obj_id = id(obj)
+            if obj_id in self.shared and obj_id not in self.local_ids and self.shared[obj_id] is obj:
+                return obj_id
+        return None
+
+
+class DDDSharedUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, shared):
+        super().__init__(file)
+        self.shared = shared
+
+    def persistent_load(self, pid):
+        return self.shared[pid]
+
+
+def shared_objects(root):
+    """
+    Returns a dictionary (id -> object) of nodes, instance references and materials reachable from the
+    given root and the materials collection.
+    """
+    shared = {id(mat): mat for mat in ddd.mats.__dict__.values() if isinstance(mat, DDDMaterial)}
+    pending = [root]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in shared:
+            continue
+        shared[id(obj)] = obj
+        if obj.mat is not None:
+            shared[id(obj.mat)] = obj.mat
+        if isinstance(obj, DDDInstance) and isinstance(obj.ref, DDDObject):
+            pending.append(obj.ref)
+        if isinstance(obj, DDDPointSet):
+            pending.extend([ref for ref in obj.types if isinstance(ref, DDDObject)])
+        pending.extend(obj.children)
+    return shared
+
+
+def _subtree_ids(objs):
+    result = set()
+    pending = list(objs)
+    while pending:
+        obj = pending.pop()
+        if isinstance(obj, DDDObject) and id(obj) not in result:
+            result.add(id(obj))
+            pending.extend(obj.children)
+    return result
+
+
+def _origins(value, shared):
+    """
+    Returns a list of (object, id) for the objects in a result (and their descendants) which are
+    the worker copies of objects of the parent process, so their state can be restored into the originals.
+    """
+    result = []
+    seen = set()
+    pending = list(value) if isinstance(value, list) else [value]
+    while pending:
+        obj = pending.pop()
+        if not isinstance(obj, DDDObject) or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if shared.get(id(obj)) is obj:
+            result.append((obj, id(obj)))
+        pending.extend(obj.children)
+    return result
+
+
+def _restore_origins(value, origins, shared):
+    """
+    Copies the state of the worker copies of objects (see _origins()) into the original objects, so
+    objects modified in place keep their identity (and references to them remain valid).
+    Returns the value with worker copies replaced by the originals.
+    """
+    originals = {id(obj): shared[obj_id] for obj, obj_id in origins}
+    for obj, obj_id in origins:
+        original = shared[obj_id]
+        state = dict(obj.__dict__)
+        state['children'] = [originals.get(id(c), c) for c in obj.children]
+        state.pop('_attr_index', None)
+        if '_attr_index' in original.__dict__:
+            state['_attr_index'] = original.__dict__['_attr_index']
+        original.__dict__.clear()
+        original.__dict__.update(state)
+
+    if isinstance(value, list):
+        return [originals.get(id(v), v) for v in value]
+    return originals.get(id(value), value)
+
+
+def _run_object(idx):
+    task, kwargs, objs, shared = _parallel_state
+    obj = objs[idx]
+    try:
+        result = task.apply(obj, kwargs)
+    except Exception as e:
+        return pickle.dumps(('error', (str(e), traceback.format_exc()), None))
+
+    if result is False:
+        return pickle.dumps(('removed', None, None))
+
+    # Objects modified in place are also sent back, as the worker only has a copy of them
+    value = obj if (result is None or result is obj) else result
+    local_ids = _subtree_ids([obj] + (value if isinstance(value, list) else [value]))
+
+    data = io.BytesIO()
+    DDDSharedPickler(data, shared, local_ids).dump(('kept' if value is obj else 'replaced', value, _origins(value, shared)))
+    return data.getvalue()
+
+
+def run_each_parallel(task, pipeline, kwargs, workers):
+    """
+    Runs a task function for each selected object using a pool of forked worker processes.
+
+    Objects are sent back to the parent process (see DDDSharedPickler), where the state of objects
+    modified in place is restored into the originals (which keep their identity), and replacements
+    and removals are applied as in sequential runs. Changes to other objects or to pipeline data done by the task function are lost.
+
+    Returns a tuple (selected, replaced, removed), or None if parallel execution is not available
+    (in which case the caller shall run the task sequentially).
+    """
+    global _parallel_state
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        logger.warn("Parallel task execution requires 'fork' process start method, running sequentially: %s", task)
+        return None
+    if task.recurse:
+        logger.warn("Parallel task execution is not supported for recursive tasks, running sequentially: %s", task)
+        return None
+
+    objs = pipeline.root.select(func=task.filter, selector=task.selector, path=task.path, recurse=False).children
+    if len(objs) < 2 or any(obj is pipeline.root for obj in objs):
+        return None
+
+    shared = shared_objects(pipeline.root)
+
+    results = [None] * len(objs)
+    _parallel_state = (task, kwargs, objs, shared)
+    try:
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            chunksize = max(1, len(objs) // (workers * 8))
+            for idx, data in enumerate(executor.map(_run_object, range(len(objs)), chunksize=chunksize)):
+                results[idx] = DDDSharedUnpickler(io.BytesIO(data), shared).load()
+    finally:
+        _parallel_state = None
+
+    for obj, (status, value, origins) in zip(objs, results):
+        if status == 'error':
+            message, worker_traceback = value
+            logger.error("Error running task %s on %s: %s\nWorker traceback:\n%s", task, obj, message, worker_traceback)
+            raise DDDException("Error running task %s on %s: %s" % (task, obj, message), ddd_obj=obj)
+
+    return _splice(pipeline.root, {id(obj): result for obj, result in zip(objs, results)}, shared)
+
+
+def _splice(root, results, shared):
+    """
+    Applies parallel results (id of original object -> (status, value, origins)) to the tree.
+    Objects kept (modified in place) remain in the tree, with the state of their worker copies.
+    """
+    selected = len(results)
+    replaced = 0
+    removed = 0
+
+    index = root._attr_index if (root._attr_index is not None and root._attr_index.root is root) else None
+
+    pending = [root]
+    while pending and results:
+        parent = pending.pop()
+        changed = False
+        children = []
+        to_add = []
+        for c in parent.children:
+            result = results.pop(id(c), None)
+            if result is None:
+                children.append(c)
+                pending.append(c)
+                continue
+
+            changed = True
+            status, value, origins = result
+            if index is not None:
+                index.remove_tree(c)
+            if origins:
+                value = _restore_origins(value, origins, shared)
+            if status == 'kept':
+                children.append(c)
+                if index is not None:
+                    index.add_tree(c, parent)
+            elif status == 'removed':
+                removed += 1
+            else:
+                replaced += 1
+                to_add.extend(value if isinstance(value, list) else [value])
+
+        if changed:
+            parent.children = children + to_add
+            if index is not None:
+                for c in to_add:
+                    index.add_tree(c, parent)
+
+    return (selected, replaced, removed)
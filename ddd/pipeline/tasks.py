@@ -13,6 +13,8 @@ from ddd.core.selectors.selector import DDDSelector
 from ddd.core.selectors.selector_ebnf import selector_ebnf
 from ddd.ddd import ddd
 from ddd.core.exception import DDDException
+from ddd.pipeline.parallel import run_each_parallel
+from ddd.util.common import parse_bool
 import datetime
 
 
@@ -35,6 +37,11 @@ class DDDTask(object):
     Init tasks are run initially.
 
     Caching tasks (cache=True) are then evaluated in reverse order.
+
+    Tasks that select objects (path, select or filter) can be run in parallel (parallel=True, or
+    workers=N) by a pool of worker processes. The task function receives a copy of each object,
+    and only changes to that object (or its replacement) are kept. The pipeline option
+    ddd:pipeline:parallel=false disables parallel execution.
     """
 
 
@@ -44,11 +51,13 @@ class DDDTask(object):
                  order=None, #parent=None, before=None, after=None,
                  log=None, recurse=False,
                  condition=False, cache=False, cache_override=False, init=False,
-                 params=None):
+                 params=None, parallel=False, workers=None):
 
         # Metrics
         self._run_seconds = None
         self._run_selected = None
+        self._run_replaced = None
+        self._run_removed = None
 
         self.name = name
 
@@ -71,12 +80,16 @@ class DDDTask(object):
         self.recurse = recurse
         self.replace = True
 
+        # Parallel execution (for tasks with path/select/filter), workers defaults to the number of CPUs
+        self.parallel = parallel or bool(workers)
+        self.workers = workers
+
 
         # Dictionary of parameters introduced by the task
         self.params = params
 
         try:
-            self.selector = DDDSelector(select) if select else None
+            self.selector = DDDSelector.cached(select) if select else None
         except Exception as e:
             logger.error("Invalid selector: %s", select)
             #raise DDDException("Invalid selector: %s", select)
@@ -99,16 +112,19 @@ class DDDTask(object):
     def __repr__(self):
         return "%s(%s-%s)" % (self.__class__.__name__, ".".join([str(n) for n in self._order_num]) if self._order_num else self.order, self.name)
 
-    def runlog(self, obj=None):
+    def runlog(self, obj=None, info=None):
+        info = info if info is not None else "obj=%s" % (obj, )
         if self.log in (True, False, None) :
-            logger.info("Running %s (obj=%s)", self, obj)
+            logger.info("Running %s (%s)", self, info)
         else:
-            logger.info("%s (task=%s, obj=%s)", self.log, self, obj)
+            logger.info("%s (task=%s, %s)", self.log, self, info)
 
     def run(self, pipeline):
 
         self._run_seconds = None
         self._run_selected = None
+        self._run_replaced = None
+        self._run_removed = None
 
         start_time = datetime.datetime.now()
 
@@ -152,6 +168,27 @@ class DDDTask(object):
 
         return result
 
+    def apply(self, o, kwargs):
+        """
+        Runs the task function for a selected object, returning its result (see DDDObject.select apply_func).
+        """
+        try:
+            func = self._funcargs[0]
+            if 'o' in kwargs: kwargs['o'] = o
+            if 'obj' in kwargs: kwargs['obj'] = o
+            result = func(**kwargs)
+            if self.replace:
+                return result
+            else:
+                if result or result is False:
+                    logger.error("Task function returned a replacement object or a delete (None), but task replace is set to False.")
+                    raise DDDException("Task function returned a replacement object or a delete (None), but task replace is set to False.")
+                return o
+
+        except Exception as e:
+            logger.error("Error running task %s on %s: %s", self, o, e)
+            raise DDDException("Error running task %s on %s: %s" % (self, o, e), ddd_obj=o)
+
     def run_each(self, pipeline):
 
         func = self._funcargs[0]
@@ -170,34 +207,33 @@ class DDDTask(object):
                 raise DDDException("Unknown argument in task parameter list: %s (task: %s)" % (arg, self))
 
         logger.debug("Select: func=%s selector=%s path=%s recurse=%s ", self.filter, self.selector, self.path, self.recurse)
-        objs = pipeline.root.select(func=self.filter, selector=self.selector, path=self.path, recurse=self.recurse)
-
-        #if self.log:
-        self.runlog(objs.count())
-        #else:
-        #    logger.debug("Running task %ws for %d objects.", self, objs.count())
 
         self._run_selected = 0
-        def task_select_apply(o):
-            self._run_selected += 1
-            try:
-                if 'o' in kwargs: kwargs['o'] = o
-                if 'obj' in kwargs: kwargs['obj'] = o
-                result = func(**kwargs)
-                if self.replace:
-                    return result
-                else:
-                    if result or result is False:
-                        logger.error("Task function returned a replacement object or a delete (None), but task replace is set to False.")
-                        raise DDDException("Task function returned a replacement object or a delete (None), but task replace is set to False.")
-                    return o
+        self._run_replaced = 0
+        self._run_removed = 0
 
-            except Exception as e:
-                logger.error("Error running task %s on %s: %s", self, o, e)
-                raise DDDException("Error running task %s on %s: %s" % (self, o, e), ddd_obj=o)
+        if self.parallel and parse_bool(pipeline.data.get('ddd:pipeline:parallel', True)):
+            workers = int(self.workers) if self.workers else os.cpu_count()
+            counts = run_each_parallel(self, pipeline, kwargs, workers)
+            if counts is not None:
+                self._run_selected, self._run_replaced, self._run_removed = counts
+                self.runlog(info="selected=%d, replaced=%d, removed=%d, workers=%d" % (self._run_selected, self._run_replaced, self._run_removed, workers))
+                return
 
+        def task_select_apply(o):
+            self._run_selected += 1
+            result = self.apply(o, kwargs)
+            if result is False:
+                self._run_removed += 1
+            elif result and result is not o:
+                self._run_replaced += 1
+            return result
+
+        # Selection and task application are done in a single pass
         pipeline.root.select(func=self.filter, selector=self.selector, path=self.path, recurse=self.recurse, apply_func=task_select_apply)
 
+        self.runlog(info="selected=%d, replaced=%d, removed=%d" % (self._run_selected, self._run_replaced, self._run_removed))
+
         '''
         for o in objs.children:
             #logger.debug("Running task %s for object: %s", self, o)
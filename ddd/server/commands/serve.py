@@ -226,6 +226,8 @@ class ServerServeCommand(DDDCommand):
 
             'run_seconds': t._run_seconds,
             'run_selected': t._run_selected,
+            'run_replaced': t._run_replaced,
+            'run_removed': t._run_removed,
         } for t in tasks_sorted]
 
         # Serialize and deserialize to ensure data is JSON serializable (converts objects to strings)
@@ -0,0 +1,95 @@
+# Jose Juan Montes 2019-2020
+
+"""
+Memory benchmark for DDD node operations. Reports peak resident memory (RSS) and time.
+
+Builds a synthetic scene with the copy-heavy operation chains used by the OSM pipelines
+(copy, material, translate/rotate, subtract, clean), or builds an OSM tile with the `ddd`
+tool if --xyztile is given (requires the OSM and DEM data configured for the pipeline,
+extra arguments are passed to `ddd`).
+
+Usage:
+
+    python memory_benchmark.py [num_items]
+    python memory_benchmark.py --xyztile 62358,48540,17 [--pipeline pipelines/osm/osm_build.py] [-- -c ddd.conf]
+
+Run the benchmark on different revisions to compare peak memory usage.
+"""
+
+import argparse
+import math
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from ddd.ddd import ddd
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def synthetic(num_items):
+
+    random.seed(0)
+
+    areas = ddd.group2(name="Areas")
+    for i in range(num_items):
+        area = ddd.regularpolygon(24, r=random.uniform(5, 20), name="Area %d" % i)
+        area = area.translate([random.uniform(0, 2000), random.uniform(0, 2000)])
+        area.set('osm:id', 'way-%d' % i)
+        areas.append(area)
+
+    # Copies of the whole tree, as pipeline stages keep originals around
+    originals = areas.copy()
+    areas = areas.material(ddd.mats.park)
+    holes = ddd.group2([ddd.point([random.uniform(0, 2000), random.uniform(0, 2000)]).buffer(3.0) for i in range(50)])
+    areas = areas.subtract(holes).clean(eps=0.01)
+
+    items = ddd.group3(name="Items")
+    tree = ddd.group3([ddd.cylinder(2.0, 0.2, resolution=2), ddd.sphere(r=1.5, subdivisions=2).translate([0, 0, 2.5])], name="Tree")
+    for i in range(num_items):
+        item = tree.copy()
+        item.children = [c.copy() for c in tree.children]
+        item = item.rotate([0, 0, random.uniform(0, math.pi * 2)]).translate([random.uniform(0, 2000), random.uniform(0, 2000), 0])
+        item = item.material(ddd.mats.terrain)
+        items.append(item)
+
+    items3 = ddd.group3([a.extrude(2.0) for a in areas.children[:num_items // 10]])
+
+    return (originals, areas, items, items3)
+
+
+def tile(script, xyztile, ddd_args):
+    """
+    Builds a tile in a child process. Returns the peak RSS of the child process.
+    """
+    cmd = ["ddd", script, "-o", "-p", "ddd:osm:area:xyztile=%s" % xyztile] + ddd_args
+    subprocess.run(cmd, check=True)
+    return peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("num_items", type=int, nargs="?", default=5000, help="number of items for the synthetic benchmark")
+parser.add_argument("--xyztile", type=str, default=None, help="build an OSM tile (x,y,z) instead of the synthetic scene")
+parser.add_argument("--pipeline", type=str, default="pipelines/osm/osm_build.py", help="pipeline used to build the tile")
+parser.add_argument("ddd_args", nargs=argparse.REMAINDER, help="extra arguments for ddd (after --)")
+args = parser.parse_args()
+
+start_time = time.perf_counter()
+
+if args.xyztile:
+    peak_rss = tile(args.pipeline, args.xyztile, [a for a in args.ddd_args if a != "--"])
+    name = "OSM tile %s" % args.xyztile
+else:
+    result = synthetic(args.num_items)
+    peak_rss = peak_rss_mb()
+    name = "Synthetic (%d items)" % args.num_items
+
+elapsed = time.perf_counter() - start_time
+
+print("%-40s peak RSS: %8.1f MB  time: %.2f s" % (name, peak_rss, elapsed))
@@ -0,0 +1,70 @@
+# Jose Juan Montes 2019-2020
+
+"""
+Micro-benchmark for DDD selectors. Builds a flat tree of nodes with OSM-like metadata
+and measures selector evaluation throughput (nodes per second).
+
+Usage: python selector_benchmark.py [num_nodes]
+"""
+
+import random
+import sys
+import time
+
+from ddd.ddd import ddd
+from ddd.core.selectors.selector import DDDSelector
+
+
+num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+repeats = 5
+
+random.seed(0)
+
+materials = [ddd.mats.asphalt, ddd.mats.grass, ddd.mats.park, ddd.mats.pavement, None]
+highways = ['primary', 'secondary', 'residential', 'footway', None]
+
+root = ddd.group2(name="Root")
+for i in range(num_nodes):
+    obj = ddd.point([i, 0], name="Node %d" % i)
+    obj.set('osm:id', 'node-%d' % i)
+    obj.set('ddd:layer', str(random.randint(0, 2)))
+    highway = random.choice(highways)
+    if highway:
+        obj.set('osm:highway', highway)
+    mat = random.choice(materials)
+    if mat:
+        obj = obj.material(mat)
+    root.append(obj)
+
+selectors = [
+    '["osm:highway" = "primary"]',
+    '["osm:highway"]',
+    '[!"osm:highway"]',
+    '["osm:highway" ~ "primary|secondary"]',
+    '["ddd:material" = "Grass"]["ddd:layer" = "0"]',
+    '["osm:highway" = "footway"]; ["ddd:material" = "Park"]',
+    '["geom:type" = "Point"]',
+]
+
+
+def benchmark(name, func):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        count = func()
+    elapsed = time.perf_counter() - start
+    print("%-56s %8d selected %12.0f nodes/s" % (name, count, num_nodes * repeats / elapsed))
+
+
+print("Selector evaluation (%d nodes, %d repeats)" % (num_nodes, repeats))
+for selector_str in selectors:
+    selector = DDDSelector(selector_str)
+    benchmark(selector_str, lambda: sum(1 for c in root.children if selector.evaluate(c)))
+
+print()
+print("Tree select() (parsed selector cache)")
+for selector_str in selectors:
+    benchmark(selector_str, lambda: root.select(selector=selector_str).count())
+
+print()
+print("Reference: metadata() dictionary per node")
+benchmark("metadata()", lambda: sum(1 for c in root.children if c.metadata("", "").get('osm:highway') == 'primary'))
@@ -0,0 +1,41 @@
+# Jose Juan Montes 2019-2020
+
+"""
+Benchmark for the union of many areas (DDDObject2.union()), as used for interways generation.
+
+Builds a set of randomly placed buffered ways and measures the time taken by the
+pairwise and the unary union modes, checking that both produce the same area.
+
+Usage: python union_benchmark.py [num_ways]
+"""
+
+import random
+import sys
+import time
+
+from ddd.ddd import ddd
+
+
+num_ways = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+random.seed(0)
+
+# Area size so that ways have a similar density regardless of their number
+size = (num_ways ** 0.5) * 50.0
+
+ways = ddd.group2(name="Ways")
+for i in range(num_ways):
+    x, y = random.uniform(0, size), random.uniform(0, size)
+    coords = [(x, y)]
+    for j in range(2):
+        coords.append((coords[-1][0] + random.uniform(-80, 80), coords[-1][1] + random.uniform(-80, 80)))
+    way = ddd.line(coords, name="Way %d" % i).buffer(random.uniform(2.0, 6.0))
+    ways.append(way)
+
+print("Ways: %d (area %.0fx%.0f)" % (len(ways.children), size, size))
+
+for mode in ('pairwise', 'unary'):
+    start_time = time.perf_counter()
+    union = ways.union(mode=mode)
+    elapsed = time.perf_counter() - start_time
+    print("Union (%s): area: %.2f  time: %.2f s" % (mode, union.geom.area, elapsed))
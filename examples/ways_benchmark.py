@@ -0,0 +1,43 @@
+# Jose Juan Montes 2019-2020
+
+"""
+Benchmark for way splitting and connection resolution (Ways1DOSMBuilder.split_ways_1d()).
+
+Builds a synthetic street grid where every way spans two blocks, so every way has
+a junction in its middle vertex and has to be split, and measures the time taken.
+
+Usage: python ways_benchmark.py [num_ways]
+"""
+
+import math
+import random
+import sys
+import time
+
+from ddd.ddd import ddd
+from ddd.osm.ways_1d import Ways1DOSMBuilder
+
+
+num_ways = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+random.seed(0)
+
+# Grid size so that the grid has (approximately) the requested number of ways
+size = int(math.ceil(math.sqrt(num_ways))) + 1
+
+ways = ddd.group2(name="Ways")
+for i in range(size):
+    for j in range(0, size - 2, 2):
+        for coords in ([(j, i), (j + 1, i), (j + 2, i)], [(i, j), (i, j + 1), (i, j + 2)]):
+            way = ddd.line([(x * 100.0, y * 100.0) for x, y in coords], name="Way %d" % len(ways.children))
+            way.set('osm:layer', random.choice(['0', '0', '0', '1']))
+            ways.append(way)
+
+print("Ways: %d (grid %dx%d)" % (len(ways.children), size, size))
+
+start_time = time.perf_counter()
+Ways1DOSMBuilder(None).split_ways_1d(ways)
+elapsed = time.perf_counter() - start_time
+
+connections = sum(len(way.get('ddd:connections')) for way in ways.children)
+print("Split ways: %d  connections: %d  time: %.2f s" % (len(ways.children), connections, elapsed))
@@ -8,6 +8,7 @@ from ddd.core.exception import DDDException
 import random
 import sys
 import math
+from shapely.geometry.polygon import LinearRing
 from shapely.ops import linemerge
 from ddd.ops import filters, uvmapping
 
@@ -156,7 +157,7 @@ def solids_borders(root, pipeline, obj):
     angles_floor2 = [-math.pi / 4 * 4, -math.pi / 4 * 3]
 
     polygon = obj.geom.exterior
-    if polygon.is_ccw: polygon.coords = reversed(list(polygon.coords))
+    if polygon.is_ccw: polygon = LinearRing(reversed(list(polygon.coords)))
     segments = zip(polygon.coords, polygon.coords[1:] + polygon.coords[:1])
     for a, b in segments:
         angle = math.atan2(b[1] - a[1], b[0] - a[0])
@@ -431,6 +431,6 @@ def outside_items_remove(root, pipeline, obj):
     item = ddd.snap.project(item, obj)
     item.extra['ddd:angle'] = item.extra['ddd:angle'] + math.pi / 2
     item.extra['godot:instance'] = "res://scenes/items/lamps/LampGrid.tscn"
-    item.geom.coords = [p[0], p[1]]
+    item.geom = ddd.point([p[0], p[1]]).geom
     '''
 
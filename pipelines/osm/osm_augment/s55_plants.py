@@ -7,7 +7,9 @@ from ddd.osm import osm
 from ddd.pipeline.decorators import dddtask
 from ddd.ddd import ddd
 from ddd.util.dddrandom import weighted_choice
+from ddd.math.noise import pnoise2
 import random
+import numpy as np
 import noise
 from ddd.util.common import parse_bool
 from ddd.core.exception import DDDException
@@ -23,18 +25,23 @@ def osm_augment_plants_generate_grass_blades(obj, osm, root):
     blade_density_m2 = 1.0 / 20.0
     num_blades = int((obj.area() * blade_density_m2))
 
-    def filter_func_noise(coords):
-        val = noise.pnoise2(coords[0], coords[1], octaves=2, persistence=0.5, lacunarity=2, repeatx=1024, repeaty=1024, base=0)
-        return (val > random.uniform(-0.5, 0.5))
+    def filter_func_noise(points):
+        thresholds = np.array([random.uniform(-0.5, 0.5) for _ in range(len(points))])
+        return pnoise2(points[:, 0], points[:, 1], octaves=2, persistence=0.5, lacunarity=2, repeatx=1024, repeaty=1024, base=0) > thresholds
 
-    blades = ddd.group2(name='Grass Blades: %s' % obj.name)
-    for p in obj.random_points(num_points=num_blades, filter_func=filter_func_noise):
-        blade = ddd.point(p, name="Grass Blade")
-        #blade.extra['ddd:aug:status'] = 'added'
-        blade.extra['ddd:item'] = 'grass_blade'  # TODO: Change to DDD
-        blades.append(blade)
+    points = obj.random_points(num_points=num_blades, filter_func=filter_func_noise, filter_vectorized=True)
+    if not points:
+        return
 
-    root.find("/ItemsNodes").append(blades.children)
+    # Blades are added as a single point set (types are grass types)
+    rng = np.random.default_rng(random.getrandbits(32))
+    blades = ddd.pointset(points, angles=rng.uniform(0, math.pi * 2, len(points)),
+                          type_ids=rng.integers(0, 2, len(points)), types=['default', 'dry'],
+                          name='Grass Blades: %s' % obj.name)
+    #blades.extra['ddd:aug:status'] = 'added'
+    blades.extra['ddd:item'] = 'grass_blade'  # TODO: Change to DDD
+
+    root.find("/ItemsNodes").append(blades)
 
 
 @dddtask(path="/Areas/*", select='["osm:leisure" ~ "garden"]')
@@ -42,19 +49,23 @@ def osm_augment_plants_generate_flowers(obj, osm, root):
     blade_density_m2 = 1.0 / 20.0
     num_blades = int((obj.area() * blade_density_m2))
 
-    def filter_func_noise(coords):
-        val = noise.pnoise2(coords[0], coords[1], octaves=2, persistence=0.5, lacunarity=2, repeatx=1024, repeaty=1024, base=0)
-        return (val > random.uniform(-0.5, 0.5))
+    def filter_func_noise(points):
+        thresholds = np.array([random.uniform(-0.5, 0.5) for _ in range(len(points))])
+        return pnoise2(points[:, 0], points[:, 1], octaves=2, persistence=0.5, lacunarity=2, repeatx=1024, repeaty=1024, base=0) > thresholds
+
+    points = obj.random_points(num_points=num_blades, filter_func=filter_func_noise, filter_vectorized=True)
+    if not points:
+        return
 
-    blades = ddd.group2(name='Flowers: %s' % obj.name)
-    for p in obj.random_points(num_points=num_blades, filter_func=filter_func_noise):
-        blade = ddd.point(p, name="Flowers")
-        #blade.extra['ddd:aug:status'] = 'added'
-        blade.extra['ddd:item'] = 'flowers'
-        blade.extra['ddd:flowers:type'] = random.choice(('blue', 'roses'))
-        blades.append(blade)
+    # Flowers are added as a single point set (types are flowers types)
+    rng = np.random.default_rng(random.getrandbits(32))
+    blades = ddd.pointset(points, angles=rng.uniform(0, math.pi * 2, len(points)),
+                          type_ids=rng.integers(0, 2, len(points)), types=['blue', 'roses'],
+                          name='Flowers: %s' % obj.name)
+    #blades.extra['ddd:aug:status'] = 'added'
+    blades.extra['ddd:item'] = 'flowers'
 
-    root.find("/ItemsNodes").append(blades.children)
+    root.find("/ItemsNodes").append(blades)
 
 
 
@@ -7,8 +7,9 @@ from ddd.osm import osm
 from ddd.pipeline.decorators import dddtask
 from ddd.ddd import ddd
 from ddd.util.dddrandom import weighted_choice
+from ddd.math.noise import pnoise2
 import random
-import noise
+import numpy as np
 from ddd.util import dddrandom
 
 
@@ -31,12 +32,12 @@ def osm_augment_rocks_generate_rocks(obj, osm, root):
     item_density_m2 = 1.0 / 1000.0
     num_items = int((obj.area() * item_density_m2))
 
-    def filter_func_noise(coords):
-        val = noise.pnoise2(coords[0], coords[1], octaves=2, persistence=0.5, lacunarity=2, repeatx=1024, repeaty=1024, base=0)
-        return (val > random.uniform(-0.5, 0.5))
+    def filter_func_noise(points):
+        thresholds = np.array([random.uniform(-0.5, 0.5) for _ in range(len(points))])
+        return pnoise2(points[:, 0], points[:, 1], octaves=2, persistence=0.5, lacunarity=2, repeatx=1024, repeaty=1024, base=0) > thresholds
 
     items = ddd.group2(name='Rocks: %s' % obj.name)
-    for p in obj.random_points(num_points=num_items, filter_func=filter_func_noise):
+    for p in obj.random_points(num_points=num_items, filter_func=filter_func_noise, filter_vectorized=True):
         item = ddd.point(p, name="Rock")
         #item.extra['ddd:aug:status'] = 'added'
         item.extra['ddd:item'] = 'natural_rock'
@@ -57,23 +57,51 @@ def osm_crop_buildings(obj, osm, root, logger):
 def osm_crop_apply(obj, osm, root, logger):
     pass
 
-@dddtask(select='["ddd:crop" = "area"]')
-def osm_crop_apply_area(obj, osm, root, logger):
-    obj.extra['ddd:crop:original'] = obj.copy()
-    obj = obj.intersection(osm.area_crop2)
-    return obj
-
-@dddtask(select='["ddd:crop" = "centroid"]')
-def osm_crop_apply_centroid(obj, osm, root, logger):
-    try:
-        point = obj.centroid()
-    except DDDException as e:
-        logger.warn("Could not find centroid for cropping for: %s", obj)
-        return False
-
-    contained = osm.area_crop2.contains(point)
-    if not contained:
-        return False
+@dddtask()
+def osm_crop_apply_area(pipeline, osm, root, logger):
+    """
+    Crops objects (ddd:crop = area) to the crop area. All objects are classified against the crop area
+    at once, and only geometries that cross its boundary are intersected.
+    """
+    objs = root.select(selector='["ddd:crop" = "area"]', recurse=False).children
+    cropped, counts = ddd.spatial.crop(objs, osm.area_crop2)
+    logger.info("Cropped %d objects (geometries inside: %d, outside: %d, clipped: %d).", len(objs), counts['inside'], counts['outside'], counts['boundary'])
+
+    cropped_objs = {id(obj): obj_cropped for obj, obj_cropped in zip(objs, cropped)}
+
+    def osm_crop_apply_area_obj(obj):
+        obj_cropped = cropped_objs[id(obj)]
+        if obj_cropped is None:
+            return False
+        obj_cropped.extra['ddd:crop:original'] = obj.copy()
+        return obj_cropped
+
+    root.select(func=lambda o: id(o) in cropped_objs, recurse=False, apply_func=osm_crop_apply_area_obj)
+
+@dddtask()
+def osm_crop_apply_centroid(pipeline, osm, root, logger):
+    """
+    Removes objects (ddd:crop = centroid) whose centroid is not contained in the crop area.
+    """
+    objs = root.select(selector='["ddd:crop" = "centroid"]', recurse=False).children
+
+    removed = set()
+    centroid_objs = []
+    centroids = []
+    for obj in objs:
+        try:
+            centroids.append(obj.centroid())
+            centroid_objs.append(obj)
+        except DDDException as e:
+            logger.warn("Could not find centroid for cropping for: %s", obj)
+            removed.add(id(obj))
+
+    for obj, containers in zip(centroid_objs, ddd.spatial.contains([osm.area_crop2], centroids)):
+        if not containers:
+            removed.add(id(obj))
+
+    logger.info("Cropped %d objects by centroid (removed: %d).", len(objs), len(removed))
+    root.select(func=lambda o: id(o) in removed, recurse=False, apply_func=lambda o: False)
 
 
 @dddtask()
@@ -190,17 +190,37 @@ def osm_positioning_apply(pipeline, osm, root, logger):
     """Apply positioning tagging (ddd:positioning)."""
     pass
 
-@dddtask(order="50.50.50.10.+", select='["ddd:positioning:type" = "snap-project"]')
-def osm_positioning_apply_snap_project(obj, pipeline, osm, root, logger):
-    obj = ddd.snap.project(obj, pipeline.data[obj.extra['ddd:positioning:ref']], penetrate=obj.extra.get('ddd:positioning:penetrate', None))
-    return obj
-
-@dddtask(order="50.50.50.10.+", select='["ddd:positioning:type" = "orient-project"]')
-def osm_positioning_apply_orient_project(obj, pipeline, osm, root, logger):
-    if obj.extra.get('ddd:angle', None) is None:
-        projected_point = ddd.snap.project(obj, pipeline.data[obj.extra['ddd:positioning:ref']], penetrate=obj.extra.get('ddd:positioning:penetrate', None))
+@dddtask(order="50.50.50.10.+", log=True)
+def osm_positioning_apply_project(pipeline, osm, root, logger):
+    """
+    Applies snap-project and orient-project positioning. Items are projected in one batch per
+    reference layer (ddd:positioning:ref).
+    """
+
+    # Orient-project items are only projected if they don't have an angle already
+    objs = root.select(selector='["ddd:positioning:type" = "snap-project"]', recurse=False).children
+    objs.extend([obj for obj in root.select(selector='["ddd:positioning:type" = "orient-project"]', recurse=False).children
+                 if obj.extra.get('ddd:angle', None) is None])
+
+    objs_by_ref = {}
+    for obj in objs:
+        objs_by_ref.setdefault(obj.extra['ddd:positioning:ref'], []).append(obj)
+
+    projected = {}
+    for ref, ref_objs in objs_by_ref.items():
+        logger.info("Projecting %d items onto: %s", len(ref_objs), ref)
+        penetrate = [obj.extra.get('ddd:positioning:penetrate', None) for obj in ref_objs]
+        for obj, projected_point in zip(ref_objs, ddd.snap.project_batch(ref_objs, pipeline.data[ref], penetrate=penetrate)):
+            projected[id(obj)] = projected_point
+
+    def osm_positioning_apply_project_obj(obj):
+        projected_point = projected[id(obj)]
+        if obj.extra['ddd:positioning:type'] == 'snap-project':
+            return projected_point
         obj.extra['ddd:angle'] = projected_point.extra['ddd:angle']
-    return obj
+        return obj
+
+    root.select(func=lambda o: id(o) in projected, recurse=False, apply_func=osm_positioning_apply_project_obj)
 
 '''
 @dddtask(order="50.50.50.50.+", select='["ddd:positioning:validate:ref"]')
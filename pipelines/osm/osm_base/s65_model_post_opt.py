@@ -5,7 +5,7 @@
 
 import numpy as np
 
-from ddd.ddd import ddd
+from ddd.ddd import ddd, DDDInstance
 from ddd.pipeline.decorators import dddtask
 from ddd.geo import terrain
 from ddd.core.exception import DDDException
@@ -84,50 +84,63 @@ def osm_model_combine_materials(osm, root, pipeline):
     ddd.meshops.batch_empty(root.find("/Ways"))
 
 
-@dddtask(order="65.45")  # [!"intersection"]
-def osm_models_instances_buffers_buildings(pipeline, osm, root, logger):
+def instances_buffers(root, path, keys, min_count, logger):
     """
-    Generates geometry instancing buffers for repeated DDDInstance objects in buildings.
+    Replaces repeated DDDInstance objects (children of the given path) with instance buffers: a copy of
+    the first instance with the instance matrices of all of them in 'ddd:instance:buffer:matrices'.
+
+    Instances are grouped by 'ddd:instance:key'. The given keys are always replaced, other keys
+    are replaced if they are used at least `min_count` times (if `min_count` is not None).
     """
-    keys = ('building-window',)
+    groups = {}
+    for instance in root.select(path=path + "/*", func=lambda o: isinstance(o, DDDInstance)).children:
+        key = instance.get('ddd:instance:key', None)
+        if key is None or 'ddd:instance:buffer:matrices' in instance.extra:
+            continue
+        if key not in groups:
+            groups[key] = []
+        groups[key].append(instance)
+
+    removed = set()
+    for key, instances in groups.items():
 
-    for key in keys:
-        instances = root.select(path="/Buildings/*", selector='["ddd:instance:key" = "%s"]' % key)
+        if key not in keys and (min_count is None or len(instances) < min_count):
+            continue
 
-        if len(instances.children) > 0:
-            logger.info("Replacing %d building instances (%s) with a buffer.", len(instances.children), key)
-            buffer_matrices = np.zeros([len(instances.children) * 16, ])
+        logger.info("Replacing %d instances (%s) in %s with a buffer.", len(instances), key, path)
+        buffer_matrices = np.array([instance.transform.to_matrix().transpose().flatten() for instance in instances]).flatten()
 
-            for idx, instance in enumerate(instances.children):
-                buffer_matrices[idx * 16:idx * 16 + 16] = instance.transform.to_matrix().transpose().flatten()
+        instance_buffer = instances[0].copy()
+        instance_buffer.set('ddd:instance:buffer:matrices', buffer_matrices)
 
-            instance_buffer = instances.children[0].copy()
-            instance_buffer.set('ddd:instance:buffer:matrices', list(buffer_matrices))
+        removed.update(id(instance) for instance in instances)
+        root.find(path).append(instance_buffer)
+
+    if removed:
+        root.select_remove(path=path + "/*", func=lambda o: id(o) in removed)
+
+
+@dddtask(order="65.45")  # [!"intersection"]
+def osm_models_instances_buffers_buildings(pipeline, osm, root, logger):
+    """
+    Generates geometry instancing buffers for repeated DDDInstance objects in buildings.
 
-            root.select_remove(path="/Buildings/*", selector='["ddd:instance:key" = "%s"]' % key)
-            root.find("/Buildings").append(instance_buffer)
+    Besides the listed keys, instances used at least 'ddd:osm:model:instances_buffers:min_count'
+    times are also replaced by buffers (disabled if not set).
+    """
+    keys = ('building-window',)
+    min_count = pipeline.data.get('ddd:osm:model:instances_buffers:min_count', None)
+    instances_buffers(root, "/Buildings", keys, int(min_count) if min_count else None, logger)
 
 @dddtask()  # [!"intersection"]
 def osm_models_instances_buffers_items(pipeline, osm, root, logger):
     """
     Generates geometry instancing buffers for repeated scenery DDDInstance objects.
+
+    Besides the listed keys, instances used at least 'ddd:osm:model:instances_buffers:min_count'
+    times are also replaced by buffers (disabled if not set).
     """
     keys = ('grassblade', 'grassblade-dry')
-
-    for key in keys:
-        instances = root.select(path="/Items3/*", selector='["ddd:instance:key" = "%s"]' % key)
-
-        if len(instances.children) > 0:
-            logger.info("Replacing %d items instances (%s) with a buffer.", len(instances.children), key)
-            buffer_matrices = np.zeros([len(instances.children) * 16, ])
-
-            for idx, instance in enumerate(instances.children):
-                buffer_matrices[idx * 16:idx * 16 + 16] = instance.transform.to_matrix().transpose().flatten()
-
-            instance_buffer = instances.children[0].copy()
-            instance_buffer.set('ddd:instance:buffer:matrices', list(buffer_matrices))
-
-            root.select_remove(path="/Items3/*", selector='["ddd:instance:key" = "%s"]' % key)
-            root.find("/Items3").append(instance_buffer)
-
+    min_count = pipeline.data.get('ddd:osm:model:instances_buffers:min_count', None)
+    instances_buffers(root, "/Items3", keys, int(min_count) if min_count else None, logger)
 
@@ -14,6 +14,7 @@ from ddd.osm import osm
 from ddd.osm.osm import project_coordinates
 from ddd.pipeline.decorators import dddtask
 from ddd.geo.elevation import ElevationModel
+from ddd.util.common import parse_bool
 from PIL import Image
 import math
 
@@ -37,33 +38,16 @@ def osm_terrain_export_heightmap(root, osm, pipeline, logger):
     wgs84_max = terrain.transform_ddd_to_geo(osm.ddd_proj, ddd_bounds[2:])
     wgs84_bounds = wgs84_min + wgs84_max
 
-    heightmap_size = pipeline.data.get('ddd:terrain:heightmap:size', 128)
+    heightmap_size = int(pipeline.data.get('ddd:terrain:heightmap:size', 128))
 
     logger.info("Generating heightmap for area: ddd_bounds=%s, wgs84_bounds=%s, size=%s", ddd_bounds, wgs84_bounds, heightmap_size)
 
     #height_matrix = elevation.dem.area(wgs84_bounds)
     #print(height_matrix)
 
-    water = root.select(path="/Areas", selector='["ddd:area:type" = "sea"]["ddd:crop:original"]')
-
-    # Interpolate over DDD coordinates and resolve height
-    height_matrix = np.zeros([heightmap_size, heightmap_size])
-    for xi, x in enumerate(np.linspace(ddd_bounds[0], ddd_bounds[2], heightmap_size, endpoint=True)):
-        for yi, y in enumerate(reversed(np.linspace(ddd_bounds[1], ddd_bounds[3], heightmap_size, endpoint=True))):
-            wgs84_point = terrain.transform_ddd_to_geo(osm.ddd_proj, [x, y]) # Arbitrary offset tests
-            height = elevation.value(wgs84_point)
-            if height < 0: height = 0
-
-            # Temporarily enhance with areas (ultimately, this is needed for much more, maybe comming from elevation-plus engine)
-            # At least use spatial partitioning to find where the point lies
-            '''
-            dddp = ddd.point([x, y])
-            for c in water.children:
-                if c.get('ddd:crop:original').intersects(dddp):
-                    height = 0
-            '''
-
-            height_matrix[yi, xi] = height
+    # Resolve height over DDD coordinates (the whole grid is projected and sampled at once)
+    height_matrix = terrain.terrain_geotiff_elevation_grid(ddd_bounds, heightmap_size, osm.ddd_proj)
+    height_matrix = np.maximum(height_matrix, 0)
 
     height_max = np.max(height_matrix)
     height_min = np.min(height_matrix)
@@ -86,95 +70,93 @@ def osm_terrain_export_heightmap(root, osm, pipeline, logger):
     im.save(pipeline.data['filenamebase'] + ".hillshade.png", "PNG")
     '''
 
-
-    '''
-    # Calculate gradient
-    gradient_diff = 0.1
-    #gradient_matrix = np.gradient(height_matrix)
-    gradient_matrix = np.zeros([heightmap_size, heightmap_size, 2])
-    for xi, x in enumerate(np.linspace(ddd_bounds[0], ddd_bounds[2], heightmap_size, endpoint=True)):
-        for yi, y in enumerate(reversed(np.linspace(ddd_bounds[1], ddd_bounds[3], heightmap_size, endpoint=True))):
-
-            if (height_matrix[yi, xi] == 0):  # water
-                gradient_matrix[yi, xi, 0] = 0
-                gradient_matrix[yi, xi, 1] = 0
-                continue
-
-            wgs84_point_x0 = terrain.transform_ddd_to_geo(osm.ddd_proj, [x - gradient_diff, y])
-            wgs84_point_x1 = terrain.transform_ddd_to_geo(osm.ddd_proj, [x + gradient_diff, y])
-            wgs84_point_y0 = terrain.transform_ddd_to_geo(osm.ddd_proj, [x, y - gradient_diff])
-            wgs84_point_y1 = terrain.transform_ddd_to_geo(osm.ddd_proj, [x, y + gradient_diff])
-
-            height_x0 = elevation.value(wgs84_point_x0)
-            height_x1 = elevation.value(wgs84_point_x1)
-            height_y0 = elevation.value(wgs84_point_y0)
-            height_y1 = elevation.value(wgs84_point_y1)
-
-            grad_x = (height_x1 - height_x0) / (gradient_diff * 2.0)
-            grad_y = -(height_y1 - height_y0) / (gradient_diff * 2.0)  # DDD CRS is positive Y north/up
-
-            gradient_matrix[yi, xi, 0] = grad_x
-            gradient_matrix[yi, xi, 1] = grad_y
-
-    #print(gradient_matrix)
-
-    # Encode heightmap
-    # R,G = height
-    # B = normals
-    # A = holes
-    '''
-
     heightmap_offset = height_min
     heightmap_range = height_max - height_min
     heightmap_quantization = 65535
 
-    '''
-    encoded_heightmap = np.zeros((heightmap_size, heightmap_size, 4))
-    for xi in range(heightmap_size):
-        for yi in range(heightmap_size):
-            # Encode height
-            height = height_matrix[yi, xi]
-            normalizedHeight = (height - heightmap_offset) / heightmap_range;
-            quantizedHeight = int(normalizedHeight * heightmap_quantization);
-
-            encoded_heightmap[yi, xi, 0] =  quantizedHeight & 0x00ff
-            encoded_heightmap[yi, xi, 1] = (quantizedHeight & 0xff00) >> 8
-
-            # Encode normal
-            gradient_x = gradient_matrix[yi, xi, 0]
-            normal_x = math.cos(math.pi / 2 + math.atan(gradient_x))
-            gradient_y = gradient_matrix[yi, xi, 1]
-            normal_y = math.cos(math.pi / 2 + math.atan(gradient_y))
-            quantized_normal_x = int(((normal_x + 1.0) / 2.0) * 255.0)  # between -128 and 127
-            quantized_normal_y = int(((normal_y + 1.0) / 2.0) * 255.0)  # between -128 and 127
-
-            encoded_heightmap[yi, xi, 2] = quantized_normal_x
-            encoded_heightmap[yi, xi, 3] = quantized_normal_y
-            #encoded_heightmap[yi, xi, 3] = 255
-    '''
+    # Save heightmap as PNG (16 bit greyscale)
+    filename = pipeline.data['filenamebase'] + ".heightmap-" + str(heightmap_size) + ".png"
+    heightmap_save_png16(filename, height_matrix, heightmap_offset, heightmap_range)
+
+    # Multi-resolution pyramid (each level halves the previous one, with the same quantization)
+    pyramid_levels = int(pipeline.data.get('ddd:terrain:heightmap:pyramid', 0))
+    level_matrix = height_matrix
+    for level in range(pyramid_levels):
+        level_size = level_matrix.shape[0] // 2
+        if level_size < 2: break
+        level_matrix = heightmap_resample(level_matrix, level_size)
+        level_filename = pipeline.data['filenamebase'] + ".heightmap-" + str(level_size) + ".png"
+        logger.info("Saving heightmap pyramid level %d: %s", level + 1, level_filename)
+        heightmap_save_png16(level_filename, level_matrix, heightmap_offset, heightmap_range)
+
+    # Encoded heightmap with normals:
+    # R,G = height (16 bit, low byte first)
+    # B,A = normal x, y
+    if parse_bool(pipeline.data.get('ddd:terrain:heightmap:normals', False)):
+        cell_size = ((ddd_bounds[2] - ddd_bounds[0]) / (heightmap_size - 1),
+                     (ddd_bounds[3] - ddd_bounds[1]) / (heightmap_size - 1))
+        normal_matrix = heightmap_normals(height_matrix, cell_size)
+
+        quantized_height = heightmap_quantize(height_matrix, heightmap_offset, heightmap_range)
+        encoded_heightmap = np.zeros((heightmap_size, heightmap_size, 4), dtype=np.uint8)
+        encoded_heightmap[:, :, 0] = quantized_height & 0x00ff
+        encoded_heightmap[:, :, 1] = (quantized_height & 0xff00) >> 8
+        encoded_heightmap[:, :, 2] = np.uint8(((normal_matrix[:, :, 0] + 1.0) / 2.0) * 255.0)
+        encoded_heightmap[:, :, 3] = np.uint8(((normal_matrix[:, :, 1] + 1.0) / 2.0) * 255.0)
+
+        normals_filename = pipeline.data['filenamebase'] + ".heightmap-normals-" + str(heightmap_size) + ".png"
+        im = Image.fromarray(encoded_heightmap, "RGBA")
+        im.save(normals_filename, "PNG")
+
+    # Metadata (to be saved later to descriptor)
+    pipeline.data['height:min'] = height_min
+    pipeline.data['height:max'] = height_max
+    pipeline.data['heightmap:offset'] = heightmap_offset
+    pipeline.data['heightmap:range'] = heightmap_range
+    pipeline.data['heightmap:quantization'] = heightmap_quantization
 
-    # Save heightmap as PNG
 
-    filename = pipeline.data['filenamebase'] + ".heightmap-" + str(heightmap_size) + ".png"
+def heightmap_quantize(height_matrix, offset, height_range, quantization=65535):
+    if height_range <= 0: height_range = 1.0
+    return np.uint16(np.clip((height_matrix - offset) / height_range, 0.0, 1.0) * quantization)
 
-    #im = Image.fromarray(np.uint8(encoded_heightmap), "RGBA")
-    #im = Image.fromarray(np.uint16(encoded_heightmap), "I")
-    #im.save("/tmp/osm-heightmap.png", "PNG")
-    #im.save(filename, "PNG")
 
-    heightmap_uint16 = np.uint16(((height_matrix - heightmap_offset) / heightmap_range) * 65535)
+def heightmap_save_png16(filename, height_matrix, offset, height_range):
+    heightmap_uint16 = heightmap_quantize(height_matrix, offset, height_range)
     with open(filename, 'wb') as f:
-        writer = png.Writer(width=heightmap_size, height=heightmap_size, bitdepth=16, greyscale=True)
+        writer = png.Writer(width=height_matrix.shape[1], height=height_matrix.shape[0], bitdepth=16, greyscale=True)
         pngdata = (heightmap_uint16).tolist()
         writer.write(f, pngdata)
 
 
-    # Metadata (to be saved later to descriptor)
-    pipeline.data['height:min'] = height_min
-    pipeline.data['height:max'] = height_max
-    pipeline.data['heightmap:offset'] = heightmap_offset
-    pipeline.data['heightmap:range'] = heightmap_range
-    pipeline.data['heightmap:quantization'] = heightmap_quantization
+def heightmap_resample(height_matrix, size):
+    """
+    Resamples a heightmap to size x size using bilinear interpolation (corners are kept aligned).
+    """
+    rows = np.linspace(0, height_matrix.shape[0] - 1, size)
+    cols = np.linspace(0, height_matrix.shape[1] - 1, size)
+    r0 = np.minimum(np.floor(rows).astype(int), height_matrix.shape[0] - 2)
+    c0 = np.minimum(np.floor(cols).astype(int), height_matrix.shape[1] - 2)
+    fr = (rows - r0)[:, None]
+    fc = (cols - c0)[None, :]
+    m00 = height_matrix[r0][:, c0]
+    m01 = height_matrix[r0][:, c0 + 1]
+    m10 = height_matrix[r0 + 1][:, c0]
+    m11 = height_matrix[r0 + 1][:, c0 + 1]
+    return (m00 * (1 - fr) * (1 - fc) + m01 * (1 - fr) * fc +
+            m10 * fr * (1 - fc) + m11 * fr * fc)
+
+
+def heightmap_normals(height_matrix, cell_size):
+    """
+    Returns unit normals (rows x cols x 3) for a heightmap in image order (first row is north),
+    given the cell size in meters (x, y).
+    """
+    grad_y, grad_x = np.gradient(height_matrix, cell_size[1], cell_size[0])
+    grad_y = -grad_y  # DDD CRS is positive Y north/up, rows go south
+    normals = np.dstack([-grad_x, -grad_y, np.ones_like(height_matrix)])
+    normals /= np.linalg.norm(normals, axis=2)[:, :, None]
+    return normals
 
 
 def hillshade(height_matrix, azimuth=45, elevation_angle=45):
@@ -15,12 +15,10 @@ from ddd.pipeline.decorators import dddtask
 from ddd.geo.elevation import ElevationModel
 from PIL import Image
 import math
-from shapely.strtree import STRtree
 import hashlib
 import noise
-import random
 from ddd.util.common import parse_bool
-from scipy.ndimage.filters import gaussian_filter
+from scipy.ndimage import gaussian_filter, distance_transform_edt
 
 
 
@@ -183,7 +181,8 @@ def osm_terrain_export_splatmap(root, pipeline, osm, logger):
     wgs84_max = terrain.transform_ddd_to_geo(osm.ddd_proj, ddd_bounds[2:])
     wgs84_bounds = wgs84_min + wgs84_max
 
-    splatmap_size = pipeline.data.get('ddd:terrain:splatmap:size', 128)
+    splatmap_size = int(pipeline.data.get('ddd:terrain:splatmap:size', 128))
+    splatmap_supersample = int(pipeline.data.get('ddd:terrain:splatmap:supersample', 4))
     use_detailmap = pipeline.data.get('ddd:terrain:splatmap:detailmap', False)
 
     logger.info("Generating splatmap for area: ddd_bounds=%s, wgs84_bounds=%s, size=%s", ddd_bounds, wgs84_bounds, splatmap_size)
@@ -195,85 +194,79 @@ def osm_terrain_export_splatmap(root, pipeline, osm, logger):
     splat_matrix = np.zeros([splatmap_size, splatmap_size, pipeline.data['splatmap:channels_num']])
     id_matrix = np.zeros([splatmap_size, splatmap_size, pipeline.data['splatmap:channels_num']])
 
-    logger.info("Calculating splatmap coverage for %s channels (%d items)", len(channel_indexes),  len(splatmap.geom_recursive()))
+    logger.info("Calculating splatmap coverage for %s channels (%d items, supersample=%d)", len(channel_indexes),  len(splatmap.geom_recursive()), splatmap_supersample)
 
-    # Spatial index and cached groups
     channel_items_all = {chan_idx: splatmap.find("/Channel%s" % chan_idx) for chan_idx in channel_indexes}
-    channel_items_index = {chan_idx: STRtree(channel_items_all[chan_idx].geom_recursive()) for chan_idx in channel_indexes}
-    channel_items_all_union = {chan_idx: chan.union() for chan_idx, chan in channel_items_all.items()}
-    channel_items_sand_spread_union = splatmap.select('["ddd:material" = "Sand"]["osm:natural" = "beach"]').union()
+    channel_items_sand_spread = splatmap.select('["ddd:material" = "Sand"]["osm:natural" = "beach"]')
 
-    transformer = pyproj.Transformer.from_proj(osm.ddd_proj, 'epsg:3857', always_xy=True)
-
-    # Interpolate over DDD coordinates
+    # Pixels are centered on the area bounds (pixels in the border are half outside the area)
     pixel_width_x = (ddd_bounds[2] - ddd_bounds[0]) / splatmap_size
     pixel_width_y = (ddd_bounds[3] - ddd_bounds[1]) / splatmap_size
-    pixel_area = pixel_width_x * pixel_width_y
-    points_x = np.linspace(ddd_bounds[0] - pixel_width_x * 0.5, ddd_bounds[2] + pixel_width_x * 0.5, splatmap_size + 1, endpoint=True)
-    for xi, (x, xp) in enumerate(zip(points_x, points_x[1:])):
-        points_y = list(reversed(np.linspace(ddd_bounds[1] - pixel_width_y * 0.5, ddd_bounds[3] + pixel_width_y * 0.5, splatmap_size + 1, endpoint=True)))
-        for yi, (y, yp) in enumerate(zip(points_y, points_y[1:])):
-
-            x_utm, y_utm = transformer.transform(x, y)
-            x_utm, y_utm = (x_utm % 4096, y_utm % 4096)
-
-            pixel_rect = ddd.rect([x, y, xp, yp])
-
-            # Assign values to matrices
-            for chan_idx in channel_indexes:
-
-                channel_items = channel_items_all[chan_idx]
-
-                cand_geoms = channel_items_index[chan_idx].query(pixel_rect.geom)
-                cand_items = [c._ddd_obj for c in cand_geoms if c.intersects(pixel_rect.geom) and c._ddd_obj in channel_items.children]
-
-                # Check if intersects and percentage
-                pixel_item = ddd.group2(cand_items).intersection(pixel_rect).union()
-
-                item_area = pixel_item.area()
-
-                # Calculate cover factor (pixels in the border account for half/quarter the surface due to previous tile clipping (should be avoided)
-                cover_factor = item_area / pixel_area
-                if (xi in (0, splatmap_size - 1)):
-                    cover_factor *= 2
-                if (yi in (0, splatmap_size - 1)):
-                    cover_factor *= 2
-
-                # Augmentation tests: sand (12) - extend sand around
-                if chan_idx == 12 and not channel_items_sand_spread_union.is_empty():
-                    if cover_factor < 0.99:
-                        distance = channel_items_sand_spread_union.distance(ddd.point([x, y]))
-                        distance_reach = 8.0
-                        #extend_ratio *= noise.pnoise2(coords[0] * 0.1, coords[1] * 0.1, octaves=2, persistence=0.5, lacunarity=2, repeatx=1024, repeaty=1024, base=0)  # Randomize reach
-                        aug_factor = max(0, 1.0 - distance / distance_reach)
-                        noise_factor = noise.pnoise2(x_utm * 0.03, y_utm * 0.03, octaves=3, persistence=0.2, lacunarity=0.7, repeatx=4096, repeaty=4096, base=0)
-                        noise_factor = ddd.math.clamp((noise_factor - 0.5) * 2.0, 0.0, 1.0)  #  * (0.15 if chan_idx == 10 else 0.3)
-                        aug_factor = max(aug_factor * noise_factor, 0.0) * 0.75
-
-                        cover_factor = max(aug_factor, cover_factor)
-                        splat_matrix[yi, xi, :] -= cover_factor  # Reduce others
-
-
-                # Augmentation tests: park (10) - mixes ground and rock
-                if chan_idx == 10 or chan_idx == 11:
-                    if cover_factor > 0.95:
-                        reduce_factor = noise.pnoise2(x_utm * 0.03, y_utm * 0.03, octaves=3, persistence=2.2, lacunarity=0.7, repeatx=4096, repeaty=4096, base=0)
-                        reduce_factor = ddd.math.clamp((reduce_factor - 0.1) * 4.0, 0.0, 1.0) * 0.75  #  * (0.15 if chan_idx == 10 else 0.3)
-                        cover_factor = cover_factor - reduce_factor
-                        splat_matrix[yi, xi, 0] += (reduce_factor * random.uniform(0, 1)) # Increase terrain
-                        splat_matrix[yi, xi, 13] += (reduce_factor * random.uniform(0, 1))  # Increase rock
-
-                splat_matrix[yi, xi, chan_idx] += cover_factor
-
-                # Detail map (IDs)
-                if use_detailmap:
-                    for cand_item in cand_items:
-
-                        if not pixel_item.intersects(pixel_rect): continue
-
-                        detail_id = osm_terrain_splatmap_detail_id(pipeline, cand_item)
-                        id_matrix[yi, xi, chan_idx] = detail_id
-
+    raster_bounds = (ddd_bounds[0] - pixel_width_x * 0.5, ddd_bounds[1] - pixel_width_y * 0.5,
+                     ddd_bounds[2] + pixel_width_x * 0.5, ddd_bounds[3] + pixel_width_y * 0.5)
+    raster_shape = (splatmap_size, splatmap_size)
+
+    # Pixel corner coordinates (rows from north to south), used for noise
+    points_x = np.linspace(raster_bounds[0], raster_bounds[2], splatmap_size + 1, endpoint=True)[:-1]
+    points_y = np.linspace(raster_bounds[3], raster_bounds[1], splatmap_size + 1, endpoint=True)[:-1]
+    grid_x, grid_y = np.meshgrid(points_x, points_y)
+    transformer = pyproj.Transformer.from_proj(osm.ddd_proj, 'epsg:3857', always_xy=True)
+    grid_x_utm, grid_y_utm = transformer.transform(grid_x, grid_y)
+    grid_x_utm, grid_y_utm = (np.asarray(grid_x_utm) % 4096, np.asarray(grid_y_utm) % 4096)
+
+    def noise_grid(mask, persistence):
+        func = lambda x, y: noise.pnoise2(x * 0.03, y * 0.03, octaves=3, persistence=persistence, lacunarity=0.7, repeatx=4096, repeaty=4096, base=0)
+        return np.vectorize(func, otypes=[np.float64])(grid_x_utm[mask], grid_y_utm[mask])
+
+    # Cover factor: pixels in the border account for half/quarter the surface due to previous tile clipping (should be avoided)
+    border_factor = np.ones(raster_shape)
+    border_factor[:, (0, -1)] *= 2
+    border_factor[(0, -1), :] *= 2
+
+    # Sand spread: distance (in DDD units) from each pixel to beach sand
+    sand_distance = None
+    if channel_items_sand_spread.children:
+        sand_shape = (splatmap_size * splatmap_supersample, splatmap_size * splatmap_supersample)
+        sand_mask = ddd.raster.mask(channel_items_sand_spread, raster_bounds, sand_shape)
+        if sand_mask.any():
+            sand_distance = distance_transform_edt(~sand_mask, sampling=(pixel_width_y / splatmap_supersample, pixel_width_x / splatmap_supersample))
+            sand_distance = sand_distance.reshape(splatmap_size, splatmap_supersample, splatmap_size, splatmap_supersample).mean(axis=(1, 3))
+
+    for chan_idx in channel_indexes:
+
+        channel_items = channel_items_all[chan_idx]
+        if not channel_items.children:
+            continue
+
+        cover_factor = ddd.raster.coverage(channel_items, raster_bounds, raster_shape, splatmap_supersample) * border_factor
+
+        # Augmentation tests: sand (12) - extend sand around
+        if chan_idx == 12 and sand_distance is not None:
+            mask = cover_factor < 0.99
+            distance_reach = 8.0
+            aug_factor = np.maximum(0, 1.0 - sand_distance[mask] / distance_reach)
+            noise_factor = np.clip((noise_grid(mask, 0.2) - 0.5) * 2.0, 0.0, 1.0)
+            aug_factor = np.maximum(aug_factor * noise_factor, 0.0) * 0.75
+
+            cover_factor[mask] = np.maximum(aug_factor, cover_factor[mask])
+            splat_matrix[mask, :] -= cover_factor[mask][:, np.newaxis]  # Reduce others
+
+        # Augmentation tests: park (10) - mixes ground and rock
+        if chan_idx == 10 or chan_idx == 11:
+            mask = cover_factor > 0.95
+            reduce_factor = np.clip((noise_grid(mask, 2.2) - 0.1) * 4.0, 0.0, 1.0) * 0.75
+            cover_factor[mask] -= reduce_factor
+            splat_matrix[mask, 0] += reduce_factor * np.random.uniform(0, 1, len(reduce_factor))  # Increase terrain
+            splat_matrix[mask, 13] += reduce_factor * np.random.uniform(0, 1, len(reduce_factor))  # Increase rock
+
+        splat_matrix[:, :, chan_idx] += cover_factor
+
+        # Detail map (IDs)
+        if use_detailmap:
+            for item in channel_items.children:
+                item_coverage, window = ddd.raster.coverage_window(item, raster_bounds, raster_shape, splatmap_supersample)
+                if item_coverage is not None and (item_coverage > 0).any():
+                    id_matrix[window[0], window[1], chan_idx][item_coverage > 0] = osm_terrain_splatmap_detail_id(pipeline, item)
 
     # Clamp to 0..1
     splat_matrix = np.maximum(splat_matrix, 0.0)